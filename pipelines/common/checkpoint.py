@@ -0,0 +1,186 @@
+import json
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Any, Iterable, Iterator, Optional
+
+from pipelines.common.compression import DEFAULT_ZSTD_THREADS, block_compressor, compression_for
+
+
+class JsonlCheckpoint:
+    """Crash-safe, resumable JSONL output for generation pipelines.
+
+    Output rows are appended to the JSONL file and every write is followed by one line in a sidecar
+    manifest (``<output>.progress``) holding the input row indices that were completed and the output
+    file size right after their rows were written. On restart the output is truncated back to the last
+    recorded size, which drops any half-written tail, and the recorded indices are skipped. A non-empty output
+    without a manifest (e.g. written before checkpointing existed) is refused rather than overwritten unless
+    ``resume=False``.
+
+    With ``background=True`` rows are handed to a writer thread through a bounded queue, so JSON encoding
+    and disk I/O overlap with the next generation call. ``fsync_interval`` (seconds) forces data to disk
+    periodically; ``fsync=True`` does so after every write.
+
+    Outputs ending in ``.gz`` or ``.zst`` are compressed: every write appends one self-contained gzip
+    member or zstd frame, so the recorded sizes stay valid truncation points and the file is always a
+    readable compressed stream. ``compression_level`` and ``compression_threads`` (zstd only) tune it.
+    """
+
+    def __init__(
+        self,
+        output_path: str | Path,
+        resume: bool = True,
+        fsync: bool = False,
+        fsync_interval: float | None = None,
+        background: bool = False,
+        max_queue_size: int = 8,
+        compression_level: Optional[int] = None,
+        compression_threads: int = DEFAULT_ZSTD_THREADS,
+    ) -> None:
+        self.output_path = Path(output_path)
+        self._compress = block_compressor(compression_for(self.output_path), compression_level, compression_threads)
+        self.manifest_path = self.output_path.with_name(self.output_path.name + ".progress")
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.done: set[int] = set()
+        self._last_fsync = time.monotonic()
+
+        self.output_path.parent.mkdir(parents=True, exist_ok=True)
+        committed_size, manifest_size = 0, 0
+        if resume and self.manifest_path.exists():
+            committed_size, manifest_size = self._load_manifest()
+        elif resume and self.output_path.exists() and self.output_path.stat().st_size > 0:
+            # without a manifest there is no way to tell which inputs the existing rows belong to
+            raise FileExistsError(
+                f"{self.output_path} already has data but no {self.manifest_path.name} manifest to resume from; "
+                "move it away or pass --no-resume to overwrite it"
+            )
+
+        self._output_fd = os.open(self.output_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._manifest_fd = os.open(self.manifest_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        # drop rows written after the last manifest entry and any torn manifest line
+        os.ftruncate(self._output_fd, committed_size)
+        os.ftruncate(self._manifest_fd, manifest_size)
+
+        self._queue: queue.Queue[tuple[list[dict[str, Any]], list[int]] | None] | None = None
+        self._writer: threading.Thread | None = None
+        self._writer_error: BaseException | None = None
+        if background:
+            self._queue = queue.Queue(maxsize=max_queue_size)
+            self._writer = threading.Thread(target=self._write_loop, name="jsonl-checkpoint-writer", daemon=True)
+            self._writer.start()
+
+    def _load_manifest(self) -> tuple[int, int]:
+        """Read committed entries and return (output size, manifest size) to resume from"""
+        output_size = self.output_path.stat().st_size if self.output_path.exists() else 0
+        committed_size, manifest_size = 0, 0
+
+        with self.manifest_path.open("rb") as fin:
+            for line in fin:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                # rows that never reached the output file (e.g. lost page cache) must be regenerated
+                if entry["end"] > output_size:
+                    break
+                self.done.update(entry["ids"])
+                committed_size = entry["end"]
+                manifest_size += len(line)
+
+        return committed_size, manifest_size
+
+    @staticmethod
+    def _write_all(fd: int, data: bytes) -> None:
+        view = memoryview(data)
+        while view:
+            written = os.write(fd, view)
+            view = view[written:]
+
+    def is_done(self, index: int) -> bool:
+        return index in self.done
+
+    def pending(self, items: Iterable[dict[str, Any]], start: int = 0) -> Iterator[tuple[int, dict[str, Any]]]:
+        """Yield (input index, item) for items not completed in a previous run"""
+        for index, item in enumerate(items, start=start):
+            if index not in self.done:
+                yield index, item
+
+    def write(self, rows: Iterable[dict[str, Any]], ids: Iterable[int]) -> None:
+        """Append output rows and mark the given input indices as completed
+
+        In background mode this only enqueues the rows; it blocks when the queue is full.
+        """
+        rows, ids = list(rows), list(ids)
+        self.done.update(ids)
+        if self._queue is None:
+            self._commit(rows, ids)
+            return
+
+        self._raise_writer_error()
+        self._queue.put((rows, ids))
+
+    def _commit(self, rows: list[dict[str, Any]], ids: list[int]) -> None:
+        data = "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows).encode("utf-8")
+        if data:
+            data = self._compress(data)
+        sync = self.fsync or (
+            self.fsync_interval is not None and time.monotonic() - self._last_fsync >= self.fsync_interval
+        )
+
+        if data:
+            self._write_all(self._output_fd, data)
+        if sync:
+            # the manifest must never point past data that is durable
+            os.fsync(self._output_fd)
+
+        end = os.fstat(self._output_fd).st_size
+        self._write_all(self._manifest_fd, (json.dumps({"ids": ids, "end": end}) + "\n").encode("utf-8"))
+        if sync:
+            os.fsync(self._manifest_fd)
+            self._last_fsync = time.monotonic()
+
+    def _write_loop(self) -> None:
+        assert self._queue is not None
+        while True:
+            entry = self._queue.get()
+            try:
+                if entry is None:
+                    return
+                if self._writer_error is None:
+                    self._commit(*entry)
+            except BaseException as e:
+                self._writer_error = e
+            finally:
+                self._queue.task_done()
+
+    def _raise_writer_error(self) -> None:
+        if self._writer_error is not None:
+            raise RuntimeError(f"Background writer for {self.output_path} failed") from self._writer_error
+
+    def flush(self) -> None:
+        """Block until every queued row has been written"""
+        if self._queue is not None:
+            self._queue.join()
+            self._raise_writer_error()
+
+    def close(self) -> None:
+        try:
+            if self._queue is not None and self._writer is not None:
+                self._queue.put(None)
+                self._writer.join()
+                self._queue = None
+                self._raise_writer_error()
+        finally:
+            os.close(self._output_fd)
+            os.close(self._manifest_fd)
+
+    def __enter__(self) -> "JsonlCheckpoint":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
@@ -0,0 +1,125 @@
+"""Transparent gzip/zstd compression for JSONL files, chosen by file extension.
+
+`.gz` uses the standard library; `.zst`/`.zstd` needs the optional `zstandard` package and compresses with
+`threads` worker threads (-1: one per logical CPU). Both formats allow several independently compressed
+members/frames to be concatenated into one valid file, which is what makes appends, crash-safe truncation
+to a block boundary and shard concatenation work on compressed outputs exactly as on plain ones.
+"""
+
+import gzip
+import io
+from pathlib import Path
+from typing import IO, Any, Callable, Optional
+
+GZIP = "gzip"
+ZSTD = "zstd"
+_SUFFIXES = {".gz": GZIP, ".zst": ZSTD, ".zstd": ZSTD}
+
+DEFAULT_LEVELS = {GZIP: 6, ZSTD: 3}
+DEFAULT_ZSTD_THREADS = -1
+
+
+def compression_for(path: str | Path) -> Optional[str]:
+    """Return GZIP, ZSTD or None for an uncompressed path"""
+    return _SUFFIXES.get(Path(path).suffix.lower())
+
+
+def ensure_available(compression: Optional[str]) -> None:
+    """Raise ImportError now, before any output is created, if `compression` needs a missing package"""
+    if compression == ZSTD:
+        _zstandard()
+
+
+def split_compression_suffix(path: str | Path) -> tuple[Path, str]:
+    """Split "data.jsonl.zst" into (Path("data.jsonl"), ".zst"); the suffix is "" for plain files"""
+    path = Path(path)
+    if compression_for(path) is None:
+        return path, ""
+    return path.with_suffix(""), path.suffix
+
+
+def _zstandard() -> Any:
+    try:
+        import zstandard
+    except ImportError as e:
+        raise ImportError("Reading or writing .zst files requires the zstandard package: pip install zstandard") from e
+    return zstandard
+
+
+def wrap_writer(
+    raw: IO[bytes],
+    compression: Optional[str],
+    level: Optional[int] = None,
+    threads: int = DEFAULT_ZSTD_THREADS,
+) -> IO[bytes]:
+    """Compress everything written to the returned file object into `raw`; closing it closes `raw`"""
+    if compression is None:
+        return raw
+    level = DEFAULT_LEVELS[compression] if level is None else level
+    if compression == GZIP:
+        return _ClosingGzipFile(raw, level)
+    return _zstandard().ZstdCompressor(level=level, threads=threads).stream_writer(raw, closefd=True)
+
+
+def open_compressed(
+    path: str | Path,
+    mode: str = "rt",
+    level: Optional[int] = None,
+    threads: int = DEFAULT_ZSTD_THREADS,
+) -> IO[Any]:
+    """open() that compresses or decompresses according to the file extension.
+
+    `mode` is one of r/w/a plus t (default) or b. Text mode always uses UTF-8. Appending adds a new
+    gzip member or zstd frame after the existing data.
+    """
+    compression = compression_for(path)
+    binary = "b" in mode
+    base_mode = mode.replace("t", "").replace("b", "")
+    if base_mode not in ("r", "w", "a"):
+        raise ValueError(f"Unsupported mode: {mode}")
+    if compression is None:
+        return open(path, mode) if binary else open(path, mode, encoding="utf-8")
+
+    raw = open(path, base_mode + "b")
+    stream: IO[bytes]
+    if base_mode == "r":
+        if compression == GZIP:
+            stream = _ClosingGzipFile(raw)
+        else:
+            reader = _zstandard().ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=True)
+            stream = io.BufferedReader(reader, buffer_size=1 << 20)
+    else:
+        stream = wrap_writer(raw, compression, level, threads)
+    return stream if binary else io.TextIOWrapper(stream, encoding="utf-8")
+
+
+def block_compressor(
+    compression: Optional[str],
+    level: Optional[int] = None,
+    threads: int = DEFAULT_ZSTD_THREADS,
+) -> Callable[[bytes], bytes]:
+    """Return a function compressing one block into a self-contained gzip member or zstd frame.
+
+    The function is not thread-safe; use one per writer.
+    """
+    if compression is None:
+        return bytes
+    level = DEFAULT_LEVELS[compression] if level is None else level
+    if compression == GZIP:
+        return lambda data: gzip.compress(data, compresslevel=level, mtime=0)
+    return _zstandard().ZstdCompressor(level=level, threads=threads, write_content_size=True).compress
+
+
+class _ClosingGzipFile(gzip.GzipFile):
+    """GzipFile that also closes the file object it wraps"""
+
+    def __init__(self, raw: IO[bytes], level: int = 9) -> None:
+        mode = "rb" if raw.readable() and not raw.writable() else "wb"
+        super().__init__(fileobj=raw, mode=mode, compresslevel=level, mtime=0)
+        self._raw = raw
+
+    def close(self) -> None:
+        try:
+            super().close()
+        finally:
+            self._raw.close()
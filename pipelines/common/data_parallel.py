@@ -0,0 +1,145 @@
+import os
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Iterator
+
+from pipelines.common.compression import compression_for, split_compression_suffix
+from pipelines.common.jsonl import (
+    byte_range_shards,
+    count_lines,
+    iter_jsonl,
+    iter_jsonl_lines,
+    iter_jsonl_range,
+    line_range_shards,
+)
+
+# Set by launch_data_parallel in each replica process
+RANK_ENV = "SWALLOW_DP_RANK"
+SIZE_ENV = "SWALLOW_DP_SIZE"
+
+
+def get_replica() -> tuple[int, int] | None:
+    """Return (rank, data parallel size) when running as a replica started by launch_data_parallel"""
+    if RANK_ENV not in os.environ:
+        return None
+    return int(os.environ[RANK_ENV]), int(os.environ[SIZE_ENV])
+
+
+def shard_path(path: str | Path, rank: int, size: int) -> Path:
+    base, compression_suffix = split_compression_suffix(path)
+    return base.with_name(f"{base.stem}.dp{rank:02d}-of-{size:02d}{base.suffix}{compression_suffix}")
+
+
+def replica_output_path(path: str | Path) -> Path:
+    """Per-replica output shard in a data-parallel run, `path` itself otherwise"""
+    replica = get_replica()
+    return Path(path) if replica is None else shard_path(path, *replica)
+
+
+def iter_replica_jsonl(path: str | Path) -> Iterator[dict[str, Any]]:
+    """Yield this replica's contiguous shard of the input, or the whole input outside a DP run
+
+    Plain files are split by line-aligned byte ranges; compressed files by line numbers, which costs every
+    replica one extra decompression pass to count lines.
+    """
+    replica = get_replica()
+    if replica is None:
+        return iter_jsonl(path)
+    rank, size = replica
+    if compression_for(path) is not None:
+        start, stop = line_range_shards(path, size)[rank]
+        return iter_jsonl_lines(path, start, stop)
+    start, end = byte_range_shards(path, size)[rank]
+    return iter_jsonl_range(path, start, end)
+
+
+def _device_groups(data_parallel_size: int, tensor_parallel_size: int) -> list[str]:
+    visible = os.environ.get("CUDA_VISIBLE_DEVICES")
+    if visible:
+        devices = [device.strip() for device in visible.split(",") if device.strip()]
+    else:
+        import torch
+
+        devices = [str(i) for i in range(torch.cuda.device_count())]
+
+    required = data_parallel_size * tensor_parallel_size
+    if len(devices) < required:
+        raise ValueError(
+            f"data_parallel_size * tensor_parallel_size = {required} GPUs required, but only {len(devices)} visible"
+        )
+    return [
+        ",".join(devices[rank * tensor_parallel_size : (rank + 1) * tensor_parallel_size])
+        for rank in range(data_parallel_size)
+    ]
+
+
+def _count_lines(path: Path) -> int:
+    return count_lines(path) if path.exists() else 0
+
+
+def _merge_shards(path: Path, data_parallel_size: int) -> None:
+    # concatenated gzip members / zstd frames form a valid compressed file, so shards are copied as bytes
+    shards = [shard_path(path, rank, data_parallel_size) for rank in range(data_parallel_size)]
+    if not any(shard.exists() for shard in shards):
+        return
+    with path.open("wb") as fout:
+        for shard in shards:
+            if shard.exists():
+                with shard.open("rb") as fin:
+                    shutil.copyfileobj(fin, fout, 1 << 24)
+    for shard in shards:
+        shard.unlink(missing_ok=True)
+        shard.with_name(shard.name + ".progress").unlink(missing_ok=True)
+
+
+def launch_data_parallel(
+    data_parallel_size: int,
+    tensor_parallel_size: int,
+    merge_paths: list[Path],
+    argv: list[str] | None = None,
+) -> None:
+    """Run the current entry point as `data_parallel_size` engine replicas and merge their outputs in order.
+
+    Each replica is the same command re-executed with its own CUDA_VISIBLE_DEVICES slice of
+    `tensor_parallel_size` GPUs. It reads one contiguous byte range of the input (iter_replica_jsonl) and
+    writes to per-replica shards of every output (replica_output_path). Once all replicas succeed, the shards
+    of each path in `merge_paths` are concatenated in rank order, which preserves input order for batch
+    mode. If a replica fails the shards and their progress files are kept, so re-running the same command
+    resumes every replica where it stopped.
+    """
+    argv = argv if argv is not None else [sys.executable, *sys.argv]
+    device_groups = _device_groups(data_parallel_size, tensor_parallel_size)
+
+    start_time = time.time()
+    processes: list[subprocess.Popen] = []
+    for rank, devices in enumerate(device_groups):
+        env = {**os.environ, RANK_ENV: str(rank), SIZE_ENV: str(data_parallel_size), "CUDA_VISIBLE_DEVICES": devices}
+        print(f"Starting replica {rank}/{data_parallel_size} on GPUs {devices}", flush=True)
+        processes.append(subprocess.Popen(argv, env=env))
+
+    elapsed: dict[int, float] = {}
+    while len(elapsed) < len(processes):
+        for rank, process in enumerate(processes):
+            if rank not in elapsed and process.poll() is not None:
+                elapsed[rank] = time.time() - start_time
+        time.sleep(1.0)
+
+    print("Data parallel replica throughput:")
+    for rank in range(data_parallel_size):
+        rows = _count_lines(shard_path(merge_paths[0], rank, data_parallel_size))
+        status = "ok" if processes[rank].returncode == 0 else f"failed ({processes[rank].returncode})"
+        print(
+            f"  replica {rank}: {rows} rows in {elapsed[rank]:.1f}s "
+            f"({rows / max(elapsed[rank], 1e-9):.2f} rows/s) [{status}]"
+        )
+
+    failed = [rank for rank, process in enumerate(processes) if process.returncode != 0]
+    if failed:
+        raise RuntimeError(f"Data parallel replicas {failed} failed; shards are kept so the run can be resumed")
+
+    for path in merge_paths:
+        _merge_shards(path, data_parallel_size)
+    print(f"Merged {data_parallel_size} replicas in {time.time() - start_time:.1f}s total")
@@ -0,0 +1,506 @@
+"""Streaming exact and near-duplicate removal for JSONL files.
+
+Rows are read once and written as they are decided, keeping the first occurrence of every key. Keys are never
+kept as strings: exact mode stores a 64- or 128-bit blake2b digest per key, and MinHash mode stores one
+64-bit hash per LSH band. Digests live in a `HashIndex`, a set of sorted NumPy runs that is spilled to
+memory-mapped files on disk once it outgrows `max_memory_mb`, so memory stays bounded for any number of rows.
+JSON parsing and hashing run in `num_workers` processes; membership checks happen in input order in the
+parent, so the output is identical for any worker count.
+
+MinHash mode hashes character shingles of the normalized key text, and drops a row when any band of its
+signature matches a band of a previously kept row. With `bands` bands of `num_perm / bands` rows, rows whose
+shingle sets have a Jaccard similarity around (1 / bands) ** (bands / num_perm) are dropped with probability
+~0.5 (about 0.7 for the defaults), rising steeply above it.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from collections import Counter, deque
+from itertools import islice
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Any, Optional
+
+import numpy as np
+from tqdm import tqdm
+
+from pipelines.common.compression import compression_for, open_compressed
+from pipelines.common.jsonl import batched
+
+# per-row status returned by the hashing workers
+_OK, _INVALID_JSON, _MISSING_KEY = 0, 1, 2
+
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+_SHINGLE_BASE = np.uint64(0x100000001B3)
+_MAX_SHINGLE_CHUNK = 8192
+_MAX_DISK_RUNS = 8
+_MERGE_CHUNK = 1 << 20
+
+
+def parse_key_path(key: str) -> list[str | int]:
+    """Parse a dotted key path such as "conversation.0.content" (integers index into lists)"""
+    return [int(part) if part.lstrip("-").isdigit() else part for part in key.split(".")]
+
+
+def key_text(record: Any, key_path: list[str | int], drop_empty: bool = False) -> Optional[str]:
+    """Return the text to deduplicate on, or None if the key is missing (or, with drop_empty=True, empty or
+    null). By default an empty string or a null is a key like any other.
+
+    Lists are joined line by line and message dicts contribute "role: content" (or their "content" when
+    they have no role), so a path such as "conversation" dedups whole conversations; other values are
+    compared by their canonical JSON.
+    """
+    value = record
+    for part in key_path:
+        try:
+            value = value[part]
+        except (KeyError, IndexError, TypeError):
+            return None
+    if drop_empty and not value:
+        return None
+    return _value_text(value)
+
+
+def _value_text(value: Any) -> str:
+    if isinstance(value, str):
+        return value
+    if isinstance(value, list):
+        return "\n".join(_value_text(item) for item in value)
+    if isinstance(value, dict) and "content" in value:
+        content = _value_text(value["content"])
+        return f"{_value_text(value['role'])}: {content}" if "role" in value else content
+    return json.dumps(value, ensure_ascii=False, sort_keys=True)
+
+
+def exact_hashes(texts: list[str], bits: int = 64) -> tuple[np.ndarray, Optional[np.ndarray]]:
+    """blake2b digests of `texts` as (high, low) uint64 words; low is None for 64-bit digests"""
+    digest_size = bits // 8
+    digests = b"".join(
+        hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=digest_size).digest() for text in texts
+    )
+    words = np.frombuffer(digests, dtype="<u8").reshape(len(texts), bits // 64)
+    return words[:, 0].copy(), (words[:, 1].copy() if bits == 128 else None)
+
+
+def _shingle_hashes(text: str, shingle_size: int) -> np.ndarray:
+    codes = np.frombuffer(text.encode("utf-32-le", "surrogatepass"), dtype=np.uint32).astype(np.uint64)
+    size = min(shingle_size, len(codes))
+    count = len(codes) - size + 1
+    hashes = np.zeros(count, dtype=np.uint64)
+    for offset in range(size):
+        hashes = hashes * _SHINGLE_BASE + codes[offset : offset + count]
+    hashes *= _MIX
+    hashes ^= hashes >> np.uint64(29)
+    return np.unique(hashes)
+
+
+class MinHasher:
+    """MinHash signatures over character shingles, reduced to one 64-bit hash per LSH band"""
+
+    def __init__(self, num_perm: int = 128, bands: int = 16, shingle_size: int = 5, seed: int = 1) -> None:
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        # multiply-shift hashing: the top 32 bits of a * x + b, with odd a
+        self._a = (rng.integers(0, 1 << 63, num_perm, dtype=np.uint64) << np.uint64(1)) | np.uint64(1)
+        self._b = rng.integers(0, 1 << 63, num_perm, dtype=np.uint64)
+        self._band_weights = (rng.integers(0, 1 << 63, num_perm // bands, dtype=np.uint64) << np.uint64(1)) | 1
+        self._band_salts = rng.integers(0, 1 << 63, bands, dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        normalized = " ".join(text.lower().split())
+        shingles = _shingle_hashes(normalized, self.shingle_size)
+        signature = np.full(self.num_perm, np.iinfo(np.uint64).max, dtype=np.uint64)
+        for start in range(0, len(shingles), _MAX_SHINGLE_CHUNK):
+            chunk = shingles[start : start + _MAX_SHINGLE_CHUNK]
+            permuted = (self._a[:, None] * chunk[None, :] + self._b[:, None]) >> np.uint64(32)
+            np.minimum(signature, permuted.min(axis=1), out=signature)
+        return signature
+
+    def band_hashes(self, texts: list[str]) -> np.ndarray:
+        """Return an (n, bands) uint64 matrix; equal values in the same column mean equal bands"""
+        if not texts:
+            return np.zeros((0, self.bands), dtype=np.uint64)
+        signatures = np.stack([self.signature(text) for text in texts])
+        rows = signatures.reshape(len(texts), self.bands, self.num_perm // self.bands)
+        hashes = (rows * self._band_weights).sum(axis=2, dtype=np.uint64) + self._band_salts
+        hashes *= _MIX
+        return hashes ^ (hashes >> np.uint64(31))
+
+
+class HashIndex:
+    """Set of 64- or 128-bit hashes kept as sorted runs, spilled to disk beyond `max_memory_mb`.
+
+    New hashes form a sorted run; runs of similar size are merged, so lookups search O(log n) in-memory
+    runs. When the in-memory runs outgrow the budget they are merged into one run that is written to
+    `spill_dir` and memory-mapped; once there are more than 8 spilled runs they are merged, chunk by chunk,
+    into a single one. 128-bit hashes are sorted by their high word, with the low word compared only for the
+    (rare) entries that share it.
+    """
+
+    def __init__(self, bits: int = 64, max_memory_mb: int = 4096, spill_dir: Optional[str | Path] = None) -> None:
+        if bits not in (64, 128):
+            raise ValueError(f"bits must be 64 or 128, got {bits}")
+        self.bits = bits
+        self.max_memory_bytes = max_memory_mb << 20
+        self._spill_root = spill_dir
+        self._spill_dir: Optional[Path] = None
+        self._memory_runs: list[tuple[np.ndarray, Optional[np.ndarray]]] = []
+        self._disk_runs: list[tuple[np.ndarray, Optional[np.ndarray]]] = []
+        self._disk_paths: list[list[Path]] = []
+        self._num_run_files = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def num_spilled_runs(self) -> int:
+        return len(self._disk_runs)
+
+    def contains(self, high: np.ndarray, low: Optional[np.ndarray] = None) -> np.ndarray:
+        """Return a boolean mask of the hashes already in the index"""
+        found = np.zeros(len(high), dtype=bool)
+        if not len(high):
+            return found
+        # sorted queries touch each memory-mapped run in ascending page order
+        order = np.argsort(high, kind="stable")
+        high_sorted = high[order]
+        low_sorted = None if low is None else low[order]
+        for run in self._disk_runs + self._memory_runs:
+            found[order] |= self._run_contains(run, high_sorted, low_sorted)
+        return found
+
+    @staticmethod
+    def _run_contains(
+        run: tuple[np.ndarray, Optional[np.ndarray]], high: np.ndarray, low: Optional[np.ndarray]
+    ) -> np.ndarray:
+        run_high, run_low = run
+        left = np.searchsorted(run_high, high, side="left")
+        if run_low is None or low is None:
+            index = np.minimum(left, len(run_high) - 1)
+            return (left < len(run_high)) & (run_high[index] == high)
+
+        right = np.searchsorted(run_high, high, side="right")
+        count = right - left
+        index = np.minimum(left, len(run_high) - 1)
+        found = (count == 1) & (run_low[index] == low)
+        for i in np.flatnonzero(count > 1):
+            found[i] = bool((run_low[left[i] : right[i]] == low[i]).any())
+        return found
+
+    def add(self, high: np.ndarray, low: Optional[np.ndarray] = None) -> None:
+        """Add hashes that are known to be absent from the index and distinct from each other"""
+        if not len(high):
+            return
+        if (low is None) != (self.bits == 64):
+            raise ValueError(f"{self.bits}-bit index got {'no ' if low is None else ''}low words")
+        order = np.argsort(high, kind="stable")
+        self._memory_runs.append((high[order], None if low is None else low[order]))
+        self._size += len(high)
+        while len(self._memory_runs) >= 2 and len(self._memory_runs[-1][0]) >= len(self._memory_runs[-2][0]):
+            newer = self._memory_runs.pop()
+            older = self._memory_runs.pop()
+            self._memory_runs.append(self._merge([older, newer]))
+        if sum(run[0].nbytes + (0 if run[1] is None else run[1].nbytes) for run in self._memory_runs) > (
+            self.max_memory_bytes
+        ):
+            self._spill()
+
+    @staticmethod
+    def _merge(runs: list[tuple[np.ndarray, Optional[np.ndarray]]]) -> tuple[np.ndarray, Optional[np.ndarray]]:
+        high = np.concatenate([run[0] for run in runs])
+        # the input consists of sorted runs, which a stable (timsort) argsort merges in linear time
+        order = np.argsort(high, kind="stable")
+        low = None if runs[0][1] is None else np.concatenate([run[1] for run in runs])[order]
+        return high[order], low
+
+    def _new_run_file(self, word: str, length: int) -> tuple[Path, np.ndarray]:
+        if self._spill_dir is None:
+            self._spill_dir = Path(tempfile.mkdtemp(prefix="dedup-", dir=self._spill_root))
+        path = self._spill_dir / f"run{self._num_run_files:05d}.{word}.npy"
+        return path, np.lib.format.open_memmap(path, mode="w+", dtype=np.uint64, shape=(length,))
+
+    def _spill(self) -> None:
+        high, low = self._merge(self._memory_runs)
+        self._memory_runs = []
+        run: list[np.ndarray] = []
+        paths: list[Path] = []
+        for word, values in (("high", high), ("low", low)):
+            if values is None:
+                continue
+            path, array = self._new_run_file(word, len(values))
+            array[:] = values
+            array.flush()
+            run.append(np.load(path, mmap_mode="r"))
+            paths.append(path)
+        self._num_run_files += 1
+        self._disk_runs.append((run[0], run[1] if len(run) > 1 else None))
+        self._disk_paths.append(paths)
+        if len(self._disk_runs) > _MAX_DISK_RUNS:
+            self._merge_disk_runs()
+
+    def _merge_disk_runs(self) -> None:
+        """Merge all spilled runs into one, holding at most _MERGE_CHUNK entries per run in memory"""
+        runs = self._disk_runs
+        total = sum(len(run[0]) for run in runs)
+        high_path, out_high = self._new_run_file("high", total)
+        low_path, out_low = self._new_run_file("low", total) if runs[0][1] is not None else (None, None)
+        self._num_run_files += 1
+
+        positions = [0] * len(runs)
+        written = 0
+        while written < total:
+            # everything up to the smallest chunk end of any run can be merged without looking further
+            bound = min(
+                run[0][min(position + _MERGE_CHUNK, len(run[0])) - 1]
+                for run, position in zip(runs, positions)
+                if position < len(run[0])
+            )
+            pieces = []
+            for i, (run, position) in enumerate(zip(runs, positions)):
+                end = position + int(np.searchsorted(run[0][position:], bound, side="right"))
+                if end > position:
+                    pieces.append((np.asarray(run[0][position:end]), None if run[1] is None else run[1][position:end]))
+                positions[i] = end
+            high, low = self._merge(pieces)
+            out_high[written : written + len(high)] = high
+            if out_low is not None:
+                out_low[written : written + len(high)] = low
+            written += len(high)
+
+        out_high.flush()
+        if out_low is not None:
+            out_low.flush()
+        del out_high, out_low
+        old_paths = [path for paths in self._disk_paths for path in paths]
+        merged_low = None if low_path is None else np.load(low_path, mmap_mode="r")
+        self._disk_runs = [(np.load(high_path, mmap_mode="r"), merged_low)]
+        self._disk_paths = [[high_path] if low_path is None else [high_path, low_path]]
+        for path in old_paths:
+            path.unlink()
+
+    def close(self) -> None:
+        self._memory_runs = []
+        self._disk_runs = []
+        self._disk_paths = []
+        if self._spill_dir is not None:
+            shutil.rmtree(self._spill_dir, ignore_errors=True)
+            self._spill_dir = None
+
+    def __enter__(self) -> "HashIndex":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+
+def _first_occurrences(high: np.ndarray, low: Optional[np.ndarray]) -> np.ndarray:
+    """Mask of the rows whose hash does not occur at an earlier row"""
+    if low is None:
+        order = np.argsort(high, kind="stable")
+        same = high[order][1:] == high[order][:-1]
+    else:
+        order = np.lexsort((np.arange(len(high)), low, high))
+        same = (high[order][1:] == high[order][:-1]) & (low[order][1:] == low[order][:-1])
+    first = np.ones(len(high), dtype=bool)
+    first[order[1:][same]] = False
+    return first
+
+
+_worker_config: dict[str, Any] = {}
+
+
+def _init_worker(config: dict[str, Any]) -> None:
+    _worker_config.clear()
+    _worker_config.update(config)
+    if config["mode"] == "minhash":
+        _worker_config["minhasher"] = MinHasher(**config["minhash"])
+
+
+def _hash_lines(lines: list[bytes]) -> tuple[np.ndarray, Any]:
+    """Parse a batch of lines and return (status per line, hashes of the lines with status _OK)"""
+    status = np.full(len(lines), _OK, dtype=np.int8)
+    texts: list[str] = []
+    for i, line in enumerate(lines):
+        try:
+            text = key_text(json.loads(line), _worker_config["key_path"], _worker_config["drop_empty_keys"])
+        except json.JSONDecodeError:
+            status[i] = _INVALID_JSON
+            continue
+        if text is None:
+            status[i] = _MISSING_KEY
+            continue
+        texts.append(text)
+    if _worker_config["mode"] == "minhash":
+        return status, _worker_config["minhasher"].band_hashes(texts)
+    return status, exact_hashes(texts, _worker_config["bits"])
+
+
+def _keep_exact(index: HashIndex, hashes: tuple[np.ndarray, Optional[np.ndarray]]) -> np.ndarray:
+    high, low = hashes
+    keep = _first_occurrences(high, low) & ~index.contains(high, low)
+    index.add(high[keep], None if low is None else low[keep])
+    return keep
+
+
+def _keep_minhash(index: HashIndex, band_hashes: np.ndarray) -> np.ndarray:
+    num_rows, bands = band_hashes.shape
+    flat = band_hashes.reshape(-1)
+    keep = ~index.contains(flat).reshape(num_rows, bands).any(axis=1)
+
+    # a band shared with an earlier row of the same batch only counts if that row is kept, so rows with
+    # in-batch collisions are resolved in order; all other rows are independent
+    first = _first_occurrences(flat, None).reshape(num_rows, bands)
+    colliding = np.zeros(num_rows, dtype=bool)
+    repeated = np.isin(flat, flat[~first.reshape(-1)]).reshape(num_rows, bands)
+    colliding[repeated.any(axis=1)] = True
+    kept_bands: set[int] = set()
+    for row in np.flatnonzero(colliding & keep):
+        row_bands = band_hashes[row].tolist()
+        if kept_bands.intersection(row_bands):
+            keep[row] = False
+        else:
+            kept_bands.update(row_bands)
+
+    index.add(np.unique(band_hashes[keep].reshape(-1)))
+    return keep
+
+
+def deduplicate_jsonl(
+    input_path: str | Path,
+    output_path: str | Path,
+    key: str,
+    mode: str = "exact",
+    bits: int = 64,
+    num_perm: int = 128,
+    bands: int = 16,
+    shingle_size: int = 5,
+    seed: int = 1,
+    batch_size: int = 16384,
+    num_workers: int = 1,
+    max_memory_mb: int = 4096,
+    spill_dir: Optional[str | Path] = None,
+    drop_empty_keys: bool = False,
+) -> Counter[str]:
+    """Write the first occurrence of every key (exact) or near-duplicate cluster (minhash) to `output_path`.
+
+    Rows with invalid JSON or a missing key (with drop_empty_keys=True, also an empty or null one) are dropped
+    and counted. Input lines are written back unchanged. Returns counters of input, kept, duplicate, invalid_json and missing_key rows.
+    """
+    if mode not in ("exact", "minhash"):
+        raise ValueError(f"Unknown mode: {mode}")
+    config: dict[str, Any] = {
+        "mode": mode,
+        "key_path": parse_key_path(key),
+        "bits": bits,
+        "drop_empty_keys": drop_empty_keys,
+        "minhash": {"num_perm": num_perm, "bands": bands, "shingle_size": shingle_size, "seed": seed},
+    }
+    if mode == "minhash":
+        MinHasher(**config["minhash"])  # fail fast on an invalid configuration
+
+    counters: Counter[str] = Counter()
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    input_size = os.path.getsize(input_path) if compression_for(input_path) is None else None
+    with (
+        open_compressed(input_path, "rb") as fin,
+        open_compressed(output_path, "wb") as fout,
+        HashIndex(bits if mode == "exact" else 64, max_memory_mb, spill_dir) as index,
+        Pool(processes=max(1, num_workers), initializer=_init_worker, initargs=(config,)) as pool,
+        tqdm(total=input_size, unit="B" if input_size else " rows", unit_scale=True, desc="Deduplicating") as progress,
+    ):
+        # a bounded window of in-flight batches; Pool.imap would read the whole input ahead of the workers
+        window: deque[tuple[list[bytes], Any]] = deque()
+        batches = batched((line for line in fin if line.strip()), batch_size)
+        while True:
+            for lines in islice(batches, 2 * max(1, num_workers) - len(window)):
+                window.append((lines, pool.apply_async(_hash_lines, (lines,))))
+            if not window:
+                break
+            lines, result = window.popleft()
+            status, hashes = result.get()
+            valid = status == _OK
+            keep = np.zeros(len(lines), dtype=bool)
+            keep[valid] = _keep_exact(index, hashes) if mode == "exact" else _keep_minhash(index, hashes)
+            fout.write(b"".join(line if line.endswith(b"\n") else line + b"\n" for line, k in zip(lines, keep) if k))
+
+            counters["input"] += len(lines)
+            counters["kept"] += int(keep.sum())
+            counters["duplicate"] += int(valid.sum() - keep.sum())
+            counters["invalid_json"] += int((status == _INVALID_JSON).sum())
+            counters["missing_key"] += int((status == _MISSING_KEY).sum())
+            progress.update(sum(len(line) for line in lines) if input_size else len(lines))
+            progress.set_postfix(
+                kept=counters["kept"], duplicates=counters["duplicate"], spilled_runs=index.num_spilled_runs
+            )
+    return counters
+
+
+def add_dedup_arguments(parser: argparse.ArgumentParser) -> None:
+    """Arguments shared by the dedup CLI and the dataset-specific wrappers"""
+    parser.add_argument("--mode", choices=["exact", "minhash"], default="exact", help="Exact or near-duplicate")
+    parser.add_argument("--hash-bits", type=int, choices=[64, 128], default=64, help="Digest width in exact mode")
+    parser.add_argument("--num-perm", type=int, default=128, help="MinHash permutations")
+    parser.add_argument("--bands", type=int, default=16, help="LSH bands (num-perm must be a multiple)")
+    parser.add_argument("--shingle-size", type=int, default=5, help="Characters per MinHash shingle")
+    parser.add_argument("--seed", type=int, default=1, help="MinHash seed")
+    parser.add_argument("--batch-size", type=int, default=16384, help="Rows hashed per worker task")
+    parser.add_argument("--num-workers", type=int, default=os.cpu_count() or 1, help="Parsing/hashing processes")
+    parser.add_argument(
+        "--max-memory-mb",
+        type=int,
+        default=4096,
+        help="Memory budget of the hash index before sorted runs are spilled to disk",
+    )
+    parser.add_argument("--spill-dir", type=str, default=None, help="Directory for spilled runs (default: TMPDIR)")
+
+
+def run_dedup(args: argparse.Namespace, key: str, drop_empty_keys: bool = False) -> None:
+    counters = deduplicate_jsonl(
+        args.input_jsonl,
+        args.output_jsonl,
+        key,
+        mode=args.mode,
+        bits=args.hash_bits,
+        num_perm=args.num_perm,
+        bands=args.bands,
+        shingle_size=args.shingle_size,
+        seed=args.seed,
+        batch_size=args.batch_size,
+        num_workers=args.num_workers,
+        max_memory_mb=args.max_memory_mb,
+        spill_dir=args.spill_dir,
+        drop_empty_keys=drop_empty_keys,
+    )
+    print(
+        f"\nKept {counters['kept']}/{counters['input']} rows in {args.output_jsonl} "
+        f"(duplicates: {counters['duplicate']}, invalid JSON: {counters['invalid_json']}, "
+        f"missing key: {counters['missing_key']})"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Streaming exact / MinHash-LSH deduplication of a JSONL file.")
+    parser.add_argument("--input-jsonl", type=str, required=True, help="Input JSONL file (.gz/.zst supported)")
+    parser.add_argument("--output-jsonl", type=str, required=True, help="Output JSONL file (.gz/.zst supported)")
+    parser.add_argument(
+        "--key",
+        type=str,
+        required=True,
+        help='Dotted path of the field to deduplicate on, e.g. "title" or "conversation.0.content"',
+    )
+    add_dedup_arguments(parser)
+    args = parser.parse_args()
+    run_dedup(args, args.key)
+
+
+if __name__ == "__main__":
+    main()
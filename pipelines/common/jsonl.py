@@ -0,0 +1,131 @@
+import json
+import math
+import os
+import shutil
+from contextlib import contextmanager
+from pathlib import Path
+from itertools import islice
+from typing import Any, Iterable, Iterator, TypeVar
+
+from pipelines.common.compression import compression_for, open_compressed
+
+T = TypeVar("T")
+
+
+def iter_jsonl(file_path: str | Path) -> Iterator[dict[str, Any]]:
+    """Lazily yield one parsed record per JSONL line (.gz/.zst files are decompressed on the fly)"""
+    with open_compressed(file_path, "rt") as fin:
+        for line in fin:
+            yield json.loads(line)
+
+
+def count_lines(file_path: str | Path) -> int:
+    with open_compressed(file_path, "rb") as fin:
+        return sum(chunk.count(b"\n") for chunk in iter(lambda: fin.read(1 << 20), b""))
+
+
+def batched(items: Iterable[T], batch_size: int) -> Iterator[list[T]]:
+    """Group an iterable into lists of at most `batch_size` items without materializing it"""
+    batch: list[T] = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:  # return remaining data
+        yield batch
+
+
+def stream_jsonl(file_path: str | Path, batch_size: int = 1024) -> Iterator[list[dict[str, Any]]]:
+    """Stream JSONL file in batches"""
+    return batched(iter_jsonl(file_path), batch_size)
+
+
+def byte_range_shards(file_path: str | Path, num_shards: int) -> list[tuple[int, int]]:
+    """Split a JSONL file into `num_shards` contiguous byte ranges that start and end on line boundaries
+
+    Compressed files cannot be split by byte offset; see line_range_shards.
+    """
+    if compression_for(file_path) is not None:
+        raise ValueError(f"{file_path} is compressed and cannot be split into byte ranges")
+    total_size = os.path.getsize(file_path)
+    with open(file_path, "rb") as fin:
+
+        def align(offset: int) -> int:
+            # move to the start of the first line beginning at or after offset
+            if offset <= 0 or offset >= total_size:
+                return min(max(offset, 0), total_size)
+            fin.seek(offset - 1)
+            fin.readline()
+            return fin.tell()
+
+        bounds = [align(total_size * i // num_shards) for i in range(num_shards + 1)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def iter_line_range(file_path: str | Path, start: int, end: int) -> Iterator[bytes]:
+    """Lazily yield the raw lines in byte range [start, end) of an uncompressed file"""
+    with open(file_path, "rb") as fin:
+        fin.seek(start)
+        position = start
+        while position < end:
+            line = fin.readline()
+            if not line:
+                break
+            position += len(line)
+            yield line
+
+
+def iter_jsonl_range(file_path: str | Path, start: int, end: int) -> Iterator[dict[str, Any]]:
+    """Lazily yield records for the lines in byte range [start, end) of a JSONL file"""
+    return map(json.loads, iter_line_range(file_path, start, end))
+
+
+@contextmanager
+def ordered_parts(
+    input_paths: list[str], output_dir: str | Path, chunk_size: int
+) -> Iterator[list[tuple[str, str, int, int]]]:
+    """Split JSONL files into line-aligned byte ranges of about `chunk_size` bytes for parallel processing
+
+    Yields (input path, part path, start, end) tasks; each task writes the output of its range to its part
+    path, in any order. On a clean exit the parts of every input are concatenated, in range order, into
+    `output_dir`/<input file name>. Part files are removed whether or not the block succeeded.
+    """
+    tasks = []
+    parts: dict[str, list[str]] = {}
+    for input_path in input_paths:
+        output_path = os.path.join(output_dir, os.path.basename(input_path))
+        num_chunks = max(1, math.ceil(os.path.getsize(input_path) / chunk_size))
+        parts[output_path] = []
+        for index, (start, end) in enumerate(byte_range_shards(input_path, num_chunks)):
+            if start == end:
+                continue
+            part_path = f"{output_path}.part{index:05d}"
+            parts[output_path].append(part_path)
+            tasks.append((input_path, part_path, start, end))
+
+    try:
+        yield tasks
+        for output_path, part_paths in parts.items():
+            with open(output_path, "wb") as fout:
+                for part_path in part_paths:
+                    with open(part_path, "rb") as part:
+                        shutil.copyfileobj(part, fout, 1 << 24)
+                    os.remove(part_path)
+    finally:
+        for part_paths in parts.values():
+            for part_path in part_paths:
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+
+
+def line_range_shards(file_path: str | Path, num_shards: int) -> list[tuple[int, int]]:
+    """Split a (possibly compressed) JSONL file into `num_shards` contiguous ranges of line numbers"""
+    total_lines = count_lines(file_path)
+    bounds = [total_lines * i // num_shards for i in range(num_shards + 1)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def iter_jsonl_lines(file_path: str | Path, start: int, stop: int) -> Iterator[dict[str, Any]]:
+    """Lazily yield records for lines [start, stop) of a (possibly compressed) JSONL file"""
+    return islice(iter_jsonl(file_path), start, stop)
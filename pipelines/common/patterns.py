@@ -0,0 +1,86 @@
+"""Fixed-string pattern sets matched in a single scan.
+
+A `PatternSet` is built once per pattern list and scans each string once for all of its patterns. It uses an
+Aho-Corasick automaton from the optional `pyahocorasick` package (`pip install -e .[patterns]`) when it is
+installed. Otherwise the patterns are compiled into one regular expression shaped like a trie (patterns sharing
+a prefix share its branch, so "i'm sorry" and "i'm unable" are one "i'm " branch), which the regex engine runs
+in a single C-level pass. Which pattern matched is only worked out for strings that contain one, so reporting
+costs nothing on the clean majority.
+"""
+
+import re
+from typing import Any, Iterable, Optional
+
+
+def _trie_regex(patterns: list[str]) -> str:
+    trie: dict[str, Any] = {}
+    for pattern in patterns:
+        node = trie
+        for char in pattern:
+            node = node.setdefault(char, {})
+        node[""] = {}  # end of a pattern
+
+    def build(node: dict[str, Any]) -> str:
+        branches = [re.escape(char) + build(child) for char, child in node.items() if char]
+        if not branches:
+            return ""
+        regex = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # a pattern ending here makes the rest optional; the shortest match is enough to report a hit
+        return f"(?:{regex})?" if "" in node else regex
+
+    return build(trie)
+
+
+def _build_automaton(patterns: list[str]) -> Any:
+    try:
+        import ahocorasick
+    except ImportError:
+        return None
+    automaton = ahocorasick.Automaton()
+    for pattern in patterns:
+        automaton.add_word(pattern, pattern)
+    automaton.make_automaton()
+    return automaton
+
+
+class PatternSet:
+    """Substring matcher for a fixed list of patterns, built once and reused for every string.
+
+    With ignore_case=True patterns and strings are compared after str.lower().
+    """
+
+    def __init__(self, patterns: Iterable[str], ignore_case: bool = False) -> None:
+        self.ignore_case = ignore_case
+        self.patterns = [pattern.lower() if ignore_case else pattern for pattern in patterns]
+        self._automaton = None
+        if not self.patterns:
+            self._regex = re.compile(r"(?!)")  # never matches
+        elif "" in self.patterns:
+            self._regex = re.compile("")  # the empty pattern matches everything
+        else:
+            self._regex = re.compile(_trie_regex(self.patterns))
+            self._automaton = _build_automaton(self.patterns)
+
+    def _prepare(self, text: str) -> str:
+        return text.lower() if self.ignore_case else text
+
+    def _scan(self, text: str) -> bool:
+        if self._automaton is not None:
+            for _ in self._automaton.iter(text):
+                return True
+            return False
+        return self._regex.search(text) is not None
+
+    def matches(self, text: str) -> bool:
+        """Whether `text` contains any of the patterns"""
+        return self._scan(self._prepare(text))
+
+    def search(self, text: str) -> Optional[str]:
+        """Return the first pattern, in list order, that `text` contains, or None"""
+        text = self._prepare(text)
+        if not self._scan(text):
+            return None
+        return next(pattern for pattern in self.patterns if pattern in text)
+
+    def __repr__(self) -> str:
+        return f"PatternSet({self.patterns!r}, ignore_case={self.ignore_case})"
@@ -0,0 +1,109 @@
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, cast
+
+from transformers import AutoTokenizer, PreTrainedTokenizer
+
+Messages = list[dict[str, str]]
+
+_worker_tokenizer: PreTrainedTokenizer | None = None
+
+
+def render_token_ids(
+    tokenizer: PreTrainedTokenizer,
+    messages: Messages,
+    chat_template_kwargs: dict[str, Any] | None = None,
+) -> list[int]:
+    """Render a conversation with the chat template and return its prompt token IDs"""
+    token_ids = tokenizer.apply_chat_template(
+        messages,  # type: ignore
+        tokenize=True,
+        add_generation_prompt=True,
+        **(chat_template_kwargs or {}),
+    )
+    return cast(list[int], token_ids)
+
+
+def _init_worker(model_path: str) -> None:
+    global _worker_tokenizer
+    _worker_tokenizer = AutoTokenizer.from_pretrained(model_path)
+
+
+def _render_chunk(conversations: list[Messages], chat_template_kwargs: dict[str, Any]) -> list[list[int]]:
+    assert _worker_tokenizer is not None
+    return [render_token_ids(_worker_tokenizer, messages, chat_template_kwargs) for messages in conversations]
+
+
+class PromptBuilder:
+    """Render chat templates and tokenize them once, optionally across CPU worker processes.
+
+    The resulting token IDs are handed to vLLM as-is, so prompts are never tokenized a second time by the
+    engine or re-encoded just to measure their length.
+    """
+
+    def __init__(
+        self,
+        model_path: str,
+        num_workers: int = 1,
+        chunk_size: int = 64,
+        chat_template_kwargs: dict[str, Any] | None = None,
+    ) -> None:
+        self.model_path = model_path
+        self.chunk_size = chunk_size
+        self.chat_template_kwargs = chat_template_kwargs or {}
+        self._tokenizer: PreTrainedTokenizer | None = None
+        self._executor: ProcessPoolExecutor | None = None
+
+        if num_workers > 1:
+            # spawn: the parent may already hold a CUDA context from the vLLM engine
+            self._executor = ProcessPoolExecutor(
+                max_workers=num_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(model_path,),
+            )
+
+    @property
+    def tokenizer(self) -> PreTrainedTokenizer:
+        if self._tokenizer is None:
+            self._tokenizer = AutoTokenizer.from_pretrained(self.model_path)
+        return self._tokenizer
+
+    def token_ids(
+        self,
+        conversations: list[Messages],
+        chat_template_kwargs: dict[str, Any] | None = None,
+    ) -> list[list[int]]:
+        """Return prompt token IDs for each conversation, in input order
+
+        `chat_template_kwargs` (e.g. enable_thinking) override the defaults given at construction.
+        """
+        kwargs = {**self.chat_template_kwargs, **(chat_template_kwargs or {})}
+        if self._executor is None or len(conversations) <= self.chunk_size:
+            return [render_token_ids(self.tokenizer, messages, kwargs) for messages in conversations]
+
+        chunks = [conversations[i : i + self.chunk_size] for i in range(0, len(conversations), self.chunk_size)]
+        token_ids: list[list[int]] = []
+        for chunk_token_ids in self._executor.map(_render_chunk, chunks, itertools.repeat(kwargs)):
+            token_ids.extend(chunk_token_ids)
+        return token_ids
+
+    def prompts(
+        self,
+        conversations: list[Messages],
+        chat_template_kwargs: dict[str, Any] | None = None,
+    ) -> list[dict[str, list[int]]]:
+        """Return prompts in vLLM's TokensPrompt format, ready for LLM.generate"""
+        return [{"prompt_token_ids": token_ids} for token_ids in self.token_ids(conversations, chat_template_kwargs)]
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self) -> "PromptBuilder":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
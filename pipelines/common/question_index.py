@@ -0,0 +1,154 @@
+"""Memory-mapped (dataset, split, index) -> question lookup for the competitive programming sources.
+
+OpenCodeReasoning-2 and Nemotron-Post-Training code samples only reference their problem statements by
+(dataset, split, index) in TACO, APPS, CodeContests or open-r1/codeforces. Fetching them with
+`hf_dataset[split][index]` decodes a whole row (tests, solutions, metadata) per lookup. Instead, each source
+is read once, projecting only the columns the question is built from, and the rendered questions are written
+as one Arrow IPC file per split, where row i is the question of index i (null when there is none). Lookups
+memory-map those files and gather a whole batch of indices with a single `take` per (dataset, split).
+
+Layout of `index_dir`: `<dataset>/<split>.arrow` plus `<dataset>/splits.json` with the row count of every
+split, written last so that a dataset whose build was interrupted is rebuilt.
+"""
+
+import json
+import os
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Optional, Sequence
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+SOURCE_DATASETS: dict[str, dict[str, Any]] = {
+    "taco": {"path": "BAAI/TACO", "kwargs": {"trust_remote_code": True}, "columns": ["question"]},
+    "apps": {"path": "codeparrot/apps", "kwargs": {"trust_remote_code": True}, "columns": ["question"]},
+    "code_contests": {"path": "deepmind/code_contests", "kwargs": {}, "columns": ["description"]},
+    "open-r1/codeforces": {
+        "path": "open-r1/codeforces",
+        "kwargs": {},
+        "columns": ["description", "input_format", "output_format", "examples", "note"],
+    },
+}
+
+_BUILD_BATCH_SIZE = 10_000
+_SCHEMA = pa.schema([pa.field("question", pa.large_string())])
+
+
+def build_codeforces_question(example: dict[str, Any]) -> Optional[str]:
+    """Statement, input/output format, examples and note of an open-r1/codeforces problem"""
+    if not example.get("description"):
+        return None
+    parts = [example["description"]]
+
+    if example.get("input_format"):
+        parts.append("\n\nInput\n\n" + example["input_format"])
+    if example.get("output_format"):
+        parts.append("\n\nOutput\n\n" + example["output_format"])
+    if example.get("examples"):
+        parts.append("\n\nExamples")
+        for ex in example["examples"]:
+            if ex.get("input") is not None:
+                parts.append("\n\nInput\n\n" + str(ex["input"]))
+            if ex.get("output") is not None:
+                parts.append("\n\nOutput\n\n" + str(ex["output"]))
+    if example.get("note"):
+        parts.append("\n\nNote\n\n" + example["note"])
+    return "".join(parts)
+
+
+def _question_column(ds_name: str, table: pa.Table) -> pa.Array:
+    if ds_name in ["taco", "apps"]:
+        return table.column("question").combine_chunks().cast(pa.large_string())
+    if ds_name == "code_contests":
+        description = table.column("description").combine_chunks().cast(pa.large_string())
+        # an empty description means there is no question
+        return pc.if_else(pc.not_equal(description, ""), description, pa.scalar(None, pa.large_string()))
+    if ds_name == "open-r1/codeforces":
+        return pa.array([build_codeforces_question(row) for row in table.to_pylist()], type=pa.large_string())
+    raise ValueError(f"Unsupported dataset: {ds_name}")
+
+
+def _dataset_dir(index_dir: Path, ds_name: str) -> Path:
+    return index_dir / ds_name.replace("/", "__")
+
+
+def build_dataset_index(index_dir: str | Path, ds_name: str, batch_size: int = _BUILD_BATCH_SIZE) -> dict[str, int]:
+    """Download `ds_name`, write the question file of each of its splits and return their row counts"""
+    from datasets import load_dataset
+
+    source = SOURCE_DATASETS[ds_name]
+    dataset_dir = _dataset_dir(Path(index_dir), ds_name)
+    dataset_dir.mkdir(parents=True, exist_ok=True)
+
+    print(f"Building question index for {ds_name}...")
+    dataset_dict = load_dataset(source["path"], **source["kwargs"])
+    splits = {}
+    for split, split_ds in dataset_dict.items():
+        projected = split_ds.select_columns(source["columns"]).with_format("arrow")
+        tmp_path = dataset_dir / f"{split}.arrow.tmp"
+        with pa.OSFile(str(tmp_path), "wb") as sink, pa.ipc.new_file(sink, _SCHEMA) as writer:
+            for table in projected.iter(batch_size=batch_size):
+                writer.write_batch(pa.record_batch([_question_column(ds_name, table)], schema=_SCHEMA))
+        os.replace(tmp_path, dataset_dir / f"{split}.arrow")
+        splits[split] = len(split_ds)
+
+    with open(dataset_dir / "splits.json", "w", encoding="utf-8") as f:
+        json.dump(splits, f, indent=2)
+    return splits
+
+
+class QuestionIndex:
+    """Batched question lookup over an index directory.
+
+    A dataset is built into the directory the first time one of its questions is looked up, unless
+    build_missing=False, in which case a missing dataset raises FileNotFoundError.
+    """
+
+    def __init__(self, index_dir: str | Path, build_missing: bool = True) -> None:
+        self.index_dir = Path(index_dir)
+        self.build_missing = build_missing
+        self._columns: dict[str, dict[str, pa.ChunkedArray]] = {}
+
+    def _open(self, ds_name: str) -> dict[str, pa.ChunkedArray]:
+        if ds_name in self._columns:
+            return self._columns[ds_name]
+
+        dataset_dir = _dataset_dir(self.index_dir, ds_name)
+        manifest = dataset_dir / "splits.json"
+        if not manifest.exists():
+            if not self.build_missing:
+                raise FileNotFoundError(f"No question index for {ds_name} in {self.index_dir}")
+            build_dataset_index(self.index_dir, ds_name)
+        with open(manifest, encoding="utf-8") as f:
+            splits = json.load(f)
+
+        columns = {}
+        for split in splits:
+            # an uncompressed IPC file read from a memory map references the mapped pages instead of copying
+            source = pa.memory_map(str(dataset_dir / f"{split}.arrow"), "r")
+            columns[split] = pa.ipc.open_file(source).read_all().column("question")
+        self._columns[ds_name] = columns
+        return columns
+
+    def lookup(self, ds_names: Sequence[str], splits: Sequence[str], indices: Sequence[int]) -> list[Optional[str]]:
+        """Questions for parallel sequences of keys; None for unsupported datasets, unknown splits and
+        out-of-range indices as well as for problems without a question"""
+        positions_by_split: dict[tuple[str, str], list[int]] = defaultdict(list)
+        for position, key in enumerate(zip(ds_names, splits)):
+            positions_by_split[key].append(position)
+
+        questions: list[Optional[str]] = [None] * len(indices)
+        for (ds_name, split), positions in positions_by_split.items():
+            if ds_name not in SOURCE_DATASETS:
+                continue
+            column = self._open(ds_name).get(split)
+            if column is None:
+                continue
+            split_indices = np.fromiter((indices[p] for p in positions), dtype=np.int64, count=len(positions))
+            in_range = np.flatnonzero((split_indices >= 0) & (split_indices < len(column)))
+            found = column.take(pa.array(split_indices[in_range])).to_pylist()
+            for i, question in zip(in_range.tolist(), found):
+                questions[positions[i]] = question
+        return questions
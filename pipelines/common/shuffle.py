@@ -0,0 +1,133 @@
+"""Seeded external-memory shuffle of JSONL lines.
+
+Every line gets a random 63-bit key, drawn in input order from a generator seeded with `seed`, and the output
+is the lines ordered by key. Lines are buffered as raw bytes (never parsed); once the buffer outgrows
+`max_memory_mb` it is sorted by key and written to a run file in `spill_dir`, and the runs are merged
+sequentially at the end. Data larger than memory is thus read and written twice, both times sequentially.
+The order depends only on the seed and the input order, not on the memory budget.
+"""
+
+import argparse
+import heapq
+import shutil
+import tempfile
+from operator import itemgetter
+from pathlib import Path
+from typing import Iterator, Optional
+
+import numpy as np
+
+DEFAULT_SEED = 42
+
+_KEY_BLOCK = 1 << 16
+_LINE_OVERHEAD = 100  # approximate bytes of Python objects per buffered line besides its data
+_READ_BUFFER = 1 << 20
+
+
+class ExternalShuffler:
+    """Collect lines with `add`, then iterate `shuffled()` once to get them back in a seeded random order.
+
+    Lines must end with a newline and contain no other one.
+    """
+
+    def __init__(
+        self, seed: int = DEFAULT_SEED, max_memory_mb: int = 1024, spill_dir: Optional[str | Path] = None
+    ) -> None:
+        self.max_memory_bytes = max_memory_mb << 20
+        self._rng = np.random.default_rng(seed)
+        self._key_block: Iterator[int] = iter(())
+        self._lines: list[bytes] = []
+        self._keys: list[int] = []
+        self._buffer_bytes = 0
+        self._size = 0
+        self._spill_root = spill_dir
+        self._spill_dir: Optional[Path] = None
+        self._num_runs = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def num_spilled_runs(self) -> int:
+        return self._num_runs
+
+    def _next_key(self) -> int:
+        key = next(self._key_block, None)
+        if key is None:
+            # keys are drawn in fixed-size blocks so the i-th line gets the same key in every run
+            self._key_block = iter(self._rng.integers(0, 1 << 63, size=_KEY_BLOCK, dtype=np.int64).tolist())
+            key = next(self._key_block)
+        return key
+
+    def add(self, line: bytes) -> None:
+        if not line.endswith(b"\n"):
+            raise ValueError("Lines passed to ExternalShuffler must end with a newline")
+        self._lines.append(line)
+        self._keys.append(self._next_key())
+        self._size += 1
+        self._buffer_bytes += len(line) + _LINE_OVERHEAD
+        if self._buffer_bytes >= self.max_memory_bytes:
+            self._spill()
+
+    def _sorted_buffer(self) -> tuple[np.ndarray, list[bytes]]:
+        keys = np.array(self._keys, dtype=np.int64)
+        # a stable sort keeps input order for equal keys
+        order = np.argsort(keys, kind="stable")
+        lines = [self._lines[i] for i in order.tolist()]
+        self._lines, self._keys, self._buffer_bytes = [], [], 0
+        return keys[order], lines
+
+    def _spill(self) -> None:
+        keys, lines = self._sorted_buffer()
+        if self._spill_dir is None:
+            self._spill_dir = Path(tempfile.mkdtemp(prefix="shuffle-", dir=self._spill_root))
+        np.save(self._spill_dir / f"run{self._num_runs:05d}.keys.npy", keys)
+        with open(self._spill_dir / f"run{self._num_runs:05d}.jsonl", "wb", buffering=_READ_BUFFER) as f:
+            f.writelines(lines)
+        self._num_runs += 1
+
+    def _read_run(self, index: int) -> Iterator[tuple[int, bytes]]:
+        assert self._spill_dir is not None
+        keys = np.load(self._spill_dir / f"run{index:05d}.keys.npy", mmap_mode="r")
+        with open(self._spill_dir / f"run{index:05d}.jsonl", "rb", buffering=_READ_BUFFER) as f:
+            for start in range(0, len(keys), _KEY_BLOCK):
+                yield from zip(keys[start : start + _KEY_BLOCK].tolist(), f)
+
+    def shuffled(self) -> Iterator[bytes]:
+        """Yield every added line in shuffled order; spilled runs are removed afterwards"""
+        keys, lines = self._sorted_buffer()
+        try:
+            if self._num_runs == 0:
+                yield from lines
+                return
+            runs = [self._read_run(i) for i in range(self._num_runs)]
+            runs.append(zip(keys.tolist(), lines))
+            # heapq.merge prefers earlier runs on ties, which hold earlier lines
+            for _, line in heapq.merge(*runs, key=itemgetter(0)):
+                yield line
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        self._lines, self._keys, self._buffer_bytes = [], [], 0
+        if self._spill_dir is not None:
+            shutil.rmtree(self._spill_dir, ignore_errors=True)
+            self._spill_dir = None
+            self._num_runs = 0
+
+    def __enter__(self) -> "ExternalShuffler":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+
+def add_shuffle_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="Shuffle seed")
+    parser.add_argument(
+        "--max-memory-mb",
+        type=int,
+        default=1024,
+        help="Lines buffered in memory before a sorted run is spilled to disk",
+    )
+    parser.add_argument("--spill-dir", type=str, default=None, help="Directory for spilled runs (default: TMPDIR)")
@@ -0,0 +1,144 @@
+import hashlib
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+_MAGIC = 0x544F4B43414348  # "TOKCACH"
+_VERSION = 1
+_BUCKET_SLOTS = 8  # one 64-byte cache line per bucket
+
+# slot layout: 40-bit key | 24-bit value, where value = count + 1 and the top value bit marks a lower bound
+_VALUE_BITS = 24
+_VALUE_MASK = (1 << _VALUE_BITS) - 1
+_LOWER_BOUND_FLAG = 1 << (_VALUE_BITS - 1)
+_MAX_COUNT = _LOWER_BOUND_FLAG - 2
+
+
+def tokenizer_fingerprint(tokenizer: Any, namespace: str = "") -> str:
+    """Identify a tokenizer by its serialized vocabulary and rules, so copies at different paths share entries
+
+    `namespace` separates counts of different renderings of the same text (e.g. chat template options).
+    """
+    backend = getattr(tokenizer, "backend_tokenizer", None)
+    if backend is not None:
+        digest = hashlib.blake2b(backend.to_str().encode("utf-8"), digest_size=16).hexdigest()
+    else:
+        digest = f"{tokenizer.name_or_path}:{len(tokenizer)}"
+    return f"{digest}:{namespace}"
+
+
+class TokenCountCache:
+    """On-disk token-count cache keyed by (tokenizer, text hash), shared through a memory-mapped file.
+
+    The file is a fixed-size, set-associative hash table: each text hashes to one bucket of 8 slots, and
+    every slot is a single 64-bit word holding a 40-bit key and the count. A write is one aligned 64-bit
+    store, so worker processes can read and fill the same file concurrently; a lost race only drops an
+    entry. When a bucket is full a pseudo-random slot is overwritten, which bounds the file to
+    `size_mb` regardless of how many texts are counted.
+
+    Counts may be stored as lower bounds (e.g. an early length cutoff); `get` returns them with
+    exact=False so callers can still decide "over the limit" without tokenizing again.
+    """
+
+    def __init__(self, path: str | Path, tokenizer_id: str, size_mb: int = 1024) -> None:
+        self.path = Path(path)
+        self._hash_key = hashlib.blake2b(tokenizer_id.encode("utf-8"), digest_size=32).digest()
+
+        if self.path.exists():
+            table = np.memmap(self.path, dtype=np.uint64, mode="r+")
+            if len(table) < _BUCKET_SLOTS * 2 or int(table[0]) != _MAGIC or int(table[1]) != _VERSION:
+                raise ValueError(f"{self.path} is not a token count cache (version {_VERSION})")
+            num_buckets = int(table[2])
+        else:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            num_buckets = max(1, (size_mb << 20) // (_BUCKET_SLOTS * 8))
+            table = np.memmap(self.path, dtype=np.uint64, mode="w+", shape=((num_buckets + 1) * _BUCKET_SLOTS,))
+            table[:3] = [_MAGIC, _VERSION, num_buckets]
+            table.flush()
+
+        # bucket 0 holds the header
+        self.num_buckets = num_buckets
+        self._mmap = table
+        self._table = table[_BUCKET_SLOTS:].reshape(num_buckets, _BUCKET_SLOTS)
+
+    def _hashes(self, texts: list[str]) -> np.ndarray:
+        return np.array(
+            [
+                int.from_bytes(
+                    hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=8, key=self._hash_key).digest(),
+                    "little",
+                )
+                for text in texts
+            ],
+            dtype=np.uint64,
+        )
+
+    def _locate(self, hashes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        buckets = (hashes % np.uint64(self.num_buckets)).astype(np.int64)
+        keys = hashes >> np.uint64(_VALUE_BITS)
+        return buckets, keys
+
+    def get(self, texts: list[str]) -> list[tuple[int, bool] | None]:
+        """Return (token count, exact) per text, or None if it is not cached"""
+        if not texts:
+            return []
+        buckets, keys = self._locate(self._hashes(texts))
+        slots = self._table[buckets]
+        matches = (slots >> np.uint64(_VALUE_BITS)) == keys[:, None]
+        values = (slots & np.uint64(_VALUE_MASK)).astype(np.int64)
+
+        hits = matches & (values != 0)
+        found = hits.any(axis=1)
+        hit_values = values[np.arange(len(texts)), hits.argmax(axis=1)]
+        exact = (hit_values & _LOWER_BOUND_FLAG) == 0
+        counts = (hit_values & (_LOWER_BOUND_FLAG - 1)) - 1
+        return [
+            (count, is_exact) if is_found else None
+            for count, is_exact, is_found in zip(counts.tolist(), exact.tolist(), found.tolist())
+        ]
+
+    def put(self, texts: list[str], counts: list[tuple[int, bool]]) -> None:
+        """Store (token count, exact) per text"""
+        if not texts:
+            return
+        buckets, keys = self._locate(self._hashes(texts))
+        values = np.array(
+            [
+                count + 1 if exact and count <= _MAX_COUNT else min(count, _MAX_COUNT) + 1 + _LOWER_BOUND_FLAG
+                for count, exact in counts
+            ],
+            dtype=np.uint64,
+        )
+        slots = (keys << np.uint64(_VALUE_BITS)) | values
+
+        # reuse the slot holding the same key, else an empty one, else replace a pseudo-random slot
+        rows = self._table[buckets]
+        same_key = (rows >> np.uint64(_VALUE_BITS)) == keys[:, None]
+        empty = rows == 0
+        index = np.where(
+            same_key.any(axis=1),
+            same_key.argmax(axis=1),
+            np.where(empty.any(axis=1), empty.argmax(axis=1), (keys % np.uint64(_BUCKET_SLOTS)).astype(np.int64)),
+        )
+
+        # texts sharing a bucket within this batch are placed one at a time so they do not overwrite each other
+        unique_buckets, bucket_counts = np.unique(buckets, return_counts=True)
+        shared = np.isin(buckets, unique_buckets[bucket_counts > 1])
+        self._table[buckets[~shared], index[~shared]] = slots[~shared]
+        for i in np.flatnonzero(shared):
+            row = self._table[buckets[i]]
+            candidates = np.flatnonzero(((row >> np.uint64(_VALUE_BITS)) == keys[i]) | (row == 0))
+            row[int(candidates[0]) if len(candidates) else int(keys[i]) % _BUCKET_SLOTS] = slots[i]
+
+    def flush(self) -> None:
+        self._mmap.flush()
+
+    def close(self) -> None:
+        self.flush()
+
+    def __enter__(self) -> "TokenCountCache":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
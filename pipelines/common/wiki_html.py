@@ -0,0 +1,172 @@
+"""Paragraph extraction from Wikipedia Enterprise (Parsoid) article HTML.
+
+`extract_paragraphs` parses with lxml directly and produces exactly what the original BeautifulSoup
+implementation (`extract_paragraphs_bs4`, kept as the reference) produces, without building a Python object
+per node: the parse and the search for paragraphs run in C, and Python only visits the subtree of each
+paragraph to collect its text. Text follows BeautifulSoup's `.text` rules: comments and the contents of
+<script>, <style> and <template> are not text, and the contents of <table> (cleared per section) and of
+<sup> inside a paragraph (footnote markers) are dropped.
+"""
+
+import unicodedata
+from typing import Any, Callable, Container, Optional
+
+from lxml import etree
+
+SECTIONS_TO_IGNORE = {
+    "en": ["Notes", "Further reading", "References", "See also", "External links"],
+    "ja": ["脚注", "出典", "参考文献", "関連項目", "外部リンク"],
+}
+LEAD_TITLES = {"en": "Abstract", "ja": "概要"}
+
+TAGS_TO_REMOVE = ["table"]
+INNER_TAGS_TO_REMOVE = ["sup"]
+TAGS_TO_EXTRACT = ["p"]
+
+# BeautifulSoup keeps strings inside these tags as Script/Stylesheet/TemplateString, which .text leaves out
+_NON_TEXT_TAGS = frozenset({"script", "style", "template"})
+_PARAGRAPH_SKIPPED_TAGS = frozenset(TAGS_TO_REMOVE + INNER_TAGS_TO_REMOVE)
+_PRESERVE_WHITESPACE_TAGS = frozenset({"pre", "textarea"})
+_ASCII_SPACES = " \n\t\f\r"
+
+_PARSER = etree.HTMLParser()
+
+
+def normalize_text(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text)
+    text = " ".join(text.split())
+    if not text.isprintable():
+        text = "".join(char for char in text if char.isprintable())
+    return text.strip()
+
+
+def _paragraph(title: str, text: str, paragraph_id: int) -> dict[str, Any]:
+    return {"title": title, "text": text, "tag": "p", "paragraph_id": paragraph_id}
+
+
+def _collect_text(element: Any, skipped_tags: Container[str], hidden: bool, keep_blank: bool, parts: list[str]) -> None:
+    hidden = hidden or element.tag in _NON_TEXT_TAGS
+    keep_blank = keep_blank or element.tag in _PRESERVE_WHITESPACE_TAGS
+    if not hidden:
+        _add_string(element.text, keep_blank, parts)
+    for child in element:
+        # comments and processing instructions have a non-str tag; only their tail is text
+        if isinstance(child.tag, str) and child.tag not in skipped_tags:
+            _collect_text(child, skipped_tags, hidden, keep_blank, parts)
+        if not hidden:
+            _add_string(child.tail, keep_blank, parts)
+
+
+def _add_string(string: Optional[str], keep_blank: bool, parts: list[str]) -> None:
+    if not string:
+        return
+    if keep_blank or string.strip(_ASCII_SPACES):
+        parts.append(string)
+    else:
+        # BeautifulSoup stores a string of ASCII whitespace as a single newline or space
+        parts.append("\n" if "\n" in string else " ")
+
+
+def _text(element: Any, skipped_tags: Container[str] = (), keep_blank: bool = False) -> str:
+    """BeautifulSoup's `element.text`, with the contents of `skipped_tags` descendants removed
+
+    keep_blank=True keeps whitespace-only strings as they are, which is cheaper and makes no difference
+    once the text goes through `normalize_text`.
+    """
+    hidden, preserve = False, keep_blank
+    for ancestor in element.iterancestors():
+        hidden = hidden or ancestor.tag in _NON_TEXT_TAGS
+        preserve = preserve or ancestor.tag in _PRESERVE_WHITESPACE_TAGS
+    parts: list[str] = []
+    _collect_text(element, skipped_tags, hidden, preserve, parts)
+    return "".join(parts)
+
+
+def _inside_table(element: Any, section: Any) -> bool:
+    for ancestor in element.iterancestors():
+        if ancestor is section:
+            return False
+        if ancestor.tag == "table":
+            return True
+    return False
+
+
+def extract_paragraphs(html: str, sections_to_ignore: Container[str], lead_title: str) -> list[dict[str, Any]]:
+    """Return the paragraphs of an article as dicts with title, text, tag and paragraph_id.
+
+    Only the first <section> and its following sibling sections are read. A section's title is the text of
+    its first <h2> and carries over to following sections without one; paragraphs under a title in
+    `sections_to_ignore` are skipped, and the first paragraph gets `lead_title` if no title has been seen.
+    """
+    try:
+        root = etree.fromstring(html, _PARSER)
+    except etree.XMLSyntaxError:
+        # lxml rejects empty documents, BeautifulSoup returns an empty tree
+        return []
+    if root is None:
+        return []
+    first_section = next(root.iter("section"), None)
+    if first_section is None:
+        return []
+
+    section_title = ""
+    paragraphs: list[dict[str, Any]] = []
+    for section in [first_section, *first_section.itersiblings("section")]:
+        heading = next(section.iter("h2"), None)
+        if heading is not None:
+            section_title = _text(heading)
+        if section_title in sections_to_ignore:
+            continue
+
+        for element in section.iter(TAGS_TO_EXTRACT):
+            if _inside_table(element, section):
+                continue
+            paragraph_id = len(paragraphs)
+            current_title = lead_title if paragraph_id == 0 and not section_title else section_title
+            text = normalize_text(_text(element, _PARAGRAPH_SKIPPED_TAGS, keep_blank=True))
+            paragraphs.append(_paragraph(current_title, text, paragraph_id))
+
+    return paragraphs
+
+
+def extract_paragraphs_bs4(html: str, sections_to_ignore: Container[str], lead_title: str) -> list[dict[str, Any]]:
+    """Reference implementation of `extract_paragraphs` on BeautifulSoup"""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, features="lxml")
+    section_title = ""
+    section = soup.find(["section"])
+
+    paragraph_id = 0
+    paragraphs = []
+
+    while section:
+        if section.h2 is not None:  # type: ignore
+            section_title = section.h2.text  # type: ignore
+
+        for tag in section.find_all(TAGS_TO_REMOVE):  # type: ignore
+            tag.clear()  # type: ignore
+
+        for tag in section.find_all(TAGS_TO_EXTRACT):  # type: ignore
+            for inner_tag in tag.find_all(INNER_TAGS_TO_REMOVE):  # type: ignore
+                inner_tag.clear()  # type: ignore
+
+            paragraph_text = normalize_text(tag.text)
+
+            if section_title in sections_to_ignore:
+                continue
+
+            current_title = lead_title if paragraph_id == 0 and not section_title else section_title
+
+            paragraphs.append(_paragraph(current_title, paragraph_text, paragraph_id))
+            paragraph_id += 1
+
+        section = section.find_next_sibling(["section"])
+
+    return paragraphs
+
+
+EXTRACTORS: dict[str, Callable[[str, Container[str], str], list[dict[str, Any]]]] = {
+    "lxml": extract_paragraphs,
+    "bs4": extract_paragraphs_bs4,
+}
@@ -1,9 +1,12 @@
 import argparse
-import json
-import os
+from pathlib import Path
 from typing import Dict, List, Union, cast
 from vllm import LLM, SamplingParams
-from transformers import AutoTokenizer, PreTrainedTokenizer
+
+from pipelines.common.checkpoint import JsonlCheckpoint
+from pipelines.common.data_parallel import get_replica, iter_replica_jsonl, launch_data_parallel, replica_output_path
+from pipelines.common.jsonl import batched
+from pipelines.common.prompt_builder import PromptBuilder
 
 # Define the English prompt as a message structure for chat templates
 ENGLISH_CHAT_MESSAGES = [
@@ -43,15 +46,32 @@ def parse_args() -> argparse.Namespace:
     )
     parser.add_argument("--gen-max-tokens", type=int, default=16384, help="Max tokens for generated output.")
     parser.add_argument("--tensor-parallel-size", type=int, default=1, help="Tensor parallel size for vLLM.")
+    parser.add_argument(
+        "--data-parallel-size",
+        type=int,
+        default=1,
+        help="Number of engine replicas, each using --tensor-parallel-size GPUs.",
+    )
+    parser.add_argument(
+        "--num-tokenizer-workers",
+        type=int,
+        default=8,
+        help="Number of CPU processes rendering and tokenizing prompts.",
+    )
+    parser.add_argument(
+        "--no-resume",
+        action="store_true",
+        help="Ignore progress recorded in <output-jsonl>.progress and start over.",
+    )
+    parser.add_argument(
+        "--fsync-interval",
+        type=float,
+        default=None,
+        help="Seconds between fsyncs of the output and progress files.",
+    )
     return parser.parse_args()
 
 
-def load_tokenizer(model_path: str) -> PreTrainedTokenizer:
-    """Load and return a tokenizer for the specified model."""
-    tokenizer = AutoTokenizer.from_pretrained(model_path)
-    return tokenizer
-
-
 def get_prompt_template(lang: str) -> List[Dict[str, str]]:
     """Return the appropriate chat message template based on language."""
     prompt_map = {
@@ -60,20 +80,6 @@ def get_prompt_template(lang: str) -> List[Dict[str, str]]:
     return prompt_map.get(lang, ENGLISH_CHAT_MESSAGES)
 
 
-def read_jsonl(file_path: str) -> List[Dict[str, Union[str, List]]]:
-    """Read and parse JSONL file into a list of dictionaries."""
-    with open(file_path, "r", encoding="utf-8") as f:
-        return [json.loads(line) for line in f]
-
-
-def save_to_jsonl(file_path: str, data_list: List[Dict[str, Union[str, List]]]) -> None:
-    """Append data to a JSONL file."""
-    mode = "a" if os.path.exists(file_path) else "w"
-    with open(file_path, mode, encoding="utf-8") as f:
-        for entry in data_list:
-            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
-
-
 def parse_generated_text(text: str) -> Dict[str, str]:
     """Parse generated text into a structured question dictionary."""
     print(f"Generated Text:\n{text}\n{'-' * 40}", flush=True)
@@ -100,13 +106,13 @@ def parse_generated_text(text: str) -> Dict[str, str]:
 
 def process_batch(
     batch_lines: List[Dict[str, Union[str, List]]],
-    tokenizer: PreTrainedTokenizer,
+    prompt_builder: PromptBuilder,
     llm: LLM,
     prompt_template: List[Dict[str, str]],
     gen_max_tokens: int,
 ) -> List[Dict[str, Union[str, List]]]:
     """Process a batch of JSONL lines and generate questions from code snippets using chat template."""
-    batch_inputs = []
+    conversations = []
     valid_indices = []
 
     for local_idx, item in enumerate(batch_lines):
@@ -118,17 +124,15 @@ def process_batch(
             for msg in formatted_messages:
                 if msg["role"] == "user":
                     msg["content"] = msg["content"].format(code=code.strip())
-            # Apply the chat template to format the prompt
-            prompt = tokenizer.apply_chat_template(formatted_messages, tokenize=False, add_generation_prompt=True)
-            batch_inputs.append(prompt)
+            conversations.append(formatted_messages)
             valid_indices.append(local_idx)
 
-    if not batch_inputs:
+    if not conversations:
         return []
 
     # Generate questions using vLLM
     outputs = llm.generate(
-        batch_inputs,
+        prompt_builder.prompts(conversations),  # type: ignore
         sampling_params=SamplingParams(
             max_tokens=gen_max_tokens,
             temperature=0.0,
@@ -162,22 +166,28 @@ def main():
     """Main function to process JSONL and generate questions using vLLM with chat template."""
     args = parse_args()
 
-    # Initialize tokenizer and vLLM
-    tokenizer = load_tokenizer(args.model_path)
-    llm = LLM(model=args.model_path, tensor_parallel_size=args.tensor_parallel_size)
-
-    # Get prompt template
-    prompt_template = get_prompt_template(args.lang)
-
-    # Read input JSONL
-    lines = read_jsonl(args.input_jsonl)
-
-    # Process in batches
-    for start_idx in range(0, len(lines), args.batch_size):
-        batch_lines = lines[start_idx : start_idx + args.batch_size]
-        processed_lines = process_batch(batch_lines, tokenizer, llm, prompt_template, args.gen_max_tokens)
-        if processed_lines:
-            save_to_jsonl(args.output_jsonl, processed_lines)
+    if args.data_parallel_size > 1 and get_replica() is None:
+        launch_data_parallel(args.data_parallel_size, args.tensor_parallel_size, [Path(args.output_jsonl)])
+        return
+
+    # Initialize prompt builder and vLLM
+    with PromptBuilder(args.model_path, num_workers=args.num_tokenizer_workers) as prompt_builder:
+        llm = LLM(model=args.model_path, tensor_parallel_size=args.tensor_parallel_size)
+
+        # Get prompt template
+        prompt_template = get_prompt_template(args.lang)
+
+        # Stream input JSONL in batches, skipping lines completed by a previous run
+        with JsonlCheckpoint(
+            replica_output_path(args.output_jsonl),
+            resume=not args.no_resume,
+            fsync_interval=args.fsync_interval,
+            background=True,
+        ) as checkpoint:
+            for batch in batched(checkpoint.pending(iter_replica_jsonl(args.input_jsonl)), args.batch_size):
+                batch_lines = [item for _, item in batch]
+                processed_lines = process_batch(batch_lines, prompt_builder, llm, prompt_template, args.gen_max_tokens)
+                checkpoint.write(processed_lines, [line_idx for line_idx, _ in batch])
 
 
 if __name__ == "__main__":
@@ -1,9 +1,12 @@
 import argparse
-import json
-import os
-from typing import Dict, List, Union
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Union
 from vllm import LLM, SamplingParams
-from transformers import AutoTokenizer, PreTrainedTokenizer
+
+from pipelines.common.checkpoint import JsonlCheckpoint
+from pipelines.common.data_parallel import get_replica, iter_replica_jsonl, launch_data_parallel, replica_output_path
+from pipelines.common.jsonl import batched
+from pipelines.common.prompt_builder import PromptBuilder
 
 # Define the prompt templates for translating both question and code as message structures for chat templates
 
@@ -214,58 +217,38 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument(
         "--tensor-parallel-size", type=int, default=1, help="Tensor parallel size for vLLM model (default: 1)."
     )
+    parser.add_argument(
+        "--data-parallel-size",
+        type=int,
+        default=1,
+        help="Number of engine replicas, each using --tensor-parallel-size GPUs (default: 1).",
+    )
+    parser.add_argument(
+        "--num-tokenizer-workers",
+        type=int,
+        default=8,
+        help="Number of CPU processes rendering and tokenizing prompts (default: 8).",
+    )
+    parser.add_argument(
+        "--group-by-template",
+        action="store_true",
+        help="Enable prefix caching and schedule question and code prompts grouped by template, so each "
+        "template's few-shot preamble is computed once instead of once per row.",
+    )
+    parser.add_argument(
+        "--no-resume",
+        action="store_true",
+        help="Ignore progress recorded in <output-jsonl>.progress and start over.",
+    )
+    parser.add_argument(
+        "--fsync-interval",
+        type=float,
+        default=None,
+        help="Seconds between fsyncs of the output and progress files (default: off).",
+    )
     return parser.parse_args()
 
 
-def load_tokenizer(model_path: str) -> PreTrainedTokenizer:
-    """Load and return a tokenizer for the specified model.
-
-    Args:
-        model_path (str): Path to the model directory containing tokenizer configuration.
-
-    Returns:
-        PreTrainedTokenizer: Loaded tokenizer instance for the specified model.
-
-    Raises:
-        Exception: If the tokenizer cannot be loaded from the model path.
-    """
-    tokenizer = AutoTokenizer.from_pretrained(model_path)
-    return tokenizer
-
-
-def read_jsonl(file_path: str) -> List[Dict[str, Union[str, List]]]:
-    """Read and parse JSONL file into a list of dictionaries.
-
-    Args:
-        file_path (str): Path to the JSONL file to be read.
-
-    Returns:
-        List[Dict[str, Union[str, List]]]: List of dictionaries parsed from the JSONL file.
-
-    Raises:
-        FileNotFoundError: If the input file does not exist.
-        json.JSONDecodeError: If any line in the JSONL file is invalid JSON.
-    """
-    with open(file_path, "r", encoding="utf-8") as f:
-        return [json.loads(line) for line in f]
-
-
-def save_to_jsonl(file_path: str, data_list: List[Dict[str, Union[str, List]]]) -> None:
-    """Append data to a JSONL file.
-
-    Args:
-        file_path (str): Path to the output JSONL file.
-        data_list (List[Dict[str, Union[str, List]]]): List of dictionaries to append to the file.
-
-    Raises:
-        IOError: If there is an error writing to the file.
-    """
-    mode = "a" if os.path.exists(file_path) else "w"
-    with open(file_path, mode, encoding="utf-8") as f:
-        for entry in data_list:
-            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
-
-
 def parse_generated_text(text: str, sub_mode: str) -> Dict[str, str]:
     """Parse generated text based on sub-mode (question or code).
 
@@ -311,17 +294,23 @@ def parse_generated_text(text: str, sub_mode: str) -> Dict[str, str]:
 
 def process_batch(
     batch_lines: List[Dict[str, Union[str, List]]],
-    tokenizer: PreTrainedTokenizer,
+    prompt_builder: PromptBuilder,
     llm: LLM,
     gen_max_tokens: int,
+    group_by_template: bool = False,
+    warmed_templates: Optional[Set[str]] = None,
 ) -> List[Dict[str, Union[str, List]]]:
     """Process a batch of JSONL lines and generate translations for both questions and code docstrings/comments.
 
     Args:
         batch_lines (List[Dict[str, Union[str, List]]]): Batch of input data from JSONL, each containing 'question' and 'answer' keys.
-        tokenizer (PreTrainedTokenizer): Tokenizer for formatting prompts with chat templates.
+        prompt_builder (PromptBuilder): Renders chat templates and tokenizes prompts for vLLM.
         llm (LLM): vLLM instance for generating translations.
         gen_max_tokens (int): Maximum number of tokens for generated output.
+        group_by_template (bool): Submit requests grouped by template and prefill each template's shared
+            few-shot preamble once, before the first batch using it, so later requests hit the prefix cache.
+        warmed_templates (Optional[Set[str]]): Templates already prefilled in this run; updated in place.
+            Shared across batches so the warm-up happens once per run rather than once per batch.
 
     Returns:
         List[Dict[str, Union[str, List]]]: List of processed dictionaries with translated 'question' and 'answer' fields.
@@ -329,7 +318,7 @@ def process_batch(
     Raises:
         ValueError: If prompt construction or parsing fails.
     """
-    batch_inputs: List[str] = []
+    conversations: List[List[Dict[str, str]]] = []
     valid_indices: List[int] = []
     sub_modes: List[str] = []  # Track whether each input is for 'question' or 'code'
 
@@ -347,8 +336,7 @@ def process_batch(
                 if msg["role"] == "user":
                     # Use string concatenation to avoid .format() issues with curly braces
                     msg["content"] = msg["content"].replace("{QUESTION_CONTENT}", question_content.strip())
-            prompt = tokenizer.apply_chat_template(formatted_messages, tokenize=False, add_generation_prompt=True)
-            batch_inputs.append(prompt)
+            conversations.append(formatted_messages)
             valid_indices.append(local_idx)
             sub_modes.append("question")
 
@@ -359,17 +347,36 @@ def process_batch(
                 if msg["role"] == "user":
                     # Use string concatenation to avoid .format() issues with curly braces
                     msg["content"] = msg["content"].replace("{CODE_CONTENT}", code_content.strip())
-            prompt = tokenizer.apply_chat_template(formatted_messages, tokenize=False, add_generation_prompt=True)
-            batch_inputs.append(prompt)
+            conversations.append(formatted_messages)
             valid_indices.append(local_idx)
             sub_modes.append("code")
 
-    if not batch_inputs:
+    if not conversations:
         return []
 
-    # Generate outputs using vLLM
+    if group_by_template:
+        # Stable sort keeps line order within each template while making requests sharing a prefix adjacent
+        order = sorted(range(len(sub_modes)), key=lambda i: sub_modes[i])
+        conversations = [conversations[i] for i in order]
+        valid_indices = [valid_indices[i] for i in order]
+        sub_modes = [sub_modes[i] for i in order]
+
+    prompts = prompt_builder.prompts(conversations)
+
+    if group_by_template:
+        # Requests prefilled in the same step cannot reuse each other's blocks, so the first batch of a
+        # template computes one prompt of it first; the preamble then stays cached, being hit by every batch
+        if warmed_templates is None:
+            warmed_templates = set()
+        cold_templates = [sub_mode for sub_mode in dict.fromkeys(sub_modes) if sub_mode not in warmed_templates]
+        if cold_templates:
+            warmup_prompts = [prompts[sub_modes.index(sub_mode)] for sub_mode in cold_templates]
+            llm.generate(warmup_prompts, sampling_params=SamplingParams(max_tokens=1), use_tqdm=False)  # type: ignore
+            warmed_templates.update(cold_templates)
+
+    # Generate outputs using vLLM from pre-tokenized prompts
     outputs = llm.generate(
-        batch_inputs,
+        prompts,  # type: ignore
         sampling_params=SamplingParams(
             max_tokens=gen_max_tokens,
             temperature=0.0,
@@ -421,19 +428,37 @@ def main() -> None:
     """
     args = parse_args()
 
-    # Initialize tokenizer and vLLM
-    tokenizer = load_tokenizer(args.model_path)
-    llm = LLM(model=args.model_path, tensor_parallel_size=args.tensor_parallel_size)
-
-    # Read input JSONL
-    lines = read_jsonl(args.input_jsonl)
-
-    # Process in batches
-    for start_idx in range(0, len(lines), args.batch_size):
-        batch_lines = lines[start_idx : start_idx + args.batch_size]
-        processed_lines = process_batch(batch_lines, tokenizer, llm, args.gen_max_tokens)
-        if processed_lines:
-            save_to_jsonl(args.output_jsonl, processed_lines)
+    if args.data_parallel_size > 1 and get_replica() is None:
+        launch_data_parallel(args.data_parallel_size, args.tensor_parallel_size, [Path(args.output_jsonl)])
+        return
+
+    # Initialize prompt builder and vLLM
+    with PromptBuilder(args.model_path, num_workers=args.num_tokenizer_workers) as prompt_builder:
+        llm = LLM(
+            model=args.model_path,
+            tensor_parallel_size=args.tensor_parallel_size,
+            enable_prefix_caching=True if args.group_by_template else None,
+        )
+
+        warmed_templates: Set[str] = set()
+        # Stream input JSONL in batches, skipping lines completed by a previous run
+        with JsonlCheckpoint(
+            replica_output_path(args.output_jsonl),
+            resume=not args.no_resume,
+            fsync_interval=args.fsync_interval,
+            background=True,
+        ) as checkpoint:
+            for batch in batched(checkpoint.pending(iter_replica_jsonl(args.input_jsonl)), args.batch_size):
+                batch_lines = [item for _, item in batch]
+                processed_lines = process_batch(
+                    batch_lines,
+                    prompt_builder,
+                    llm,
+                    args.gen_max_tokens,
+                    group_by_template=args.group_by_template,
+                    warmed_templates=warmed_templates,
+                )
+                checkpoint.write(processed_lines, [line_idx for line_idx, _ in batch])
 
 
 if __name__ == "__main__":
@@ -50,4 +50,5 @@ python pipelines/swallow_code/accepted/translate.py \
   --output-jsonl "$OUTPUT_FILE_PATH" \
   --gen-max-tokens 65536 \
   --batch-size 4096 \
-  --tensor-parallel-size 1
+  --tensor-parallel-size 1 \
+  --group-by-template
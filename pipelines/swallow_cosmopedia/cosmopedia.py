@@ -1,7 +1,14 @@
-import json
 import time
 from pathlib import Path
-from typing import Any, Iterator
+from typing import TYPE_CHECKING
+
+from pipelines.common.checkpoint import JsonlCheckpoint
+from pipelines.common.data_parallel import get_replica, iter_replica_jsonl, launch_data_parallel, replica_output_path
+from pipelines.common.jsonl import batched
+from pipelines.common.prompt_builder import PromptBuilder
+
+if TYPE_CHECKING:
+    from vllm import LLM
 
 SYSTEM_PROMPT = """You are an expert educational content creator tasked with writing high-quality, engaging, and rigorous educational content for a textbook or similar resource. The content is intended for a specified audience (e.g., high school students, college students, professionals) and a specific subject area (e.g., mathematics, history, engineering, or others). Your task is to create a detailed sub-unit, lesson, or section that aligns with the provided topic, audience, and subject, building on any prior context or chapters mentioned. The content must be tailored to the audience's age, knowledge level, and interests, using appropriate language and examples while maintaining a narrative-driven, engaging tone and a practical, applied approach.
 """
@@ -15,11 +22,52 @@ class DataGenerationPipeline:
         model_name: str,
         tensor_parallel_size: int = 1,
         model_max_length: int = 131072,
+        num_tokenizer_workers: int = 1,
     ):
         self.model_name = model_name
         self.tensor_parallel_size = tensor_parallel_size
         self.model_max_length = model_max_length
         self.enable_thinking = True
+        self.prompt_builder = PromptBuilder(model_name, num_workers=num_tokenizer_workers)
+        self._llm: "LLM | None" = None
+
+    def load(self) -> "LLM":
+        """Create the vLLM engine once; later calls reuse the same instance"""
+        if self._llm is None:
+            from vllm import LLM
+
+            self._llm = LLM(
+                model=self.model_name,
+                tensor_parallel_size=self.tensor_parallel_size,
+                max_model_len=self.model_max_length,
+            )
+        return self._llm
+
+    def close(self) -> None:
+        """Release the vLLM engine and the GPU memory it holds"""
+        self.prompt_builder.close()
+        if self._llm is None:
+            return
+
+        import gc
+
+        import torch
+        from vllm.distributed.parallel_state import destroy_distributed_environment, destroy_model_parallel
+
+        del self._llm
+        self._llm = None
+        destroy_model_parallel()
+        destroy_distributed_environment()
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def __enter__(self) -> "DataGenerationPipeline":
+        self.load()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
 
     def set_thinking_mode(self, enable: bool):
         """Set thinking mode on/off"""
@@ -34,34 +82,28 @@ class DataGenerationPipeline:
     ) -> list[str]:
         """
         Generate responses from prompts using the language model
-        This method should be implemented based on your specific model interface
+        The engine is created on first use and reused for every following batch
         """
-        from vllm import LLM, SamplingParams
+        from vllm import SamplingParams
 
-        llm = LLM(
-            model=self.model_name,
-            tensor_parallel_size=self.tensor_parallel_size,
-            max_model_len=self.model_max_length,
-        )
+        llm = self.load()
 
         sampling_params = SamplingParams(temperature=temperature, top_p=top_p, max_tokens=max_new_tokens)
 
-        # Apply chat template with thinking mode
-        formatted_prompts = []
-        for prompt in prompts:
-            messages = [
+        # Apply chat template with thinking mode and tokenize once, off the engine
+        conversations = [
+            [
                 {"role": "system", "content": SYSTEM_PROMPT},
                 {"role": "user", "content": prompt},
             ]
-            formatted_prompt = llm.get_tokenizer().apply_chat_template(
-                messages,  # type: ignore
-                tokenize=False,
-                add_generation_prompt=True,
-                enable_thinking=self.enable_thinking,
-            )
-            formatted_prompts.append(formatted_prompt)
+            for prompt in prompts
+        ]
+        tokenized_prompts = self.prompt_builder.prompts(
+            conversations,
+            chat_template_kwargs={"enable_thinking": self.enable_thinking},
+        )
 
-        outputs = llm.generate(formatted_prompts, sampling_params)
+        outputs = llm.generate(tokenized_prompts, sampling_params)  # type: ignore
         return [output.outputs[0].text for output in outputs]
 
 
@@ -70,28 +112,16 @@ def get_generation_pipeline(
     tensor_parallel_size: int = 1,
     model_max_length: int = 131072,
     enable_thinking: bool = True,
+    num_tokenizer_workers: int = 1,
 ) -> DataGenerationPipeline:
     """Get data generation pipeline with thinking mode configuration"""
 
-    pipeline = DataGenerationPipeline(model_name, tensor_parallel_size, model_max_length)
+    pipeline = DataGenerationPipeline(model_name, tensor_parallel_size, model_max_length, num_tokenizer_workers)
     pipeline.set_thinking_mode(enable_thinking)
 
     return pipeline
 
 
-def stream_jsonl(file_path: Path, batch_size: int = 1024) -> Iterator[list[dict[str, Any]]]:
-    """Stream JSONL file in batches"""
-    batch = []
-    with file_path.open("r", encoding="utf-8") as fin:
-        for line in fin:
-            batch.append(json.loads(line))
-            if len(batch) >= batch_size:
-                yield batch
-                batch = []
-        if batch:  # return remaining data
-            yield batch
-
-
 def llm_data_generation(
     input_path: Path,
     output_path: Path,
@@ -103,6 +133,9 @@ def llm_data_generation(
     prompt_key: str = "prompt",
     output_key: str = "generated_text",
     max_new_tokens: int = 16384,
+    resume: bool = True,
+    num_tokenizer_workers: int = 1,
+    fsync_interval: float | None = None,
 ) -> None:
     """Generate data using LLM based on prompts from input JSONL"""
 
@@ -111,6 +144,7 @@ def llm_data_generation(
         tensor_parallel_size=tensor_parallel_size,
         model_max_length=model_max_length,
         enable_thinking=enable_thinking,
+        num_tokenizer_workers=num_tokenizer_workers,
     )
 
     total_items = 0
@@ -123,8 +157,23 @@ def llm_data_generation(
     print(f"Output key: '{output_key}'")
     print(f"Max new tokens: {max_new_tokens}")
 
-    with output_path.open("w", encoding="utf-8") as fout:
-        for batch in stream_jsonl(input_path, batch_size):
+    # in a data-parallel run each replica writes its own shard, merged by launch_data_parallel
+    output_path = replica_output_path(output_path)
+    with (
+        pipeline,
+        JsonlCheckpoint(output_path, resume=resume, fsync_interval=fsync_interval, background=True) as checkpoint,
+    ):
+        if checkpoint.done:
+            print(f"Resuming: {len(checkpoint.done)} items already completed in {output_path}")
+
+        offset = 0
+        for batch in batched(iter_replica_jsonl(input_path), batch_size):
+            pending = list(checkpoint.pending(batch, start=offset))
+            offset += len(batch)
+            if not pending:
+                continue
+            indices = [index for index, _ in pending]
+            batch = [item for _, item in pending]
             total_items += len(batch)
             print(f"Processing batch of {len(batch)} items...")
 
@@ -142,36 +191,31 @@ def llm_data_generation(
 
             if not prompts:
                 print("No valid prompts found in batch, skipping...")
+                checkpoint.write([], indices)
                 continue
 
-            # Generate responses using the pipeline
-            try:
-                generated_texts = pipeline.generate_from_prompts(
-                    prompts,
-                    max_new_tokens=max_new_tokens,
-                )
-
-                # Write results to output file
-                for item, generated_text in zip(valid_items, generated_texts):
-                    item[output_key] = generated_text
-                    item["generation_metadata"] = {
-                        "model_name": model_name,
-                        "enable_thinking": enable_thinking,
-                        "max_new_tokens": max_new_tokens,
-                        "timestamp": time.time(),
-                    }
-                    fout.write(json.dumps(item, ensure_ascii=False) + "\n")
-
-            except Exception as e:
-                print(f"Error during generation: {e}")
-                # Write original items without generated text in case of error
-                for item in valid_items:
-                    item[output_key] = ""
-                    item["generation_error"] = str(e)
-                    fout.write(json.dumps(item, ensure_ascii=False) + "\n")
+            # Generate responses using the pipeline; a failure propagates so the batch stays pending for a resumed run
+            generated_texts = pipeline.generate_from_prompts(
+                prompts,
+                max_new_tokens=max_new_tokens,
+            )
+
+            for item, generated_text in zip(valid_items, generated_texts):
+                item[output_key] = generated_text
+                item["generation_metadata"] = {
+                    "model_name": model_name,
+                    "enable_thinking": enable_thinking,
+                    "max_new_tokens": max_new_tokens,
+                    "timestamp": time.time(),
+                }
+
+            # Write results to output file
+            checkpoint.write(valid_items, indices)
 
     actual_time = time.time() - start_time
-    print(f"LLM data generation completed: {actual_time:.1f}s total ({actual_time / total_items:.3f}s per item)")
+    print(
+        f"LLM data generation completed: {actual_time:.1f}s total ({actual_time / max(total_items, 1):.3f}s per item)"
+    )
 
 
 # === CLI Entrypoint ===
@@ -197,6 +241,12 @@ if __name__ == "__main__":
         default=1,
         help="Number of GPUs to use for tensor parallelism",
     )
+    parser.add_argument(
+        "--data-parallel-size",
+        type=int,
+        default=1,
+        help="Number of engine replicas, each using --tensor-parallel-size GPUs on its own slice of the input",
+    )
     parser.add_argument("--model-max-length", type=int, default=40960, help="Maximum model length")
     parser.add_argument(
         "--enable-thinking",
@@ -228,6 +278,24 @@ if __name__ == "__main__":
         default=20480,
         help="Maximum number of new tokens to generate",
     )
+    parser.add_argument(
+        "--num-tokenizer-workers",
+        type=int,
+        default=8,
+        help="Number of CPU processes rendering and tokenizing prompts",
+    )
+    parser.add_argument(
+        "--fsync-interval",
+        type=float,
+        default=None,
+        help="Seconds between fsyncs of the output and progress files",
+    )
+    parser.add_argument(
+        "--no-resume",
+        action="store_true",
+        default=False,
+        help="Ignore progress recorded in <output-jsonl>.progress and start over",
+    )
 
     args = parser.parse_args()
 
@@ -238,15 +306,21 @@ if __name__ == "__main__":
     elif args.enable_thinking:
         enable_thinking = True
 
-    llm_data_generation(
-        input_path=args.input_jsonl,
-        output_path=args.output_jsonl,
-        model_name=args.model,
-        batch_size=args.batch_size,
-        tensor_parallel_size=args.tensor_parallel_size,
-        model_max_length=args.model_max_length,
-        enable_thinking=enable_thinking,
-        prompt_key=args.prompt_key,
-        output_key=args.output_key,
-        max_new_tokens=args.max_new_tokens,
-    )
+    if args.data_parallel_size > 1 and get_replica() is None:
+        launch_data_parallel(args.data_parallel_size, args.tensor_parallel_size, merge_paths=[args.output_jsonl])
+    else:
+        llm_data_generation(
+            input_path=args.input_jsonl,
+            output_path=args.output_jsonl,
+            model_name=args.model,
+            batch_size=args.batch_size,
+            tensor_parallel_size=args.tensor_parallel_size,
+            model_max_length=args.model_max_length,
+            enable_thinking=enable_thinking,
+            prompt_key=args.prompt_key,
+            output_key=args.output_key,
+            max_new_tokens=args.max_new_tokens,
+            resume=not args.no_resume,
+            num_tokenizer_workers=args.num_tokenizer_workers,
+            fsync_interval=args.fsync_interval,
+        )
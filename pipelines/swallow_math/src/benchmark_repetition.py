@@ -0,0 +1,77 @@
+import argparse
+import re
+import time
+from itertools import islice
+
+from pipelines.common.jsonl import iter_jsonl
+from pipelines.swallow_math.src.filter import extract_and_format_text
+from pipelines.swallow_math.src.repetition import has_repetitions
+
+REPETITION_REGEX = re.compile(r"(.+?)\1{9,}")
+
+
+def summarize(name: str, timings: list[float]) -> None:
+    if not timings:
+        print(f"{name}: no documents")
+        return
+    timings = sorted(timings)
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    print(
+        f"{name}: {len(timings)} docs, total {sum(timings):.2f}s, mean {sum(timings) / len(timings) * 1000:.2f}ms, "
+        f"p99 {p99 * 1000:.2f}ms, max {timings[-1] * 1000:.2f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the repetition detector against the original regex filter.")
+    parser.add_argument("--input-jsonl", type=str, required=True, help="Math rewrite output JSONL.")
+    parser.add_argument(
+        "--filter-target-jsonl-key",
+        type=str,
+        default="llm_extracted_math_text",
+        help="JSONL key to filter on",
+    )
+    parser.add_argument("--limit", type=int, default=None, help="Only benchmark the first N documents.")
+    parser.add_argument(
+        "--regex-max-chars",
+        type=int,
+        default=20000,
+        help="Skip the regex on longer documents, which can take minutes each (0: never skip)",
+    )
+    parser.add_argument("--min-repetition-period", type=int, default=1)
+    parser.add_argument("--max-repetition-period", type=int, default=None)
+    args = parser.parse_args()
+
+    detector_timings: list[float] = []
+    regex_timings: list[float] = []
+    detector_flagged, regex_flagged, compared, mismatches = 0, 0, 0, 0
+
+    for data in islice(iter_jsonl(args.input_jsonl), args.limit):
+        text = extract_and_format_text(data.get(args.filter_target_jsonl_key, ""))
+        if not text:
+            continue
+
+        start = time.perf_counter()
+        flagged = has_repetitions(text, min_period=args.min_repetition_period, max_period=args.max_repetition_period)
+        detector_timings.append(time.perf_counter() - start)
+        detector_flagged += flagged
+
+        if args.regex_max_chars and len(text) > args.regex_max_chars:
+            continue
+        start = time.perf_counter()
+        regex_match = REPETITION_REGEX.search(text) is not None
+        regex_timings.append(time.perf_counter() - start)
+        regex_flagged += regex_match
+        compared += 1
+        if regex_match != flagged:
+            mismatches += 1
+            print(f"Mismatch at {data.get('id', compared)}: regex={regex_match} detector={flagged}")
+
+    summarize("detector", detector_timings)
+    summarize("regex", regex_timings)
+    print(f"Flagged: detector {detector_flagged}/{len(detector_timings)}, regex {regex_flagged}/{compared}")
+    print(f"Mismatches on {compared} documents checked by both: {mismatches}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,107 @@
 import json
 import argparse
+import re
 import time
 from pathlib import Path
 from multiprocessing import Pool, cpu_count
-from typing import Any, Dict, Tuple, Optional
-from transformers import AutoTokenizer
+from typing import Any, Dict, List, Tuple, Optional
+from transformers import AutoTokenizer, PreTrainedTokenizerBase
 
+from pipelines.common.jsonl import batched
+from pipelines.common.token_cache import TokenCountCache, tokenizer_fingerprint
 
-def process_file_math_filter(args: Tuple[Path, Path, str, int]) -> Dict[str, Any]:
+
+def truncate_at_whitespace(text: str, max_chars: int) -> str:
+    """Cut text to at most `max_chars` characters without splitting a word; return it unchanged if impossible"""
+    if len(text) <= max_chars:
+        return text
+    match = re.search(r"\s\S*$", text[:max_chars])
+    return text[: match.start()] if match else text
+
+
+def count_tokens(
+    tokenizer: PreTrainedTokenizerBase,
+    texts: List[str],
+    max_tokens: int,
+    cutoff_chars_per_token: int = 4,
+) -> List[Tuple[int, bool]]:
+    """Count tokens for a batch of texts with the fast tokenizer's batch API.
+
+    Returns (token count, exact) per text. Texts longer than `max_tokens * cutoff_chars_per_token`
+    characters are first counted on a prefix cut at whitespace; if the prefix alone exceeds `max_tokens`
+    the text is over the limit and its (lower bound) prefix count is returned without encoding the rest.
+    """
+    if cutoff_chars_per_token > 0:
+        prefixes = [truncate_at_whitespace(text, max_tokens * cutoff_chars_per_token) for text in texts]
+    else:
+        prefixes = texts
+    counts = [len(ids) for ids in tokenizer(prefixes, return_attention_mask=False)["input_ids"]]
+    results = [(count, True) for count in counts]
+
+    retry = []
+    for i, (text, prefix) in enumerate(zip(texts, prefixes)):
+        if len(prefix) < len(text):
+            if counts[i] > max_tokens:
+                results[i] = (counts[i], False)
+            else:
+                retry.append(i)
+    if retry:
+        full_ids = tokenizer([texts[i] for i in retry], return_attention_mask=False)["input_ids"]
+        for i, ids in zip(retry, full_ids):
+            results[i] = (len(ids), True)
+    return results
+
+
+def count_tokens_cached(
+    tokenizer: PreTrainedTokenizerBase,
+    texts: List[str],
+    max_tokens: int,
+    cutoff_chars_per_token: int,
+    cache: Optional[TokenCountCache],
+) -> List[Tuple[int, bool]]:
+    """count_tokens, answering from `cache` where possible and storing new counts in it
+
+    A cached lower bound is only used when it already exceeds `max_tokens`.
+    """
+    if cache is None:
+        return count_tokens(tokenizer, texts, max_tokens, cutoff_chars_per_token)
+
+    results = cache.get(texts)
+    missing = [i for i, cached in enumerate(results) if cached is None or (not cached[1] and cached[0] <= max_tokens)]
+    if missing:
+        counted = count_tokens(tokenizer, [texts[i] for i in missing], max_tokens, cutoff_chars_per_token)
+        cache.put([texts[i] for i in missing], counted)
+        for i, result in zip(missing, counted):
+            results[i] = result
+    return results  # type: ignore[return-value]
+
+
+def process_file_math_filter(
+    args: Tuple[Path, Path, str, int, int, int, Optional[Path], int],
+) -> Dict[str, Any]:
     """Process a single file and filter based on math token length"""
-    input_file, output_dir, tokenizer_path, max_tokens = args
+    (
+        input_file,
+        output_dir,
+        tokenizer_path,
+        max_tokens,
+        batch_size,
+        cutoff_chars_per_token,
+        token_cache_path,
+        token_cache_size_mb,
+    ) = args
 
     # Load tokenizer for this worker
     tokenizer = AutoTokenizer.from_pretrained(tokenizer_path)
+    cache = None
+    if token_cache_path is not None:
+        cache = TokenCountCache(token_cache_path, tokenizer_fingerprint(tokenizer, "encode"), token_cache_size_mb)
 
-    filtered_items = []
     file_stats = {
         "total_items": 0,
         "items_kept": 0,
         "items_filtered": 0,
+        "items_cut_off": 0,
         "avg_tokens_kept": 0.0,
         "avg_tokens_filtered": 0.0,
         "max_tokens_seen": 0,
@@ -29,31 +112,40 @@ def process_file_math_filter(args: Tuple[Path, Path, str, int]) -> Dict[str, Any
     total_tokens_kept = 0
     total_tokens_filtered = 0
 
-    with input_file.open("r", encoding="utf-8") as fin:
-        for line in fin:
-            item = json.loads(line)
-            file_stats["total_items"] += 1
+    # Write filtered results as they are produced instead of holding the whole file in memory
+    file_stem = input_file.stem
+    output_file = output_dir / f"{file_stem}.jsonl"
+
+    with input_file.open("r", encoding="utf-8") as fin, output_file.open("w", encoding="utf-8") as fout:
+        for batch in batched(map(json.loads, fin), batch_size):
+            file_stats["total_items"] += len(batch)
 
-            # Get text content for token counting
-            text = item.get("text", "")
-            if not text:
-                # Skip items without text content
-                file_stats["items_filtered"] += 1
+            # Skip items without text content
+            items = [item for item in batch if item.get("text", "")]
+            file_stats["items_filtered"] += len(batch) - len(items)
+            if not items:
                 continue
 
             # Count tokens
-            token_count = len(tokenizer.encode(text))
-            file_stats["max_tokens_seen"] = max(file_stats["max_tokens_seen"], token_count)
-
-            if token_count <= max_tokens:
-                # Keep item
-                filtered_items.append(item)
-                file_stats["items_kept"] += 1
-                total_tokens_kept += token_count
-            else:
-                # Filter out item
-                file_stats["items_filtered"] += 1
-                total_tokens_filtered += token_count
+            token_counts = count_tokens_cached(
+                tokenizer, [item["text"] for item in items], max_tokens, cutoff_chars_per_token, cache
+            )
+            for item, (token_count, exact) in zip(items, token_counts):
+                file_stats["max_tokens_seen"] = max(file_stats["max_tokens_seen"], token_count)
+
+                if token_count <= max_tokens:
+                    # Keep item
+                    fout.write(json.dumps(item, ensure_ascii=False) + "\n")
+                    file_stats["items_kept"] += 1
+                    total_tokens_kept += token_count
+                else:
+                    # Filter out item
+                    file_stats["items_filtered"] += 1
+                    file_stats["items_cut_off"] += not exact
+                    total_tokens_filtered += token_count
+
+    if cache is not None:
+        cache.close()
 
     # Calculate averages
     if file_stats["items_kept"] > 0:
@@ -61,14 +153,6 @@ def process_file_math_filter(args: Tuple[Path, Path, str, int]) -> Dict[str, Any
     if file_stats["items_filtered"] > 0:
         file_stats["avg_tokens_filtered"] = total_tokens_filtered / file_stats["items_filtered"]
 
-    # Write filtered results
-    file_stem = input_file.stem
-    output_file = output_dir / f"{file_stem}.jsonl"
-
-    with output_file.open("w", encoding="utf-8") as fout:
-        for item in filtered_items:
-            fout.write(json.dumps(item, ensure_ascii=False) + "\n")
-
     return {
         "input_file": input_file.name,
         "output_file": output_file.name,
@@ -82,6 +166,10 @@ def math_length_filter(
     tokenizer_path: str,
     max_tokens: int = 20480,
     workers: Optional[int] = None,
+    batch_size: int = 1024,
+    cutoff_chars_per_token: int = 4,
+    token_cache_path: Optional[Path] = None,
+    token_cache_size_mb: int = 1024,
 ) -> None:
     """
     Filter math JSONL files based on token length with multiprocessing.
@@ -92,6 +180,11 @@ def math_length_filter(
         tokenizer_path: HuggingFace tokenizer model path
         max_tokens: Maximum token count allowed (default: 20480)
         workers: Number of worker processes (default: CPU count)
+        batch_size: Number of texts tokenized per batch call
+        cutoff_chars_per_token: Count only a prefix of max_tokens * this many characters first and stop if it is
+            already over the limit (0: always count the full text)
+        token_cache_path: Token count cache file shared by all workers and runs (default: no cache)
+        token_cache_size_mb: Size of the token count cache file when it is created
     """
 
     # Ensure output directory exists
@@ -115,8 +208,25 @@ def math_length_filter(
     workers = min(workers, len(jsonl_files))
     print(f"Using {workers} workers for parallel processing")
 
+    # Create the cache file once so workers never race to initialize it
+    if token_cache_path is not None:
+        TokenCountCache(token_cache_path, "", token_cache_size_mb).close()
+        print(f"Token count cache: {token_cache_path}")
+
     # Prepare arguments for multiprocessing
-    args_list = [(file_path, output_dir, tokenizer_path, max_tokens) for file_path in jsonl_files]
+    args_list = [
+        (
+            file_path,
+            output_dir,
+            tokenizer_path,
+            max_tokens,
+            batch_size,
+            cutoff_chars_per_token,
+            token_cache_path,
+            token_cache_size_mb,
+        )
+        for file_path in jsonl_files
+    ]
 
     # Process files in parallel
     start_time = time.time()
@@ -130,6 +240,7 @@ def math_length_filter(
         "total_items": 0,
         "items_kept": 0,
         "items_filtered": 0,
+        "items_cut_off": 0,
         "avg_tokens_kept": 0.0,
         "avg_tokens_filtered": 0.0,
         "max_tokens_seen": 0,
@@ -151,6 +262,7 @@ def math_length_filter(
         total_stats["total_items"] += stats["total_items"]
         total_stats["items_kept"] += stats["items_kept"]
         total_stats["items_filtered"] += stats["items_filtered"]
+        total_stats["items_cut_off"] += stats["items_cut_off"]
         total_stats["max_tokens_seen"] = max(total_stats["max_tokens_seen"], stats["max_tokens_seen"])
 
         total_tokens_kept_sum += stats["avg_tokens_kept"] * stats["items_kept"]
@@ -174,6 +286,7 @@ def math_length_filter(
     print(
         f"  Items filtered (>{max_tokens} tokens): {total_stats['items_filtered']} ({total_stats['items_filtered'] / total_stats['total_items'] * 100:.1f}%)"
     )
+    print(f"  Items filtered on a prefix count (early cutoff): {total_stats['items_cut_off']}")
     print(f"  Average tokens (kept items): {total_stats['avg_tokens_kept']:.1f}")
     print(f"  Average tokens (filtered items): {total_stats['avg_tokens_filtered']:.1f}")
     print(f"  Maximum tokens encountered: {total_stats['max_tokens_seen']}")
@@ -217,6 +330,31 @@ def main():
         default=None,
         help="Number of worker processes (default: CPU count)",
     )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1024,
+        help="Number of texts tokenized per batch call (default: 1024)",
+    )
+    parser.add_argument(
+        "--cutoff-chars-per-token",
+        type=int,
+        default=4,
+        help="Count a prefix of max-tokens * N characters first and skip the rest if it is already over the limit "
+        "(0: always count the full text; default: 4)",
+    )
+    parser.add_argument(
+        "--token-cache",
+        type=Path,
+        default=None,
+        help="Token count cache file reused across runs, e.g. with a different --max-tokens (default: no cache)",
+    )
+    parser.add_argument(
+        "--token-cache-size-mb",
+        type=int,
+        default=1024,
+        help="Size of the token count cache file when it is created; older entries are evicted (default: 1024)",
+    )
 
     args = parser.parse_args()
 
@@ -229,6 +367,10 @@ def main():
         tokenizer_path=args.tokenizer,
         max_tokens=args.max_tokens,
         workers=args.workers,
+        batch_size=args.batch_size,
+        cutoff_chars_per_token=args.cutoff_chars_per_token,
+        token_cache_path=args.token_cache,
+        token_cache_size_mb=args.token_cache_size_mb,
     )
 
 
@@ -1,9 +1,22 @@
 import argparse
 import json
 import os
+import time
 from multiprocessing import Pool, cpu_count
-import re
-from typing import Optional
+from typing import Any, Optional
+
+from pipelines.common.jsonl import iter_line_range, ordered_parts
+from pipelines.swallow_math.src.repetition import has_repetitions
+
+
+def extract_math_text(text: str) -> str:
+    """Extract math text from the response"""
+    start_marker = "<|MATH_TEXT|>"
+    start_index = text.find(start_marker)
+    if start_index == -1:
+        return text.strip()
+
+    return text[start_index + len(start_marker) :].strip()
 
 
 def extract_and_format_text(raw_text: str) -> str:
@@ -38,17 +51,6 @@ def extract_and_format_text(raw_text: str) -> str:
     return formatted
 
 
-def has_repetitions(text: str) -> bool:
-    """
-    Detect if the text contains a substring repeated 10+ times consecutively.
-    Returns True if repetitions are found, False otherwise.
-    """
-    # Use regex to find any group that repeats 10 times total (1 + 9 or more)
-    if re.search(r"(.+?)\1{9,}", text):
-        return True
-    return False
-
-
 def has_but_wait(text: str) -> bool:
     """
     Check if the text contains 'But wait' (case-sensitive).
@@ -57,7 +59,12 @@ def has_but_wait(text: str) -> bool:
     return "But wait" in text
 
 
-def process_line(line, filter_key: str) -> Optional[dict[str, str]]:
+def process_line(
+    line,
+    filter_key: str,
+    min_repetition_period: int = 1,
+    max_repetition_period: Optional[int] = None,
+) -> Optional[dict[str, str]]:
     """
     Process a single JSON line.
     """
@@ -66,25 +73,101 @@ def process_line(line, filter_key: str) -> Optional[dict[str, str]]:
         raw_text = data.get(filter_key, "")
         formatted = extract_and_format_text(raw_text)
         # Discard text with repetitions, containing 'But wait', or containing <think> or </think>
-        if formatted and not has_repetitions(formatted) and not has_but_wait(formatted):
+        if (
+            formatted
+            and not has_repetitions(formatted, min_period=min_repetition_period, max_period=max_repetition_period)
+            and not has_but_wait(formatted)
+        ):
             return {"text": formatted}
         return None
     except json.JSONDecodeError:
         return None
 
 
-def process_file(input_path: str, output_path: str, filter_key: str) -> None:
+def process_range(
+    input_path: str,
+    output_path: str,
+    start: int,
+    end: int,
+    filter_key: str,
+    min_repetition_period: int = 1,
+    max_repetition_period: Optional[int] = None,
+) -> dict[str, Any]:
     """
-    Process a single JSONL file.
+    Process the lines in byte range [start, end) of a JSONL file and return chunk statistics.
     """
-    with (
-        open(input_path, "r", encoding="utf-8") as infile,
-        open(output_path, "w", encoding="utf-8") as outfile,
-    ):
-        for line in infile:
-            processed = process_line(line=line.strip(), filter_key=filter_key)
+    begin = time.time()
+    stats: dict[str, Any] = {"input_path": input_path, "start": start, "end": end, "lines": 0, "kept": 0}
+    with open(output_path, "w", encoding="utf-8") as outfile:
+        for line in iter_line_range(input_path, start, end):
+            stats["lines"] += 1
+            processed = process_line(
+                line=line.decode("utf-8").strip(),
+                filter_key=filter_key,
+                min_repetition_period=min_repetition_period,
+                max_repetition_period=max_repetition_period,
+            )
             if processed:
                 outfile.write(json.dumps(processed) + "\n")
+                stats["kept"] += 1
+    stats["seconds"] = time.time() - begin
+    return stats
+
+
+def process_file(
+    input_path: str,
+    output_path: str,
+    filter_key: str,
+    min_repetition_period: int = 1,
+    max_repetition_period: Optional[int] = None,
+) -> dict[str, Any]:
+    """
+    Process a single JSONL file.
+    """
+    return process_range(
+        input_path,
+        output_path,
+        0,
+        os.path.getsize(input_path),
+        filter_key,
+        min_repetition_period,
+        max_repetition_period,
+    )
+
+
+def _process_range_task(task: tuple) -> dict[str, Any]:
+    return process_range(*task)
+
+
+def process_files(
+    input_paths: list[str],
+    output_dir: str,
+    filter_key: str,
+    num_workers: int,
+    chunk_size: int,
+    min_repetition_period: int = 1,
+    max_repetition_period: Optional[int] = None,
+) -> None:
+    """
+    Process JSONL files with a single worker pool, splitting each file into byte ranges of about
+    `chunk_size` bytes on line boundaries so that one large file also keeps every worker busy.
+    Each chunk writes its own part file; parts are concatenated in input order afterwards.
+    """
+    totals: dict[str, dict[str, int]] = {path: {"lines": 0, "kept": 0} for path in input_paths}
+    with ordered_parts(input_paths, output_dir, chunk_size) as chunks:
+        tasks = [(*chunk, filter_key, min_repetition_period, max_repetition_period) for chunk in chunks]
+        print(f"Processing {len(input_paths)} files in {len(tasks)} chunks with {num_workers} workers")
+        with Pool(processes=max(1, min(num_workers, len(tasks)))) as pool:
+            for stats in pool.imap_unordered(_process_range_task, tasks):
+                totals[stats["input_path"]]["lines"] += stats["lines"]
+                totals[stats["input_path"]]["kept"] += stats["kept"]
+                print(
+                    f"{os.path.basename(stats['input_path'])} [{stats['start']}:{stats['end']}]: "
+                    f"kept {stats['kept']}/{stats['lines']} lines in {stats['seconds']:.1f}s"
+                )
+
+    for input_path, total in totals.items():
+        print(f"{input_path}: kept {total['kept']}/{total['lines']} lines")
 
 
 def main():
@@ -105,6 +188,30 @@ def main():
         default="llm_extracted_math_text",
         help="JSONL key to filter on",
     )
+    parser.add_argument(
+        "--min-repetition-period",
+        type=int,
+        default=1,
+        help="Shortest repeated unit (in characters) checked by the repetition filter",
+    )
+    parser.add_argument(
+        "--max-repetition-period",
+        type=int,
+        default=None,
+        help="Longest repeated unit (in characters) checked by the repetition filter (default: unbounded)",
+    )
+    parser.add_argument(
+        "--num-workers",
+        type=int,
+        default=cpu_count(),
+        help="Number of worker processes (default: all CPUs).",
+    )
+    parser.add_argument(
+        "--chunk-size-mb",
+        type=int,
+        default=64,
+        help="Approximate size of the line-aligned byte ranges each file is split into.",
+    )
 
     args = parser.parse_args()
 
@@ -117,32 +224,25 @@ def main():
 
     if args.input_jsonl:
         # Single file mode
-        filename = os.path.basename(args.input_jsonl)
-        output_path = os.path.join(args.output_dir, filename)
-        process_file(
-            input_path=args.input_jsonl,
-            output_path=output_path,
-            filter_key=args.filter_target_jsonl_key,
-        )
-    elif args.input_dir:
-        # Directory mode with multiprocessing
-        files = [f for f in os.listdir(args.input_dir) if f.endswith(".jsonl")]
+        input_paths = [args.input_jsonl]
+    else:
+        # Directory mode
+        files = sorted(f for f in os.listdir(args.input_dir) if f.endswith(".jsonl"))
         if not files:
             print("No JSONL files found in input directory.")
             return
-
-        # Limit processes to min(cpu_count, len(files))
-        num_processes = min(cpu_count(), len(files))
-
-        # Prepare arguments for pool
-        tasks = []
-        for filename in files:
-            input_path = os.path.join(args.input_dir, filename)
-            output_path = os.path.join(args.output_dir, filename)
-            tasks.append((input_path, output_path, args.filter_target_jsonl_key))
-
-        with Pool(processes=num_processes) as pool:
-            pool.starmap(process_file, tasks)
+        input_paths = [os.path.join(args.input_dir, filename) for filename in files]
+
+    # Both modes share one pool over byte-range chunks, so a single large file is split across workers too
+    process_files(
+        input_paths,
+        args.output_dir,
+        filter_key=args.filter_target_jsonl_key,
+        num_workers=args.num_workers,
+        chunk_size=args.chunk_size_mb << 20,
+        min_repetition_period=args.min_repetition_period,
+        max_repetition_period=args.max_repetition_period,
+    )
 
 
 if __name__ == "__main__":
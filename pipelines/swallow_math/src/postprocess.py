@@ -0,0 +1,368 @@
+import argparse
+import json
+import os
+import time
+from collections import Counter
+from multiprocessing import Pool, cpu_count
+from typing import Any, Callable, Optional
+
+from pipelines.common.jsonl import batched, iter_line_range, ordered_parts
+from pipelines.common.token_cache import TokenCountCache, tokenizer_fingerprint
+from pipelines.swallow_math.src.filter import extract_and_format_text, extract_math_text, has_but_wait
+from pipelines.swallow_math.src.repetition import has_repetitions
+
+# A stage maps the working text to its new value, or to None to drop the record. A stage may also have a
+# `batch(texts)` method returning one result per text, which PostProcessor uses to process a batch at once.
+Stage = Callable[[str], Optional[str]]
+
+STAGE_NAMES = ["marker", "extract", "repetition", "but_wait", "length"]
+DEFAULT_STAGES = ["extract", "repetition", "but_wait", "length"]
+
+
+def marker_stage(marker: str) -> Stage:
+    """Keep the text after the last `marker` (tools/swallow_datasets/swallow-math-v2/maker.py)"""
+
+    def stage(text: str) -> Optional[str]:
+        idx = text.rfind(marker)
+        return text if idx == -1 else text[idx + len(marker) :].lstrip()
+
+    return stage
+
+
+def extract_stage(text: str) -> Optional[str]:
+    """Math text extraction and <think> stripping (run.py extract_math_text + filter.py)"""
+    return extract_and_format_text(extract_math_text(text)) or None
+
+
+def repetition_stage(min_period: int = 1, max_period: Optional[int] = None) -> Stage:
+    def stage(text: str) -> Optional[str]:
+        return None if has_repetitions(text, min_period=min_period, max_period=max_period) else text
+
+    return stage
+
+
+def but_wait_stage(text: str) -> Optional[str]:
+    return None if has_but_wait(text) else text
+
+
+class TokenLengthStage:
+    """Drop texts longer than `max_tokens` (content_length_filter.py); the tokenizer is loaded on first use
+
+    Texts are counted in batches with content_length_filter's early length cutoff, and through the shared
+    token count cache when `token_cache_path` is given.
+    """
+
+    def __init__(
+        self,
+        tokenizer_path: str,
+        max_tokens: int,
+        cutoff_chars_per_token: int = 4,
+        token_cache_path: Optional[str] = None,
+        token_cache_size_mb: int = 1024,
+    ) -> None:
+        self.tokenizer_path = tokenizer_path
+        self.max_tokens = max_tokens
+        self.cutoff_chars_per_token = cutoff_chars_per_token
+        self.token_cache_path = token_cache_path
+        self.token_cache_size_mb = token_cache_size_mb
+        self._tokenizer = None
+        self._cache: Optional[TokenCountCache] = None
+
+    def _load(self) -> None:
+        from transformers import AutoTokenizer
+
+        self._tokenizer = AutoTokenizer.from_pretrained(self.tokenizer_path)
+        if self.token_cache_path is not None:
+            fingerprint = tokenizer_fingerprint(self._tokenizer, "encode")
+            self._cache = TokenCountCache(self.token_cache_path, fingerprint, self.token_cache_size_mb)
+
+    def batch(self, texts: list[str]) -> list[Optional[str]]:
+        from pipelines.swallow_math.src.content_length_filter import count_tokens_cached
+
+        if self._tokenizer is None:
+            self._load()
+        counts = count_tokens_cached(self._tokenizer, texts, self.max_tokens, self.cutoff_chars_per_token, self._cache)
+        return [text if count <= self.max_tokens else None for text, (count, _) in zip(texts, counts)]
+
+    def __call__(self, text: str) -> Optional[str]:
+        return self.batch([text])[0]
+
+
+class PostProcessor:
+    """Run a chain of text stages over JSONL records with one JSON decode and encode per record.
+
+    Counters record how many records each stage dropped, next to the number of input, unparsable and
+    kept records, so the effect of every filter stays visible after fusing them into a single pass.
+    """
+
+    def __init__(
+        self,
+        stages: list[tuple[str, Stage]],
+        input_key: str = "llm_output",
+        output_key: str = "text",
+        keep_fields: bool = False,
+    ) -> None:
+        self.stages = stages
+        self.input_key = input_key
+        self.output_key = output_key
+        self.keep_fields = keep_fields
+        self.counters: Counter[str] = Counter()
+
+    def process_records(self, records: list[dict[str, Any]]) -> list[Optional[dict[str, Any]]]:
+        """Run the stages over a batch of records; returns the output record, or None if dropped, per record"""
+        texts = []
+        for record in records:
+            text = record.get(self.input_key, "")
+            texts.append(text if isinstance(text, str) else "")
+
+        alive = list(range(len(records)))
+        for name, stage in self.stages:
+            if not alive:
+                break
+            batch = getattr(stage, "batch", None)
+            if batch is not None:
+                results = batch([texts[i] for i in alive])
+            else:
+                results = [stage(texts[i]) for i in alive]
+            remaining = []
+            for i, result in zip(alive, results):
+                if result is None:
+                    self.counters[f"dropped_{name}"] += 1
+                else:
+                    texts[i] = result
+                    remaining.append(i)
+            alive = remaining
+
+        outputs: list[Optional[dict[str, Any]]] = [None] * len(records)
+        for i in alive:
+            self.counters["kept"] += 1
+            if self.keep_fields:
+                outputs[i] = dict(records[i])
+                outputs[i][self.output_key] = texts[i]
+            else:
+                outputs[i] = {self.output_key: texts[i]}
+        return outputs
+
+    def process_record(self, record: dict[str, Any]) -> Optional[dict[str, Any]]:
+        return self.process_records([record])[0]
+
+    def process_lines(self, lines: list[str | bytes]) -> list[str]:
+        """Return the serialized output lines of the records that were kept, in input order"""
+        self.counters["input"] += len(lines)
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                self.counters["invalid_json"] += 1
+        return [
+            json.dumps(output, ensure_ascii=False) + "\n"
+            for output in self.process_records(records)
+            if output is not None
+        ]
+
+    def process_line(self, line: str | bytes) -> Optional[str]:
+        """Return the serialized output line, or None if the record was dropped"""
+        outputs = self.process_lines([line])
+        return outputs[0] if outputs else None
+
+
+def build_stages(
+    names: list[str],
+    marker: str = "<|MATH_TEXT|>",
+    min_repetition_period: int = 1,
+    max_repetition_period: Optional[int] = None,
+    tokenizer_path: Optional[str] = None,
+    max_tokens: int = 20480,
+    cutoff_chars_per_token: int = 4,
+    token_cache_path: Optional[str] = None,
+    token_cache_size_mb: int = 1024,
+) -> list[tuple[str, Stage]]:
+    """Build stages in the order given by `names`; see STAGE_NAMES"""
+    stages: list[tuple[str, Stage]] = []
+    for name in names:
+        if name == "marker":
+            stages.append((name, marker_stage(marker)))
+        elif name == "extract":
+            stages.append((name, extract_stage))
+        elif name == "repetition":
+            stages.append((name, repetition_stage(min_repetition_period, max_repetition_period)))
+        elif name == "but_wait":
+            stages.append((name, but_wait_stage))
+        elif name == "length":
+            if tokenizer_path is None:
+                raise ValueError("The length stage requires --tokenizer")
+            stages.append(
+                (
+                    name,
+                    TokenLengthStage(
+                        tokenizer_path, max_tokens, cutoff_chars_per_token, token_cache_path, token_cache_size_mb
+                    ),
+                )
+            )
+        else:
+            raise ValueError(f"Unknown stage: {name}. Available stages: {', '.join(STAGE_NAMES)}")
+    return stages
+
+
+_worker_processor: Optional[PostProcessor] = None
+
+
+def _init_worker(processor_kwargs: dict[str, Any], stage_kwargs: dict[str, Any]) -> None:
+    global _worker_processor
+    _worker_processor = PostProcessor(build_stages(**stage_kwargs), **processor_kwargs)
+
+
+def _process_range(task: tuple[str, str, int, int, int]) -> tuple[str, Counter[str], float]:
+    """Process the lines in byte range [start, end) of a JSONL file into `output_path`, `batch_size` at a time"""
+    input_path, output_path, start, end, batch_size = task
+    assert _worker_processor is not None
+    begin = time.time()
+    _worker_processor.counters = Counter()
+    with open(output_path, "w", encoding="utf-8") as fout:
+        lines = (line for line in iter_line_range(input_path, start, end) if line.strip())
+        for batch in batched(lines, batch_size):
+            fout.writelines(_worker_processor.process_lines(batch))
+    return input_path, _worker_processor.counters, time.time() - begin
+
+
+def postprocess_files(
+    input_paths: list[str],
+    output_dir: str,
+    processor_kwargs: dict[str, Any],
+    stage_kwargs: dict[str, Any],
+    num_workers: int,
+    chunk_size: int,
+    batch_size: int = 1024,
+) -> Counter[str]:
+    """Post-process JSONL files in parallel over line-aligned byte ranges, preserving record order"""
+    totals: Counter[str] = Counter()
+    with ordered_parts(input_paths, output_dir, chunk_size) as chunks:
+        tasks = [(*chunk, batch_size) for chunk in chunks]
+        print(f"Processing {len(input_paths)} files in {len(tasks)} chunks with {num_workers} workers")
+        with Pool(
+            processes=max(1, min(num_workers, len(tasks))),
+            initializer=_init_worker,
+            initargs=(processor_kwargs, stage_kwargs),
+        ) as pool:
+            for input_path, counters, seconds in pool.imap_unordered(_process_range, tasks):
+                totals.update(counters)
+                print(
+                    f"{os.path.basename(input_path)}: kept {counters['kept']}/{counters['input']} records "
+                    f"in {seconds:.1f}s"
+                )
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Single-pass math post-processing: extraction, repetition/'But wait' filters, token length "
+        "filter and marker split with one JSON decode/encode per record."
+    )
+    parser.add_argument("--input-dir", type=str, help="Input directory containing JSONL files.")
+    parser.add_argument("--input-jsonl", type=str, help="Single input JSONL file.")
+    parser.add_argument("--output-dir", type=str, required=True, help="Output directory for processed files.")
+    parser.add_argument("--input-key", type=str, default="llm_output", help="JSONL key holding the LLM output")
+    parser.add_argument("--output-key", type=str, default="text", help="JSONL key for the processed text")
+    parser.add_argument(
+        "--keep-fields",
+        action="store_true",
+        help="Keep all input fields and add --output-key (default: write only --output-key)",
+    )
+    parser.add_argument(
+        "--stages",
+        nargs="+",
+        choices=STAGE_NAMES,
+        default=None,
+        help="Stages to run, in order (default: extract repetition but_wait, plus length with --tokenizer)",
+    )
+    parser.add_argument("--marker", type=str, default="<|MATH_TEXT|>", help="Split marker for the marker stage")
+    parser.add_argument("--min-repetition-period", type=int, default=1)
+    parser.add_argument("--max-repetition-period", type=int, default=None)
+    parser.add_argument("--tokenizer", type=str, default=None, help="HuggingFace tokenizer for the length stage")
+    parser.add_argument("--max-tokens", type=int, default=20480, help="Maximum token count allowed")
+    parser.add_argument(
+        "--cutoff-chars-per-token",
+        type=int,
+        default=4,
+        help="Length stage: count only a prefix of max-tokens * this many characters first and drop the text if "
+        "it is already over the limit (0: always count the full text)",
+    )
+    parser.add_argument(
+        "--token-cache",
+        type=str,
+        default=None,
+        help="Token count cache file for the length stage, shared by all workers and runs (default: no cache)",
+    )
+    parser.add_argument(
+        "--token-cache-size-mb",
+        type=int,
+        default=1024,
+        help="Size of the token count cache file when it is created",
+    )
+    parser.add_argument("--batch-size", type=int, default=1024, help="Number of records processed per batch")
+    parser.add_argument("--num-workers", type=int, default=cpu_count(), help="Number of worker processes")
+    parser.add_argument(
+        "--chunk-size-mb",
+        type=int,
+        default=64,
+        help="Approximate size of the line-aligned byte ranges each file is split into.",
+    )
+    args = parser.parse_args()
+
+    if bool(args.input_dir) == bool(args.input_jsonl):
+        raise ValueError("Specify exactly one of --input-dir or --input-jsonl.")
+
+    stage_names = args.stages
+    if stage_names is None:
+        stage_names = [name for name in DEFAULT_STAGES if name != "length" or args.tokenizer]
+    stage_kwargs = {
+        "names": stage_names,
+        "marker": args.marker,
+        "min_repetition_period": args.min_repetition_period,
+        "max_repetition_period": args.max_repetition_period,
+        "tokenizer_path": args.tokenizer,
+        "max_tokens": args.max_tokens,
+        "cutoff_chars_per_token": args.cutoff_chars_per_token,
+        "token_cache_path": args.token_cache,
+        "token_cache_size_mb": args.token_cache_size_mb,
+    }
+    # fail fast on an invalid configuration instead of in every worker
+    build_stages(**stage_kwargs)
+    processor_kwargs = {"input_key": args.input_key, "output_key": args.output_key, "keep_fields": args.keep_fields}
+
+    if args.input_jsonl:
+        input_paths = [args.input_jsonl]
+    else:
+        input_paths = [
+            os.path.join(args.input_dir, f) for f in sorted(os.listdir(args.input_dir)) if f.endswith(".jsonl")
+        ]
+        if not input_paths:
+            print("No JSONL files found in input directory.")
+            return
+    os.makedirs(args.output_dir, exist_ok=True)
+    # Create the cache file once so workers never race to initialize it
+    if args.token_cache is not None and "length" in stage_names:
+        TokenCountCache(args.token_cache, "", args.token_cache_size_mb).close()
+
+    start_time = time.time()
+    totals = postprocess_files(
+        input_paths,
+        args.output_dir,
+        processor_kwargs,
+        stage_kwargs,
+        num_workers=args.num_workers,
+        chunk_size=args.chunk_size_mb << 20,
+        batch_size=args.batch_size,
+    )
+
+    print(f"\nPost-processing completed in {time.time() - start_time:.1f}s ({' -> '.join(stage_names)}):")
+    print(f"  Input records: {totals['input']}")
+    print(f"  Invalid JSON: {totals['invalid_json']}")
+    for name in stage_names:
+        print(f"  Dropped by {name}: {totals[f'dropped_{name}']}")
+    print(f"  Kept: {totals['kept']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -466,3 +466,20 @@ Both the **Elimination Method** and the **Substitution Method** yield the correc
 * **Efficiency**: For this specific problem, the Elimination Method is slightly more direct. The coefficients of $y$ are already opposites (+1 and -1), making elimination via addition a single, clean step. Substitution required more algebraic manipulation.
 * **Generalizability**: The Substitution Method is arguably more universally applicable. It works easily even when coefficients aren't simple opposites or multiples. Elimination often requires an extra step of multiplying one or both equations to align coefficients, which can introduce arithmetic errors.
 * **Recommendation**: When you can immediately spot that adding or subtracting equations will cancel a variable (as in this case), Elimination is often faster. For more complex systems or when one variable is already isolated, Substitution is a very reliable and systematic approach."""
+
+# Registry of rewrite styles selectable with `--prompt-type`. Several entries can be run over the same input
+# in one engine pass; add new styles here or through register_prompt.
+PROMPT_REGISTRY: dict[str, str] = {
+    "pre-train-text": PRE_TRAIN_MATH_TEXT,
+    "text-book-style": TEXT_BOOK_MATH_TEXT,
+    "question-answer": QUESTION_ANSWER_PROMPT,
+    "planning-approach": PLANNING_APPROACH_PROMPT,
+    "socratic-method": SOCRATIC_METHOD_PROMPT,
+    "multiple-solution": MULTIPLE_SOLUTION_PROMPT,
+}
+
+
+def register_prompt(prompt_type: str, system_prompt: str) -> None:
+    if prompt_type in PROMPT_REGISTRY:
+        raise ValueError(f"prompt_type already registered: {prompt_type}.")
+    PROMPT_REGISTRY[prompt_type] = system_prompt
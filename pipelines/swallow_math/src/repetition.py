@@ -0,0 +1,116 @@
+import numpy as np
+
+# odd, so it is invertible modulo 2**64 (numpy uint64 arithmetic wraps around)
+_HASH_BASE = 0x9E3779B97F4A7C15
+_HASH_BASE_INV = pow(_HASH_BASE, -1, 1 << 64)
+# code points are < 0x110000, so every newline gets a value no other character can equal
+_NEWLINE_BASE = 0x110000
+
+
+def _encode(text: str) -> tuple[np.ndarray, int]:
+    """Return (code points with unique newline values, length of the longest line)"""
+    codes = np.frombuffer(text.encode("utf-32-le", "surrogatepass"), dtype=np.uint32).astype(np.uint64)
+    newlines = np.flatnonzero(codes == ord("\n"))
+    codes[newlines] = _NEWLINE_BASE + np.arange(len(newlines), dtype=np.uint64)
+    bounds = np.concatenate(([-1], newlines, [len(codes)]))
+    return codes, int(np.diff(bounds).max()) - 1
+
+
+def _prefix_hashes(codes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Prefix sums G and powers P such that (G[x + L] - G[x]) * P[x] only depends on codes[x : x + L]"""
+    n = len(codes)
+    powers = np.cumprod(np.full(n, _HASH_BASE, dtype=np.uint64))
+    powers = np.concatenate((np.ones(1, dtype=np.uint64), powers[:-1]))
+    inv_powers = np.cumprod(np.full(n, _HASH_BASE_INV, dtype=np.uint64))
+    inv_powers = np.concatenate((np.ones(1, dtype=np.uint64), inv_powers[:-1]))
+    prefix = np.concatenate((np.zeros(1, dtype=np.uint64), np.cumsum(codes * inv_powers)))
+    return prefix, powers
+
+
+def _true_runs(mask: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Return (start, length) of every run of consecutive True values"""
+    edges = np.diff(np.concatenate(([0], mask.view(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    return starts, np.flatnonzero(edges == -1) - starts
+
+
+def _scan_period(codes: np.ndarray, period: int, min_repeats: int) -> int | None:
+    """Exact O(n) check for one period, used when a block hash collides"""
+    starts, lengths = _true_runs(codes[:-period] == codes[period:])
+    hits = np.flatnonzero(lengths >= (min_repeats - 1) * period)
+    return int(starts[hits[0]]) if len(hits) else None
+
+
+def find_repetition(
+    text: str,
+    min_repeats: int = 10,
+    min_period: int = 1,
+    max_period: int | None = None,
+) -> tuple[int, int] | None:
+    """Find a substring repeated `min_repeats`+ times back to back, without crossing a newline.
+
+    Flags the same texts as ``re.search(r"(.+?)\\1{9,}", text)`` (for min_repeats=10) in O(n log n)
+    instead of the regex's super-quadratic backtracking. For every period L, the text is cut into aligned
+    blocks of length L and their rolling hashes are compared: k consecutive copies of a unit of length L
+    always cover k - 1 equal aligned blocks. Candidate runs are then checked character by character and
+    extended to the exact length of the repetition, so hash collisions never produce a wrong answer.
+
+    Periods are tried from `min_period` up to `max_period` (default: unbounded) and the search stops at
+    the first repetition found. Returns (start offset, period) of that repetition, or None.
+    """
+    if min_repeats < 2:
+        raise ValueError(f"min_repeats must be at least 2, got {min_repeats}")
+    if len(text) < min_repeats * min_period:
+        return None
+
+    codes, longest_line = _encode(text)
+    last_period = longest_line // min_repeats
+    if max_period is not None:
+        last_period = min(last_period, max_period)
+    if last_period < min_period:
+        return None
+
+    n = len(codes)
+    prefix, powers = _prefix_hashes(codes)
+    min_blocks = min_repeats - 1
+
+    for period in range(max(min_period, 1), last_period + 1):
+        offsets = np.arange(0, (n // period) * period, period)
+        if len(offsets) < min_blocks:
+            break
+        if min_blocks < 2:
+            # a single aligned block has nothing to be compared with
+            match = _scan_period(codes, period, min_repeats)
+            if match is not None:
+                return match, period
+            continue
+        hashes = (prefix[offsets + period] - prefix[offsets]) * powers[offsets]
+        starts, lengths = _true_runs(hashes[1:] == hashes[:-1])
+        for block, num_equal in zip(starts[lengths >= min_blocks - 1], lengths[lengths >= min_blocks - 1] + 1):
+            begin = int(block) * period
+            end = begin + int(num_equal - 1) * period
+            if not np.array_equal(codes[begin:end], codes[begin + period : end + period]):
+                match = _scan_period(codes, period, min_repeats)
+                if match is not None:
+                    return match, period
+                break
+
+            # the neighbouring blocks differ, so the repetition extends by less than one period each way
+            left = codes[max(begin - period, 0) : begin] == codes[max(begin - period, 0) + period : begin + period]
+            right_end = min(end + period, n - period)
+            right = codes[end:right_end] == codes[end + period : right_end + period]
+            extend_left = len(left) - (int(np.flatnonzero(~left)[-1]) + 1 if not left.all() else 0)
+            extend_right = int(np.argmin(right)) if not right.all() else len(right)
+            if end - begin + extend_left + extend_right >= min_blocks * period:
+                return begin - extend_left, period
+    return None
+
+
+def has_repetitions(
+    text: str,
+    min_repeats: int = 10,
+    min_period: int = 1,
+    max_period: int | None = None,
+) -> bool:
+    """Return True if the text contains a substring repeated `min_repeats`+ times consecutively"""
+    return find_repetition(text, min_repeats, min_period, max_period) is not None
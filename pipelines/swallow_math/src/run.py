@@ -1,22 +1,28 @@
 from pathlib import Path
-import json
+import itertools
 import time
-from typing import cast
+from contextlib import ExitStack
+from typing import Iterable, Iterator
 
 from vllm import LLM, SamplingParams
-from transformers import AutoTokenizer, PreTrainedTokenizer
-from pipelines.swallow_math.src.prompts import (
-    PRE_TRAIN_MATH_TEXT,
-    TEXT_BOOK_MATH_TEXT,
-    QUESTION_ANSWER_PROMPT,
-    PLANNING_APPROACH_PROMPT,
-    SOCRATIC_METHOD_PROMPT,
-    MULTIPLE_SOLUTION_PROMPT,
-)
+from vllm.inputs import TokensPrompt
+from pipelines.common.checkpoint import JsonlCheckpoint
+from pipelines.common.compression import split_compression_suffix
+from pipelines.common.data_parallel import get_replica, iter_replica_jsonl, launch_data_parallel, replica_output_path
+from pipelines.common.jsonl import batched
+from pipelines.common.prompt_builder import PromptBuilder
+from pipelines.swallow_math.src.filter import extract_math_text
+from pipelines.swallow_math.src.prompts import PROMPT_REGISTRY
 
 
 class MathRewritePipeline:
-    def __init__(self, model_name: str, tensor_parallel_size: int, max_model_len: int) -> None:
+    def __init__(
+        self,
+        model_name: str,
+        tensor_parallel_size: int,
+        max_model_len: int,
+        num_tokenizer_workers: int = 1,
+    ) -> None:
         self.model_name = model_name
         self.tensor_parallel_size = tensor_parallel_size
         self.max_model_len = max_model_len
@@ -28,79 +34,132 @@ class MathRewritePipeline:
             max_model_len=max_model_len,
         )
 
-        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
-        self.tokenizer = cast(PreTrainedTokenizer, self.tokenizer)
+        self.prompt_builder = PromptBuilder(model_name, num_workers=num_tokenizer_workers)
+
+    def close(self) -> None:
+        """Shut down the tokenizer worker processes"""
+        self.prompt_builder.close()
+
+    def __enter__(self) -> "MathRewritePipeline":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
 
     def generate(self, prompts: list[str]) -> list[str]:
         params = SamplingParams(temperature=0)
         outputs = self.llm.generate(prompts, params)
         return [output.text for output in outputs]  # type: ignore
 
-    def rewrite_codes(self, texts: list[str], prompt_type: str) -> list[str]:
-        prompts: list[str] = []
-
-        if prompt_type == "pre-train-text":
-            PROMPT = PRE_TRAIN_MATH_TEXT
-        elif prompt_type == "text-book-style":
-            PROMPT = TEXT_BOOK_MATH_TEXT
-        elif prompt_type == "question-answer":
-            PROMPT = QUESTION_ANSWER_PROMPT
-        elif prompt_type == "planning-approach":
-            PROMPT = PLANNING_APPROACH_PROMPT
-        elif prompt_type == "socratic-method":
-            PROMPT = SOCRATIC_METHOD_PROMPT
-        elif prompt_type == "multiple-solution":
-            PROMPT = MULTIPLE_SOLUTION_PROMPT
-        else:
-            raise ValueError(f"Unsupported prompt_type: {prompt_type}.")
-
-        for text in texts:
-            prompt = self.tokenizer.apply_chat_template(
-                [
-                    {"role": "system", "content": PROMPT},
-                    {"role": "user", "content": f"### Input\n```\n{text}\n```\n"},
-                ],
-                tokenize=False,
-                add_generation_prompt=True,
-            )
-            prompt = cast(str, prompt)
-            prompts.append(prompt)
-
-        tokenized_prompts_len = [len(self.tokenizer.encode(prompt)) for prompt in prompts]
-        max_len = max(tokenized_prompts_len)
-        if max_len >= self.max_model_len:
-            raise ValueError(
-                f"Prompt length exceeds model limit: {max_len} >= {self.max_model_len}. "
-                "Consider reducing the input size or using a smaller model."
-            )
-        outputs = self.llm.generate(
-            prompts,
-            SamplingParams(temperature=0, max_tokens=self.max_model_len - max_len),
-        )
-        return [output.outputs[0].text for output in outputs]  # type: ignore
-
-
-def extract_math_text(text: str) -> str:
-    """Extract math text from the response"""
-    start_marker = "<|MATH_TEXT|>"
-    start_index = text.find(start_marker)
-    if start_index == -1:
-        return text.strip()
-
-    return text[start_index + len(start_marker) :].strip()
-
-
-def stream_jsonl_math(file_path: Path, batch_size: int = 1024):
-    """Stream JSONL file in batches for math processing"""
-    batch = []
-    with file_path.open("r", encoding="utf-8") as fin:
-        for line in fin:
-            batch.append(json.loads(line))
-            if len(batch) >= batch_size:
-                yield batch
-                batch = []
-        if batch:  # return remaining data
-            yield batch
+    def build_prompt_token_ids(self, texts: list[str], prompt_types: list[str]) -> list[list[int]]:
+        conversations = [
+            [
+                {"role": "system", "content": get_system_prompt(prompt_type)},
+                {"role": "user", "content": f"### Input\n```\n{text}\n```\n"},
+            ]
+            for text, prompt_type in zip(texts, prompt_types)
+        ]
+        return self.prompt_builder.token_ids(conversations)
+
+    def sampling_params_for(self, prompt_len: int) -> SamplingParams | None:
+        """Give each request the remaining context as its budget; None if the prompt alone does not fit"""
+        if prompt_len >= self.max_model_len:
+            return None
+        return SamplingParams(temperature=0, max_tokens=self.max_model_len - prompt_len)
+
+    def rewrite_codes(self, texts: list[str], prompt_type: str | list[str]) -> list[str | None]:
+        """Rewrite texts in one engine pass. Prompts too long for max_model_len are returned as None.
+
+        `prompt_type` is either one registered prompt type for all texts or one per text, so several
+        rewrite styles can share a single generate call.
+        """
+        prompt_types = [prompt_type] * len(texts) if isinstance(prompt_type, str) else prompt_type
+        results: list[str | None] = [None] * len(texts)
+        prompts: list[TokensPrompt] = []
+        params: list[SamplingParams] = []
+        indices: list[int] = []
+
+        for index, token_ids in enumerate(self.build_prompt_token_ids(texts, prompt_types)):
+            sampling_params = self.sampling_params_for(len(token_ids))
+            if sampling_params is None:
+                continue
+            prompts.append(TokensPrompt(prompt_token_ids=token_ids))
+            params.append(sampling_params)
+            indices.append(index)
+
+        if prompts:
+            outputs = self.llm.generate(prompts, params)
+            for index, output in zip(indices, outputs):
+                results[index] = output.outputs[0].text
+        return results
+
+    def rewrite_stream(
+        self,
+        requests: Iterable[tuple[str, int, dict]],
+        input_jsonl_key: str,
+        max_num_inflight: int,
+    ) -> Iterator[tuple[str, int, dict, str | None]]:
+        """Keep up to `max_num_inflight` (prompt_type, index, item) requests queued in the engine and yield
+        (prompt_type, index, item, output) as each finishes.
+
+        Unlike rewrite_codes there is no batch barrier: a new request is submitted as soon as one completes,
+        so long-tail generations do not leave the GPU idle. Results are yielded in completion order, and items
+        whose prompt does not fit in max_model_len are yielded immediately with output None.
+        """
+        engine = self.llm.llm_engine
+        pending: dict[str, tuple[str, int, dict]] = {}
+        request_iter = iter(requests)
+        exhausted = False
+        next_request_id = 0
+
+        while True:
+            num_free = max_num_inflight - len(pending)
+            new_requests = [] if exhausted else list(itertools.islice(request_iter, num_free))
+            if len(new_requests) < num_free:
+                exhausted = True
+            if not all(input_jsonl_key in item for _, _, item in new_requests):
+                raise ValueError(f"All items must contain {input_jsonl_key} key for math rewriting")
+
+            texts = [item[input_jsonl_key] for _, _, item in new_requests]
+            prompt_types = [prompt_type for prompt_type, _, _ in new_requests]
+            for request, token_ids in zip(new_requests, self.build_prompt_token_ids(texts, prompt_types)):
+                sampling_params = self.sampling_params_for(len(token_ids))
+                if sampling_params is None:
+                    yield *request, None
+                    continue
+
+                request_id = str(next_request_id)
+                next_request_id += 1
+                engine.add_request(request_id, TokensPrompt(prompt_token_ids=token_ids), sampling_params)
+                pending[request_id] = request
+
+            if not pending:
+                if exhausted:
+                    break
+                continue
+
+            for output in engine.step():
+                if output.finished:
+                    yield *pending.pop(output.request_id), output.outputs[0].text
+
+
+def get_system_prompt(prompt_type: str) -> str:
+    if prompt_type not in PROMPT_REGISTRY:
+        raise ValueError(f"Unsupported prompt_type: {prompt_type}.")
+    return PROMPT_REGISTRY[prompt_type]
+
+
+def prompt_output_path(path: Path, prompt_type: str, prompt_types: list[str]) -> Path:
+    """Keep `path` for single-style runs; give each style its own file when several run together"""
+    if len(prompt_types) == 1:
+        return path
+    base, compression_suffix = split_compression_suffix(path)
+    return base.with_name(f"{base.stem}.{prompt_type}{base.suffix}{compression_suffix}")
+
+
+def default_reject_path(output_path: Path) -> Path:
+    base, compression_suffix = split_compression_suffix(output_path)
+    return base.with_name(f"{base.stem}.rejected.jsonl{compression_suffix}")
 
 
 def math_rewrite(
@@ -110,47 +169,128 @@ def math_rewrite(
     batch_size: int,
     tensor_parallel_size: int,
     model_max_length: int,
-    prompt_type: str,
+    prompt_type: str | list[str],
     input_jsonl_key: str = "text",
     llm_output_jsonl_key: str = "llm_output",
     math_text_jsonl_key: str = "math_text",
+    streaming: bool = False,
+    max_num_inflight: int | None = None,
+    resume: bool = True,
+    reject_path: Path | None = None,
+    num_tokenizer_workers: int = 1,
+    fsync_interval: float | None = None,
 ) -> None:
-    """Math text rewriting using GPU processing"""
+    """Math text rewriting using GPU processing
+
+    Several prompt types can be given to rewrite the same input in every style within one engine pass;
+    each style then writes to its own file, <output stem>.<prompt_type>.jsonl.
+    Items whose prompt does not fit in the model context are written unchanged to `reject_path`
+    (default: <output stem>.rejected.jsonl, per style) instead of failing the whole batch.
+    """
+    prompt_types = [prompt_type] if isinstance(prompt_type, str) else list(dict.fromkeys(prompt_type))
+    for name in prompt_types:
+        get_system_prompt(name)
+
     pipeline = MathRewritePipeline(
         model_name=model_name,
         tensor_parallel_size=tensor_parallel_size,
         max_model_len=model_max_length,
+        num_tokenizer_workers=num_tokenizer_workers,
     )
 
     total_items = 0
     start_time = time.time()
 
-    print(f"Starting math rewriting with {tensor_parallel_size} GPUs using {prompt_type} prompt...")
-
-    with output_path.open("w", encoding="utf-8") as fout:
-        for batch in stream_jsonl_math(input_path, batch_size):
-            total_items += len(batch)
-            print(f"Processing batch of {len(batch)} items...")
-
-            if not all(input_jsonl_key in item for item in batch):
-                raise ValueError(f"All items in the batch must contain {input_jsonl_key} key for math rewriting")
-            texts = [item.get(input_jsonl_key, "") for item in batch]
+    print(f"Starting math rewriting with {tensor_parallel_size} GPUs using {', '.join(prompt_types)} prompt...")
 
-            try:
-                rewritten_texts = pipeline.rewrite_codes(texts, prompt_type=prompt_type)
-
-                for index, item in enumerate(batch):
-                    rewritten_text = rewritten_texts[index] if index < len(rewritten_texts) else ""
-                    extracted_math = extract_math_text(rewritten_text)
-                    item[llm_output_jsonl_key] = rewritten_text
-                    item[math_text_jsonl_key] = extracted_math
-                    fout.write(json.dumps(item, ensure_ascii=False) + "\n")
-
-            except Exception as e:
-                print(f"Error during math rewriting: {e}")
+    if reject_path is None:
+        reject_path = default_reject_path(output_path)
+    num_rejected = 0
 
+    with pipeline, ExitStack() as stack:
+        checkpoints: dict[str, JsonlCheckpoint] = {}
+        reject_checkpoints: dict[str, JsonlCheckpoint] = {}
+        for name in prompt_types:
+            # in a data-parallel run each replica writes its own shards, merged by launch_data_parallel
+            style_output_path = replica_output_path(prompt_output_path(output_path, name, prompt_types))
+            checkpoints[name] = stack.enter_context(
+                JsonlCheckpoint(style_output_path, resume=resume, fsync_interval=fsync_interval, background=True)
+            )
+            # rejected rows are checkpointed too, so a restart neither repeats nor loses them
+            reject_checkpoints[name] = stack.enter_context(
+                JsonlCheckpoint(
+                    replica_output_path(prompt_output_path(reject_path, name, prompt_types)),
+                    resume=resume,
+                    fsync_interval=fsync_interval,
+                )
+            )
+            if checkpoints[name].done:
+                print(f"Resuming: {len(checkpoints[name].done)} items already completed in {style_output_path}")
+
+        def pending_requests(batch: list[tuple[int, dict]]) -> list[tuple[str, int, dict]]:
+            return [
+                (name, index, item)
+                for index, item in batch
+                for name in prompt_types
+                if not checkpoints[name].is_done(index) and not reject_checkpoints[name].is_done(index)
+            ]
+
+        def to_output(name: str, index: int, item: dict, rewritten_text: str | None) -> dict | None:
+            nonlocal num_rejected
+            if rewritten_text is None:
+                num_rejected += 1
+                reject_checkpoints[name].write([item], [index])
+                return None
+            # copy: with several prompt types the same input row is rewritten once per style
+            output = dict(item)
+            output[llm_output_jsonl_key] = rewritten_text
+            output[math_text_jsonl_key] = extract_math_text(rewritten_text)
+            return output
+
+        input_items = enumerate(iter_replica_jsonl(input_path))
+
+        if streaming:
+            max_num_inflight = max_num_inflight or batch_size
+            print(f"Streaming mode: keeping up to {max_num_inflight} requests in flight")
+            requests = (request for batch in batched(input_items, batch_size) for request in pending_requests(batch))
+            for name, index, item, rewritten_text in pipeline.rewrite_stream(
+                requests,
+                input_jsonl_key=input_jsonl_key,
+                max_num_inflight=max_num_inflight,
+            ):
+                total_items += 1
+                output = to_output(name, index, item, rewritten_text)
+                if output is not None:
+                    checkpoints[name].write([output], [index])
+        else:
+            for batch in batched(input_items, batch_size):
+                requests = pending_requests(batch)
+                if not requests:
+                    continue
+                total_items += len(requests)
+                print(f"Processing batch of {len(requests)} requests...")
+
+                if not all(input_jsonl_key in item for _, _, item in requests):
+                    raise ValueError(f"All items in the batch must contain {input_jsonl_key} key for math rewriting")
+                texts = [item.get(input_jsonl_key, "") for _, _, item in requests]
+
+                rewritten_texts = pipeline.rewrite_codes(texts, prompt_type=[name for name, _, _ in requests])
+
+                rewritten_items: dict[str, list[dict]] = {name: [] for name in prompt_types}
+                indices: dict[str, list[int]] = {name: [] for name in prompt_types}
+                for (name, index, item), rewritten_text in zip(requests, rewritten_texts):
+                    output = to_output(name, index, item, rewritten_text)
+                    if output is not None:
+                        rewritten_items[name].append(output)
+                        indices[name].append(index)
+                for name in prompt_types:
+                    if indices[name]:
+                        checkpoints[name].write(rewritten_items[name], indices[name])
+
+    if num_rejected:
+        print(f"Rejected {num_rejected} items with prompts longer than {model_max_length} tokens: {reject_path}")
     actual_time = time.time() - start_time
-    print(f"Math rewriting completed: {actual_time:.1f}s total ({actual_time / total_items:.3f}s per item)")
+    print(f"Math rewriting completed: {actual_time:.1f}s total ({actual_time / max(total_items, 1):.3f}s per item)")
 
 
 if __name__ == "__main__":
@@ -206,6 +346,12 @@ if __name__ == "__main__":
         default=1,
         help="Number of GPUs to use for tensor parallelism",
     )
+    parser.add_argument(
+        "--data-parallel-size",
+        type=int,
+        default=1,
+        help="Number of engine replicas, each using --tensor-parallel-size GPUs on its own slice of the input",
+    )
     parser.add_argument(
         "--model-max-length",
         type=int,
@@ -215,20 +361,60 @@ if __name__ == "__main__":
     parser.add_argument(
         "--prompt-type",
         type=str,
-        default="pre-train-text",
-        choices=[
-            "pre-train-text",
-            "text-book-style",
-            "question-answer",
-            "planning-approach",
-            "socratic-method",
-            "multiple-solution",
-        ],
-        help="Prompt type for math rewriting",
+        nargs="+",
+        default=["pre-train-text"],
+        choices=list(PROMPT_REGISTRY),
+        help="Prompt type(s) for math rewriting. With several, each style is written to <output stem>.<type>.jsonl",
+    )
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="Feed requests continuously instead of waiting for each batch (output is in completion order)",
+    )
+    parser.add_argument(
+        "--max-num-inflight",
+        type=int,
+        default=None,
+        help="Maximum number of requests queued in the engine in streaming mode (default: --batch-size)",
+    )
+    parser.add_argument(
+        "--no-resume",
+        action="store_true",
+        help="Ignore progress recorded in <output-jsonl>.progress and start over",
+    )
+    parser.add_argument(
+        "--reject-jsonl",
+        type=Path,
+        default=None,
+        help="Output JSONL file for items whose prompt exceeds --model-max-length (default: <output>.rejected.jsonl)",
+    )
+    parser.add_argument(
+        "--fsync-interval",
+        type=float,
+        default=None,
+        help="Seconds between fsyncs of the output and progress files",
+    )
+    parser.add_argument(
+        "--num-tokenizer-workers",
+        type=int,
+        default=8,
+        help="Number of CPU processes rendering and tokenizing prompts",
     )
 
     args = parser.parse_args()
-    if args.cmd == "math_rewrite":
+    if args.cmd == "math_rewrite" and args.data_parallel_size > 1 and get_replica() is None:
+        prompt_types = list(dict.fromkeys(args.prompt_type))
+        reject_jsonl = args.reject_jsonl or default_reject_path(args.output_jsonl)
+        launch_data_parallel(
+            args.data_parallel_size,
+            args.tensor_parallel_size,
+            merge_paths=[
+                prompt_output_path(path, name, prompt_types)
+                for path in (args.output_jsonl, reject_jsonl)
+                for name in prompt_types
+            ],
+        )
+    elif args.cmd == "math_rewrite":
         math_rewrite(
             input_path=args.input_jsonl,
             output_path=args.output_jsonl,
@@ -240,6 +426,12 @@ if __name__ == "__main__":
             input_jsonl_key=args.input_jsonl_key,
             llm_output_jsonl_key=args.llm_output_jsonl_key,
             math_text_jsonl_key=args.math_text_jsonl_key,
+            streaming=args.streaming,
+            max_num_inflight=args.max_num_inflight,
+            resume=not args.no_resume,
+            reject_path=args.reject_jsonl,
+            num_tokenizer_workers=args.num_tokenizer_workers,
+            fsync_interval=args.fsync_interval,
         )
     else:
         raise ValueError(f"Unknown command: {args.cmd}")
@@ -1,10 +1,13 @@
 import argparse
-import json
-import os
+from pathlib import Path
 from typing import cast, Dict, List, Union
 from vllm import LLM, SamplingParams
 from transformers import AutoTokenizer, PreTrainedTokenizer
 
+from pipelines.common.checkpoint import JsonlCheckpoint
+from pipelines.common.data_parallel import get_replica, iter_replica_jsonl, launch_data_parallel, replica_output_path
+from pipelines.common.jsonl import batched
+
 
 ENGLISH_MULTI_CHOICE_PROMPT = """Generate a multiple-choice question with 4 options and the correct answer based on the following text:
 
@@ -109,6 +112,23 @@ def parse_args() -> argparse.Namespace:
         default=1,
         help="Tensor parallel size for vLLM.",
     )
+    parser.add_argument(
+        "--data-parallel-size",
+        type=int,
+        default=1,
+        help="Number of engine replicas, each using --tensor-parallel-size GPUs.",
+    )
+    parser.add_argument(
+        "--no-resume",
+        action="store_true",
+        help="Ignore progress recorded in <output-jsonl>.progress and start over.",
+    )
+    parser.add_argument(
+        "--fsync-interval",
+        type=float,
+        default=None,
+        help="Seconds between fsyncs of the output and progress files.",
+    )
     return parser.parse_args()
 
 
@@ -129,20 +149,6 @@ def get_prompt_template(lang: str, qa_mode: str) -> str:
     return prompt_map.get((lang, qa_mode), ENGLISH_MULTI_CHOICE_PROMPT)
 
 
-def read_jsonl(file_path: str) -> List[Dict[str, Union[str, List]]]:
-    """Read and parse JSONL file into a list of dictionaries."""
-    with open(file_path, "r", encoding="utf-8") as f:
-        return [json.loads(line) for line in f]
-
-
-def save_to_jsonl(file_path: str, data_list: List[Dict[str, Union[str, List]]]) -> None:
-    """Append data to a JSONL file."""
-    mode = "a" if os.path.exists(file_path) else "w"
-    with open(file_path, mode, encoding="utf-8") as f:
-        for entry in data_list:
-            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
-
-
 def parse_generated_text(text: str, qa_mode: str) -> Dict[str, Union[str, List[str]]]:
     """Parse generated text into a structured QA dictionary."""
     print(f"Generated Text:\n{text}\n{'-' * 40}", flush=True)
@@ -252,6 +258,10 @@ def main():
     """Main function to process JSONL and generate QA using vLLM."""
     args = parse_args()
 
+    if args.data_parallel_size > 1 and get_replica() is None:
+        launch_data_parallel(args.data_parallel_size, args.tensor_parallel_size, [Path(args.output_jsonl)])
+        return
+
     # Initialize tokenizer and vLLM
     tokenizer = load_tokenizer(args.model_path)
     llm = LLM(model=args.model_path, tensor_parallel_size=args.tensor_parallel_size)
@@ -259,22 +269,25 @@ def main():
     # Get prompt template
     prompt_template = get_prompt_template(args.lang, args.qa_mode)
 
-    # Read input JSONL
-    lines = read_jsonl(args.input_jsonl)
-
-    # Process in batches
-    for start_idx in range(0, len(lines), args.batch_size):
-        batch_lines = lines[start_idx : start_idx + args.batch_size]
-        processed_lines = process_batch(
-            batch_lines,
-            tokenizer,
-            llm,
-            prompt_template,
-            args.chunk_max_tokens,
-            args.gen_max_tokens,
-            args.qa_mode,
-        )
-        save_to_jsonl(args.output_jsonl, processed_lines)
+    # Stream input JSONL in batches, skipping lines completed by a previous run
+    with JsonlCheckpoint(
+        replica_output_path(args.output_jsonl),
+        resume=not args.no_resume,
+        fsync_interval=args.fsync_interval,
+        background=True,
+    ) as checkpoint:
+        for batch in batched(checkpoint.pending(iter_replica_jsonl(args.input_jsonl)), args.batch_size):
+            batch_lines = [item for _, item in batch]
+            processed_lines = process_batch(
+                batch_lines,
+                tokenizer,
+                llm,
+                prompt_template,
+                args.chunk_max_tokens,
+                args.gen_max_tokens,
+                args.qa_mode,
+            )
+            checkpoint.write(processed_lines, [line_idx for line_idx, _ in batch])
 
 
 if __name__ == "__main__":
@@ -1,16 +1,22 @@
 import argparse
 import json
+import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
-from typing import Iterable, Dict, Generator
+from typing import Iterable, Dict, Generator, Iterator, Optional
 
 import pyarrow as pa
 import pyarrow.ipc as pa_ipc
 import pyarrow.feather as feather
 
+from arrow_json import ordered_map, record_batch_to_jsonl
+from jsonl_shards import add_directory_arguments, open_output, run_directory_mode
+
 
 def write_jsonl(records_iter: Iterable[Dict], jsonl_file_path: str) -> None:
-    with open(jsonl_file_path, "w", encoding="utf-8") as f:
+    with open_output(jsonl_file_path, text=True) as f:
         for rec in records_iter:
             json.dump(rec, f, ensure_ascii=False)
             f.write("\n")
@@ -71,41 +77,100 @@ def record_batches_from_arrow(path: str, batch_size: int) -> Generator[pa.Record
         ) from e_feather
 
 
-def convert_arrow_to_jsonl(arrow_file_path: str, jsonl_file_path: str, batch_size: int = 65536) -> None:
-    def rows() -> Generator[Dict, None, None]:
+def iter_arrow_jsonl(
+    arrow_file_path: str,
+    batch_size: int = 65536,
+    columns: Optional[list[str]] = None,
+    num_workers: int = 1,
+) -> Iterator[bytes]:
+    """
+    Read record batches (memory-mapped) in this process and yield their JSONL rendering in file order,
+    rendered column by column in `num_workers` processes.
+    """
+
+    def batches() -> Generator[pa.RecordBatch, None, None]:
         for batch in record_batches_from_arrow(arrow_file_path, batch_size):
-            table = pa.Table.from_batches([batch])
-            for row in table.to_pylist():
-                yield row
+            yield batch if columns is None else batch.select(columns)
 
-    write_jsonl(rows(), jsonl_file_path)
+    executor = ProcessPoolExecutor(max_workers=num_workers) if num_workers > 1 else None
+    try:
+        yield from ordered_map(executor, record_batch_to_jsonl, batches(), max_pending=2 * num_workers)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
+def convert_arrow_to_jsonl(
+    arrow_file_path: str,
+    jsonl_file_path: str,
+    batch_size: int = 65536,
+    columns: Optional[list[str]] = None,
+    num_workers: int = 1,
+) -> None:
+    with open_output(jsonl_file_path) as f:
+        for data in iter_arrow_jsonl(arrow_file_path, batch_size, columns, num_workers):
+            f.write(data)
     print(f"Arrow file '{arrow_file_path}' has been converted to JSONL and saved as '{jsonl_file_path}'.")
 
 
-def parse_args() -> argparse.Namespace:
-    p = argparse.ArgumentParser(description="Convert an Arrow (IPC/Feather) file to JSONL.")
+def build_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(description="Convert an Arrow (IPC/Feather) file, or a directory of them, to JSONL.")
     p.add_argument(
         "--arrow-file",
         type=str,
-        required=True,
+        default=None,
         help="Path to input .arrow/.ipc/.feather file.",
     )
-    p.add_argument("--jsonl-file", type=str, required=True, help="Path to output JSONL file.")
+    p.add_argument(
+        "--jsonl-file",
+        type=str,
+        default=None,
+        help="Path to output JSONL file (.jsonl.gz/.jsonl.zst are compressed).",
+    )
+    add_directory_arguments(p)
     p.add_argument(
         "--batch-size",
         type=int,
         default=65536,
         help="Max rows per batch when chunking tables.",
     )
-    return p.parse_args()
+    p.add_argument(
+        "--columns",
+        type=str,
+        nargs="+",
+        default=None,
+        help="Only write these columns (default: all).",
+    )
+    p.add_argument(
+        "--num-workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of processes rendering record batches (one file) or whole files (directory mode) in parallel.",
+    )
+    return p
 
 
 def main() -> None:
-    args = parse_args()
+    parser = build_parser()
+    args = parser.parse_args()
+    if args.arrow_file is None:
+        # each worker converts whole files, so record batches are rendered in-process there
+        render = partial(iter_arrow_jsonl, batch_size=args.batch_size, columns=args.columns)
+        run_directory_mode(parser, args, render, suffixes=(".arrow", ".ipc", ".feather"))
+        return
+    if args.jsonl_file is None:
+        parser.error("--jsonl-file is required with --arrow-file")
+
     in_path = Path(args.arrow_file)
     out_path = Path(args.jsonl_file)
     out_path.parent.mkdir(parents=True, exist_ok=True)
-    convert_arrow_to_jsonl(str(in_path), str(out_path), batch_size=args.batch_size)
+    convert_arrow_to_jsonl(
+        str(in_path),
+        str(out_path),
+        batch_size=args.batch_size,
+        columns=args.columns,
+        num_workers=args.num_workers,
+    )
 
 
 if __name__ == "__main__":
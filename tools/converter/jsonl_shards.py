@@ -0,0 +1,349 @@
+"""Directory mode for the Arrow/Parquet converters.
+
+Input files are fanned out over a process pool, so interpreter startup and imports are paid once per worker
+instead of once per file. Each worker renders one input file to JSONL; the outputs either mirror the input tree
+or, with a row or size limit, are concatenated in input order and re-sharded into `part-NNNNN.jsonl` files.
+Every output file is recorded in `manifest.json` with its row count, size, sha256 and source files.
+
+Outputs ending in .gz or .zst (see --compression) are compressed with pipelines.common.compression; sizes and
+checksums in the manifest are those of the files on disk.
+"""
+
+import argparse
+import glob
+import hashlib
+import io
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import IO, Any, Callable, Iterator, Optional
+
+import numpy as np
+
+from arrow_json import ordered_map
+from pipelines.common.compression import compression_for, ensure_available, split_compression_suffix, wrap_writer
+
+# renders one input file to JSONL bytes, in row order
+Render = Callable[[str], Iterator[bytes]]
+
+MANIFEST_NAME = "manifest.json"
+COMPRESSION_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+_PARTS_DIR = ".parts"
+_COPY_CHUNK_SIZE = 1 << 24
+
+
+def _open_raw(path: str | Path) -> IO[bytes]:
+    # a missing compression package must not leave an empty output behind
+    ensure_available(compression_for(path))
+    return open(path, "wb")
+
+
+def wrap_output(raw: IO[bytes], path: str | Path) -> IO[bytes]:
+    """Compress writes into `raw` according to the extension of `path`"""
+    compression = compression_for(path)
+    return raw if compression is None else wrap_writer(raw, compression)
+
+
+def open_output(path: str | Path, text: bool = False) -> IO[Any]:
+    """open() for writing a converter output, compressed according to its extension"""
+    stream = wrap_output(_open_raw(path), path)
+    return io.TextIOWrapper(stream, encoding="utf-8") if text else stream
+
+
+def shard_name(output_path: Path, index: int) -> Path:
+    base, compression_suffix = split_compression_suffix(output_path)
+    return base.with_name(f"{base.stem}-{index:05d}{base.suffix}{compression_suffix}")
+
+
+class _HashingFile(io.RawIOBase):
+    """Write-through file that tracks the size and sha256 of what reaches the disk"""
+
+    def __init__(self, raw: IO[bytes]) -> None:
+        self.raw = raw
+        self.hash = hashlib.sha256()
+        self.size = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:  # type: ignore[override]
+        self.hash.update(data)
+        self.size += len(data)
+        return self.raw.write(data)
+
+    def flush(self) -> None:
+        self.raw.flush()
+
+    def close(self) -> None:
+        if not self.closed:
+            super().close()
+            self.raw.close()
+
+
+class JsonlShardWriter:
+    """Write JSONL bytes to `output_path`, or to `{stem}-NNNNN{suffix}` files holding at most `max_rows`
+    rows and `max_bytes` bytes each when either limit is set (0 means no limit). Files are only split
+    between lines; a single line larger than `max_bytes` (uncompressed) gets a file of its own.
+    """
+
+    def __init__(self, output_path: str | Path, max_rows: int = 0, max_bytes: int = 0) -> None:
+        self.output_path = Path(output_path)
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.entries: list[dict[str, Any]] = []
+        self._file: Optional[IO[bytes]] = None
+        self._disk: Optional[_HashingFile] = None
+        self._rows = 0
+        self._bytes = 0
+
+    @property
+    def sharded(self) -> bool:
+        return bool(self.max_rows or self.max_bytes)
+
+    def _open(self) -> None:
+        path = shard_name(self.output_path, len(self.entries)) if self.sharded else self.output_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._disk = _HashingFile(_open_raw(path))
+        self._file = wrap_output(self._disk, path)
+        self._rows = 0
+        self._bytes = 0
+        self.entries.append({"path": str(path), "rows": 0, "bytes": 0, "sha256": None, "sources": []})
+
+    def _finish(self) -> None:
+        if self._file is None:
+            return
+        assert self._disk is not None
+        self._file.close()
+        self._file = None
+        entry = self.entries[-1]
+        entry.update(rows=self._rows, bytes=self._disk.size, sha256=self._disk.hash.hexdigest())
+        self._rows = 0
+        self._bytes = 0
+
+    def _append(self, data: bytes | memoryview, num_rows: int, source: Optional[str]) -> None:
+        if self._file is None:
+            self._open()
+        assert self._file is not None
+        self._file.write(data)
+        self._rows += num_rows
+        self._bytes += len(data)
+        sources = self.entries[-1]["sources"]
+        if source is not None and (not sources or sources[-1] != source):
+            sources.append(source)
+
+    def write(self, data: bytes, source: Optional[str] = None) -> None:
+        """Append whole JSONL lines; `source` is recorded in the manifest entry of every file they land in"""
+        if not data:
+            return
+        if not self.sharded:
+            self._append(data, data.count(b"\n"), source)
+            return
+
+        # JSON strings never contain a raw newline, so every newline ends a row
+        ends = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == ord("\n")) + 1
+        view = memoryview(data)
+        position, done = 0, 0
+        while done < len(ends):
+            take = len(ends) - done
+            if self.max_rows:
+                take = min(take, self.max_rows - self._rows)
+            if self.max_bytes:
+                limit = position + self.max_bytes - self._bytes
+                take = min(take, int(np.searchsorted(ends, limit, side="right")) - done)
+            if take <= 0:
+                if self._file is not None:
+                    self._finish()
+                    continue
+                take = 1
+            end = int(ends[done + take - 1])
+            self._append(view[position:end], take, source)
+            position, done = end, done + take
+            if self._file is not None and (
+                (self.max_rows and self._rows >= self.max_rows) or (self.max_bytes and self._bytes >= self.max_bytes)
+            ):
+                self._finish()
+
+    def close(self) -> list[dict[str, Any]]:
+        """Close the current file and return one manifest entry per written file"""
+        if not self.entries:
+            # keep the one-output-per-input contract even for inputs without rows
+            self._open()
+        self._finish()
+        return self.entries
+
+    def __enter__(self) -> "JsonlShardWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+
+def add_directory_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--input-dir",
+        type=str,
+        default=None,
+        help="Convert every matching file under this directory (recursively).",
+    )
+    parser.add_argument(
+        "--input-glob",
+        type=str,
+        default=None,
+        help="Convert every file matching this glob pattern (quote it; ** is recursive).",
+    )
+    parser.add_argument(
+        "--output-dir",
+        type=str,
+        default=None,
+        help="Output directory for --input-dir/--input-glob; a manifest.json is written next to the outputs.",
+    )
+    parser.add_argument(
+        "--max-rows-per-file",
+        type=int,
+        default=0,
+        help="Re-shard the concatenated output into files of at most this many rows (0: one output per input).",
+    )
+    parser.add_argument(
+        "--max-file-size-mb",
+        type=int,
+        default=0,
+        help="Re-shard the concatenated output into files of at most this uncompressed size (0: one per input).",
+    )
+    parser.add_argument(
+        "--compression",
+        choices=sorted(COMPRESSION_SUFFIXES),
+        default=None,
+        help="Compress directory-mode outputs (.jsonl.gz / .jsonl.zst; zstd needs the zstandard package).",
+    )
+
+
+def resolve_inputs(
+    input_dir: Optional[str], input_glob: Optional[str], suffixes: tuple[str, ...]
+) -> tuple[list[Path], Path]:
+    """Return the sorted input files and the root their output paths are made relative to"""
+    if input_dir is not None:
+        root = Path(input_dir)
+        paths = sorted(p for p in root.rglob("*") if p.is_file() and p.suffix.lower() in suffixes)
+    else:
+        assert input_glob is not None
+        paths = sorted(Path(p) for p in glob.glob(input_glob, recursive=True) if os.path.isfile(p))
+        root = Path(os.path.commonpath([str(p.parent) for p in paths])) if paths else Path(".")
+    return paths, root
+
+
+def _convert_file(task: tuple[Render, str, str, str]) -> list[dict[str, Any]]:
+    render, input_path, output_path, source = task
+    with JsonlShardWriter(output_path) as writer:
+        for data in render(input_path):
+            writer.write(data, source)
+    return writer.entries
+
+
+def _iter_line_chunks(path: str) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(_COPY_CHUNK_SIZE)
+            if not chunk:
+                return
+            if not chunk.endswith(b"\n"):
+                chunk += f.readline()
+            yield chunk
+
+
+def convert_files(
+    render: Render,
+    input_paths: list[Path],
+    input_root: Path,
+    output_dir: Path,
+    num_workers: int = 1,
+    max_rows: int = 0,
+    max_bytes: int = 0,
+    compression: Optional[str] = None,
+) -> dict[str, Any]:
+    """Convert `input_paths` in `num_workers` processes and return the manifest of the written files"""
+    sharded = bool(max_rows or max_bytes)
+    suffix = ".jsonl" + (COMPRESSION_SUFFIXES[compression] if compression else "")
+    sources = [str(path.relative_to(input_root)) for path in input_paths]
+    if sharded:
+        parts_dir = output_dir / _PARTS_DIR
+        outputs = [parts_dir / f"{index:06d}.jsonl" for index in range(len(input_paths))]
+    else:
+        outputs = [(output_dir / source).with_suffix(suffix) for source in sources]
+    tasks = [(render, str(path), str(out), source) for path, out, source in zip(input_paths, outputs, sources)]
+
+    resharder = JsonlShardWriter(output_dir / f"part{suffix}", max_rows, max_bytes) if sharded else None
+    files: list[dict[str, Any]] = []
+    inputs: list[dict[str, Any]] = []
+    start_time = time.time()
+    executor = ProcessPoolExecutor(max_workers=num_workers) if num_workers > 1 and len(tasks) > 1 else None
+    try:
+        for source, entries in zip(sources, ordered_map(executor, _convert_file, tasks, max_pending=2 * num_workers)):
+            rows = sum(entry["rows"] for entry in entries)
+            inputs.append({"path": source, "rows": rows})
+            if resharder is None:
+                files.extend(entries)
+            else:
+                for entry in entries:
+                    for chunk in _iter_line_chunks(entry["path"]):
+                        resharder.write(chunk, source)
+                    os.remove(entry["path"])
+            print(f"[{len(inputs)}/{len(tasks)}] {source}: {rows} rows ({time.time() - start_time:.1f}s)")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    if resharder is not None:
+        files = resharder.close()
+        shutil.rmtree(output_dir / _PARTS_DIR, ignore_errors=True)
+
+    for entry in files:
+        entry["path"] = str(Path(entry["path"]).relative_to(output_dir))
+    return {
+        "num_rows": sum(entry["rows"] for entry in files),
+        "num_bytes": sum(entry["bytes"] for entry in files),
+        "files": files,
+        "inputs": inputs,
+    }
+
+
+def run_directory_mode(
+    parser: argparse.ArgumentParser,
+    args: argparse.Namespace,
+    render: Render,
+    suffixes: tuple[str, ...],
+) -> None:
+    """Validate the directory-mode arguments, convert every input and write the manifest"""
+    if bool(args.input_dir) == bool(args.input_glob):
+        parser.error("specify a single input file, or exactly one of --input-dir or --input-glob")
+    if args.output_dir is None:
+        parser.error("--output-dir is required with --input-dir/--input-glob")
+    ensure_available(args.compression)
+
+    input_paths, input_root = resolve_inputs(args.input_dir, args.input_glob, suffixes)
+    if not input_paths:
+        print(f"No input files found ({', '.join(suffixes)}).")
+        return
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    manifest = convert_files(
+        render,
+        input_paths,
+        input_root,
+        output_dir,
+        num_workers=args.num_workers,
+        max_rows=args.max_rows_per_file,
+        max_bytes=args.max_file_size_mb << 20,
+        compression=args.compression,
+    )
+    manifest_path = output_dir / MANIFEST_NAME
+    tmp_path = manifest_path.with_name(manifest_path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, manifest_path)
+    print(
+        f"Converted {len(input_paths)} files into {len(manifest['files'])} JSONL files "
+        f"({manifest['num_rows']} rows); manifest: {manifest_path}"
+    )
@@ -1,28 +1,36 @@
 import argparse
 import json
+import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
+from typing import Iterator, Optional
 
-from datasets import disable_caching
-from datasets import Dataset
-import pyarrow as pa
 import pyarrow.parquet as pq
 
+from arrow_json import ordered_map, table_to_jsonl
+from jsonl_shards import add_directory_arguments, open_output, run_directory_mode
+
 
 def write_jsonl(records_iter, jsonl_file_path: str) -> None:
-    with open(jsonl_file_path, "w", encoding="utf-8") as f:
+    with open_output(jsonl_file_path, text=True) as f:
         for rec in records_iter:
             json.dump(rec, f, ensure_ascii=False)
             f.write("\n")
 
 
-def convert_with_hf_dataset(parquet_file_path: str, jsonl_file_path: str) -> bool:
+def convert_with_hf_dataset(parquet_file_path: str, jsonl_file_path: str, columns: Optional[list[str]] = None) -> bool:
     """
     Try converting using Hugging Face Dataset.from_parquet (avoids 'List' features metadata).
     Returns True on success, False to fall back.
     """
+    # imported here so the default Arrow path does not pay for importing datasets
+    from datasets import Dataset, disable_caching
+
+    disable_caching()
     try:
-        ds: Dataset = Dataset.from_parquet(parquet_file_path)  # type: ignore
+        ds: Dataset = Dataset.from_parquet(parquet_file_path, columns=columns)  # type: ignore
         write_jsonl((row for row in ds), jsonl_file_path)
         return True
     except Exception as e:
@@ -33,46 +41,126 @@ def convert_with_hf_dataset(parquet_file_path: str, jsonl_file_path: str) -> boo
         return False
 
 
-def convert_with_pyarrow(parquet_file_path: str, jsonl_file_path: str, batch_size: int = 65536) -> None:
+def _render_row_group(task: tuple[str, int, Optional[list[str]], int]) -> bytes:
+    parquet_file_path, row_group, columns, batch_size = task
+    table = pq.ParquetFile(parquet_file_path).read_row_group(row_group, columns=columns)
+    return b"".join(table_to_jsonl(table, batch_size))
+
+
+def iter_parquet_jsonl(
+    parquet_file_path: str,
+    batch_size: int = 65536,
+    columns: Optional[list[str]] = None,
+    num_workers: int = 1,
+) -> Iterator[bytes]:
+    """Yield the JSONL rendering of each row group in file order, rendered in `num_workers` processes"""
+    num_row_groups = pq.ParquetFile(parquet_file_path).metadata.num_row_groups
+    tasks = [(parquet_file_path, row_group, columns, batch_size) for row_group in range(num_row_groups)]
+    executor = ProcessPoolExecutor(max_workers=num_workers) if num_workers > 1 and num_row_groups > 1 else None
+    try:
+        yield from ordered_map(executor, _render_row_group, tasks, max_pending=2 * num_workers)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
+def convert_with_pyarrow(
+    parquet_file_path: str,
+    jsonl_file_path: str,
+    batch_size: int = 65536,
+    columns: Optional[list[str]] = None,
+    num_workers: int = 1,
+) -> None:
     """
-    Robust fallback using PyArrow streaming. Does not depend on HF features metadata.
+    Columnar conversion straight from Arrow data, one row group per task. Does not depend on HF features
+    metadata and never builds per-row Python dicts; row groups are rendered in `num_workers` processes and
+    written in file order.
     """
-    pf = pq.ParquetFile(parquet_file_path)
-    with open(jsonl_file_path, "w", encoding="utf-8") as f:
-        for batch in pf.iter_batches(batch_size=batch_size):
-            # Convert the RecordBatch to a list of Python dicts
-            table = pa.Table.from_batches([batch])
-            for row in table.to_pylist():
-                json.dump(row, f, ensure_ascii=False)
-                f.write("\n")
-
-
-def convert_parquet_to_jsonl(parquet_file_path: str, jsonl_file_path: str) -> None:
-    ok = convert_with_hf_dataset(parquet_file_path, jsonl_file_path)
+    with open_output(jsonl_file_path) as f:
+        for data in iter_parquet_jsonl(parquet_file_path, batch_size, columns, num_workers):
+            f.write(data)
+
+
+def convert_parquet_to_jsonl(
+    parquet_file_path: str,
+    jsonl_file_path: str,
+    columns: Optional[list[str]] = None,
+    num_workers: int = 1,
+    batch_size: int = 65536,
+    use_hf_datasets: bool = False,
+) -> None:
+    ok = use_hf_datasets and convert_with_hf_dataset(parquet_file_path, jsonl_file_path, columns)
     if not ok:
-        convert_with_pyarrow(parquet_file_path, jsonl_file_path)
+        convert_with_pyarrow(
+            parquet_file_path, jsonl_file_path, batch_size=batch_size, columns=columns, num_workers=num_workers
+        )
 
     print(f"Parquet file '{parquet_file_path}' has been converted to JSONL and saved as '{jsonl_file_path}'.")
 
 
 def main() -> None:
-    disable_caching()
-
-    parser = argparse.ArgumentParser(description="Convert a Parquet file to JSONL.")
+    parser = argparse.ArgumentParser(description="Convert a Parquet file, or a directory of them, to JSONL.")
     parser.add_argument(
         "--parquet-file",
         type=str,
-        required=True,
+        default=None,
         help="Path to the input Parquet file.",
     )
-    parser.add_argument("--jsonl-file", type=str, required=True, help="Path to the output JSONL file.")
+    parser.add_argument(
+        "--jsonl-file",
+        type=str,
+        default=None,
+        help="Path to the output JSONL file (.jsonl.gz/.jsonl.zst are compressed).",
+    )
+    add_directory_arguments(parser)
+    parser.add_argument(
+        "--columns",
+        type=str,
+        nargs="+",
+        default=None,
+        help="Only read and write these columns (default: all).",
+    )
+    parser.add_argument(
+        "--num-workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of processes rendering row groups (one file) or whole files (directory mode) in parallel.",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=65536,
+        help="Max rows rendered at once within a row group.",
+    )
+    parser.add_argument(
+        "--use-hf-datasets",
+        action="store_true",
+        help="Convert through datasets.Dataset.from_parquet first (materializes an Arrow cache).",
+    )
     args = parser.parse_args()
 
+    if args.parquet_file is None:
+        if args.use_hf_datasets:
+            parser.error("--use-hf-datasets only supports single-file conversion")
+        # each worker converts whole files, so row groups are rendered in-process there
+        render = partial(iter_parquet_jsonl, batch_size=args.batch_size, columns=args.columns)
+        run_directory_mode(parser, args, render, suffixes=(".parquet",))
+        return
+    if args.jsonl_file is None:
+        parser.error("--jsonl-file is required with --parquet-file")
+
     in_path = Path(args.parquet_file)
     out_path = Path(args.jsonl_file)
     out_path.parent.mkdir(parents=True, exist_ok=True)
 
-    convert_parquet_to_jsonl(str(in_path), str(out_path))
+    convert_parquet_to_jsonl(
+        str(in_path),
+        str(out_path),
+        columns=args.columns,
+        num_workers=args.num_workers,
+        batch_size=args.batch_size,
+        use_hf_datasets=args.use_hf_datasets,
+    )
 
 
 if __name__ == "__main__":
@@ -12,6 +12,7 @@
 
 set -e
 cd $PBS_O_WORKDIR
+export PYTHONPATH=$PWD:$PYTHONPATH
 
 # environment variables
 USER_DIR=/groups/gag51395/fujii
@@ -24,16 +25,8 @@ PARQUET_FILE_DIR="/groups/gch51639/fujii/datasets/raw/instruct/public/Nemotron-P
 JSONL_FILE_DIR="$PARQUET_FILE_DIR-jsonl"
 mkdir -p "${JSONL_FILE_DIR}"
 
-# Convert Parquet files to JSONL
-for PARQUET_FILE in "${PARQUET_FILE_DIR}"/*.parquet; do
-    BASENAME=$(basename "${PARQUET_FILE}" .parquet)
-    JSONL_FILE="${JSONL_FILE_DIR}/${BASENAME}.jsonl"
-
-    echo "Converting ${PARQUET_FILE} to ${JSONL_FILE}"
-
-    python tools/converter/parquet_to_jsonl.py \
-        --parquet-file "${PARQUET_FILE}" \
-        --jsonl-file "${JSONL_FILE}"
-    echo "Conversion completed: ${JSONL_FILE}"
-    echo "----------------------------------------"
-done
+# Convert every .parquet file under the directory in one process pool (see manifest.json for row counts)
+python tools/converter/parquet_to_jsonl.py \
+    --input-dir "${PARQUET_FILE_DIR}" \
+    --output-dir "${JSONL_FILE_DIR}" \
+    --num-workers 32
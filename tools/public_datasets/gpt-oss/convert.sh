@@ -1,4 +1,5 @@
 #!/bin/bash
+export PYTHONPATH=$PWD:$PYTHONPATH
 
 # open math reasoning
 python tools/public_datasets/gpt-oss/convert_gpt_oss_style.py \
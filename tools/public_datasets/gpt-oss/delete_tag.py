@@ -1,9 +1,14 @@
 import argparse
 import json
 import gzip
+from contextlib import nullcontext
 from pathlib import Path
 from typing import IO, Dict, Any, Iterable
 
+from pipelines.common.patterns import PatternSet
+
+SPECIAL_TOKENS = PatternSet(["<|end|>", "<|start|>", "<|channel|>", "<|message|>"])
+
 
 def _open_maybe_gzip(path: Path, mode: str) -> IO[str]:
     if str(path).endswith(".gz"):
@@ -24,9 +29,8 @@ def iter_jsonl(fp: IO[str]) -> Iterable[Dict[str, Any]]:
 
 def contains_special_token(obj: Any) -> bool:
     """再帰的に走査して特殊トークンが含まれているか判定"""
-    special_tokens = ["<|end|>", "<|start|>", "<|channel|>", "<|message|>"]
     if isinstance(obj, str):
-        return any(tok in obj for tok in special_tokens)
+        return SPECIAL_TOKENS.matches(obj)
     elif isinstance(obj, dict):
         return any(contains_special_token(v) for v in obj.values())
     elif isinstance(obj, list):
@@ -43,30 +47,29 @@ def main():
     ap.add_argument("--remove", action="store_true", help="Remove those containing special tokens")
     args = ap.parse_args()
 
+    if args.remove and not args.output_jsonl:
+        raise ValueError("--output-jsonl must be specified when using --remove")
+
     total = 0
     bad = 0
-    filtered_records = []
 
-    with _open_maybe_gzip(args.input_jsonl, "r") as fp:
+    # clean records are written as they are read, so memory does not grow with the input
+    with (
+        _open_maybe_gzip(args.input_jsonl, "r") as fp,
+        _open_maybe_gzip(args.output_jsonl, "w") if args.remove else nullcontext() as out_fp,
+    ):
         for rec in iter_jsonl(fp):
             total += 1
             if contains_special_token(rec):
                 bad += 1
-                if not args.remove:
-                    continue
-            else:
-                filtered_records.append(rec)
+            elif out_fp is not None:
+                out_fp.write(json.dumps(rec, ensure_ascii=False) + "\n")
 
     print(f"Total records: {total}")
     print(f"Records containing <|end|>, <|start|>, <|channel|>, or <|message|>: {bad}")
     print(f"Clean records (without those tokens): {total - bad}")
 
     if args.remove:
-        if not args.output_jsonl:
-            raise ValueError("--output-jsonl must be specified when using --remove")
-        with _open_maybe_gzip(args.output_jsonl, "w") as out_fp:
-            for rec in filtered_records:
-                out_fp.write(json.dumps(rec, ensure_ascii=False) + "\n")
         print(f"Filtered file saved to: {args.output_jsonl}")
 
 
@@ -1,10 +1,11 @@
 #!/usr/bin/env python3
 import argparse
 import json
-import random
 import re
 from pathlib import Path
-from typing import List
+from typing import List, Optional
+
+from pipelines.common.shuffle import DEFAULT_SEED, ExternalShuffler, add_shuffle_arguments
 
 # Regex for detecting Chinese characters (CJK Unified Ideographs + Extensions, without kana)
 CHINESE_REGEX = re.compile(r"[\u3400-\u4DBF\u4E00-\u9FFF\uF900-\uFAFF]")
@@ -15,58 +16,60 @@ def extract_chinese_chars(text: str) -> str:
     return "".join(CHINESE_REGEX.findall(text))
 
 
-def process_files(input_paths: List[Path], output_path: Path, verbose: bool) -> None:
-    data = []
+def process_files(
+    input_paths: List[Path],
+    output_path: Path,
+    verbose: bool,
+    seed: int = DEFAULT_SEED,
+    max_memory_mb: int = 1024,
+    spill_dir: Optional[str] = None,
+) -> None:
     skipped = 0
-
-    for input_path in input_paths:
-        with open(input_path, "r", encoding="utf-8") as infile:
-            for line_num, line in enumerate(infile, 1):
-                line = line.strip()
-                if not line:
-                    continue
-                try:
-                    item = json.loads(line)
-                except json.JSONDecodeError as e:
-                    if verbose:
-                        print(f"[WARN] Skipping invalid JSON at {input_path}:{line_num}: {e}")
-                    continue
-
-                messages = item.get("messages", [])
-                if not isinstance(messages, list):
-                    continue
-
-                chinese_hits = []
-                for msg in messages:
-                    if not isinstance(msg, dict):
+    with ExternalShuffler(seed, max_memory_mb, spill_dir) as shuffler:
+        for input_path in input_paths:
+            with open(input_path, "r", encoding="utf-8") as infile:
+                for line_num, line in enumerate(infile, 1):
+                    line = line.strip()
+                    if not line:
                         continue
-                    content = msg.get("content", "")
-                    if not isinstance(content, str):
+                    try:
+                        item = json.loads(line)
+                    except json.JSONDecodeError as e:
+                        if verbose:
+                            print(f"[WARN] Skipping invalid JSON at {input_path}:{line_num}: {e}")
                         continue
-                    chars = extract_chinese_chars(content)
-                    if chars:
-                        chinese_hits.append(chars)
 
-                if chinese_hits:
-                    skipped += 1
-                    if verbose:
-                        for chars in chinese_hits:
-                            print(f"[SKIP] {input_path}:{line_num} -> {chars}")
-                    continue
+                    messages = item.get("messages", [])
+                    if not isinstance(messages, list):
+                        continue
 
-                data.append(item)
+                    chinese_hits = []
+                    for msg in messages:
+                        if not isinstance(msg, dict):
+                            continue
+                        content = msg.get("content", "")
+                        if not isinstance(content, str):
+                            continue
+                        chars = extract_chinese_chars(content)
+                        if chars:
+                            chinese_hits.append(chars)
+
+                    if chinese_hits:
+                        skipped += 1
+                        if verbose:
+                            for chars in chinese_hits:
+                                print(f"[SKIP] {input_path}:{line_num} -> {chars}")
+                        continue
 
-    # shuffle valid data
-    random.shuffle(data)
+                    shuffler.add((json.dumps(item, ensure_ascii=False) + "\n").encode("utf-8"))
 
-    # write output
-    with open(output_path, "w", encoding="utf-8") as outfile:
-        for item in data:
-            json.dump(item, outfile, ensure_ascii=False)
-            outfile.write("\n")
+        # write valid data in shuffled order
+        num_saved = len(shuffler)
+        with open(output_path, "wb") as outfile:
+            outfile.writelines(shuffler.shuffled())
 
     print(f"[INFO] Processed {len(input_paths)} files")
-    print(f"[INFO] Saved {len(data)} items to {output_path}")
+    print(f"[INFO] Saved {num_saved} items to {output_path}")
     print(f"[INFO] Skipped {skipped} items containing Chinese")
 
 
@@ -81,12 +84,13 @@ def main():
     )
     parser.add_argument("--output-jsonl", type=str, required=True, help="Output JSONL file path")
     parser.add_argument("--verbose", action="store_true", help="Show skipped Chinese characters only")
+    add_shuffle_arguments(parser)
     args = parser.parse_args()
 
     input_paths = [Path(p) for p in args.input_jsonls]
     output_path = Path(args.output_jsonl)
 
-    process_files(input_paths, output_path, args.verbose)
+    process_files(input_paths, output_path, args.verbose, args.seed, args.max_memory_mb, args.spill_dir)
 
 
 if __name__ == "__main__":
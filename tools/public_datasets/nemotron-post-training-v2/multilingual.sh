@@ -2,6 +2,7 @@
 
 set -euo pipefail
 source .venv/bin/activate
+export PYTHONPATH=$PWD${PYTHONPATH:+:$PYTHONPATH}
 
 INPUT_DIR=/groups/gch51639/fujii/datasets/raw/instruct/public/Nemotron-Post-Training-Dataset-v2/data-jsonl
 OUTPUT_DIR=/groups/gch51639/fujii/datasets/raw/instruct/public/Nemotron-Post-Training-Dataset-v2/multilingual_ja
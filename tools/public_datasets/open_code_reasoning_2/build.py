@@ -1,65 +1,53 @@
 import argparse
 import json
+import textwrap
 from pathlib import Path
 from tqdm import tqdm
 from datasets import load_dataset
 
+from pipelines.common.question_index import SOURCE_DATASETS, QuestionIndex
 
-def load_source_datasets():
-    print("Loading source datasets...")
-    hf_datasets = {
-        "taco": load_dataset("BAAI/TACO", trust_remote_code=True),
-        "apps": load_dataset("codeparrot/apps", trust_remote_code=True),
-        "code_contests": load_dataset("deepmind/code_contests"),
-        "open-r1/codeforces": load_dataset("open-r1/codeforces"),
-    }
-    return hf_datasets
+LOOKUP_BATCH_SIZE = 10_000
 
 
-def get_question(hf_datasets, ds_name, split, index):
-    try:
-        benchmark = hf_datasets[ds_name][split][int(index)]
-
-        if ds_name == "code_contests":
-            if not benchmark["description"]:
-                return None
-            return benchmark["description"]
-        elif ds_name in ["taco", "apps"]:
-            return benchmark["question"]
-        elif ds_name == "open-r1/codeforces":
-            if not benchmark["description"]:
-                return None
-            question = benchmark["description"]
-            if benchmark["input_format"]:
-                question += "\n\nInput\n\n" + benchmark["input_format"]
-            if benchmark["output_format"]:
-                question += "\n\nOutput\n\n" + benchmark["output_format"]
-            if benchmark["examples"]:
-                question += "\n\nExamples"
-                for example in benchmark["examples"]:
-                    if "input" in example:
-                        question += "\n\nInput\n\n" + example["input"]
-                    if "output" in example:
-                        question += "\n\nOutput\n\n" + example["output"]
-            if benchmark["note"]:
-                question += "\n\nNote\n\n" + benchmark["note"]
-            return question
-    except Exception as e:
-        print(f"Error retrieving question for {ds_name}/{split}/{index}: {e}")
-        return None
+class JsonItemWriter:
+    """Write items one at a time as JSONL, or as the JSON array json.dump(items, f, indent=2) would produce"""
 
-    return None
+    def __init__(self, path: Path, output_format: str = "jsonl") -> None:
+        self.output_format = output_format
+        self._file = open(path, "w", encoding="utf-8")
+        self._count = 0
 
+    def write(self, item: dict) -> None:
+        if self.output_format == "jsonl":
+            self._file.write(json.dumps(item, ensure_ascii=False) + "\n")
+        else:  # json
+            self._file.write("[\n" if self._count == 0 else ",\n")
+            self._file.write(textwrap.indent(json.dumps(item, ensure_ascii=False, indent=2), "  "))
+        self._count += 1
 
-def process_and_save_dataset(output_dir, output_format="jsonl"):
-    hf_datasets = load_source_datasets()
+    def close(self) -> None:
+        if self.output_format == "json":
+            self._file.write("\n]" if self._count else "[]")
+        self._file.close()
 
-    print("Loading OpenCodeReasoning-2 dataset...")
-    ocr2_dataset = load_dataset("nvidia/OpenCodeReasoning-2")
+    def __enter__(self) -> "JsonItemWriter":
+        return self
 
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+
+def process_and_save_dataset(output_dir, output_format="jsonl", question_index_dir=None):
     output_path = Path(output_dir)
     output_path.mkdir(parents=True, exist_ok=True)
 
+    # questions come from a memory-mapped index, built on first use from the source datasets
+    question_index = QuestionIndex(question_index_dir or output_path / "question_index")
+
+    print("Loading OpenCodeReasoning-2 dataset...")
+    ocr2_dataset = load_dataset("nvidia/OpenCodeReasoning-2")
+
     for lang in ["python", "cpp"]:
         print(f"\n{lang} dataset processing started...")
         ocr2_ds = ocr2_dataset[lang]  # type: ignore
@@ -69,44 +57,43 @@ def process_and_save_dataset(output_dir, output_format="jsonl"):
         else:  # json
             output_file = output_path / f"ocr2_{lang}_with_questions.json"
 
-        processed_items = []
         success_count = 0
         error_count = 0
 
-        for item in tqdm(ocr2_ds, desc=f"Processing {lang}"):
-            processed_item = dict(item)
-
-            ds_name = processed_item["dataset"]
-            ds_split = processed_item["split"]
-            ds_index = int(processed_item["index"])
-
-            if ds_name not in ["taco", "apps", "code_contests", "open-r1/codeforces"]:
-                print(f"Warning: unsupported dataset {ds_name} - {ds_split}/{ds_index}")
-                error_count += 1
-                continue
-
-            question = get_question(hf_datasets, ds_name, ds_split, ds_index)
-
-            if question is None:
-                print(f"Warning: No question found for {ds_name} - {ds_split}/{ds_index}")
-                error_count += 1
-                processed_items.append(processed_item)
-                continue
-
-            if processed_item["question"] != "-":
-                print(f"Warning: question already exists for {ds_name} - {ds_split}/{ds_index}")
-
-            processed_item["question"] = question
-            processed_items.append(processed_item)
-            success_count += 1
-
-        if output_format == "jsonl":
-            with open(output_file, "w", encoding="utf-8") as f:
-                for item in processed_items:
-                    f.write(json.dumps(item, ensure_ascii=False) + "\n")
-        else:  # json
-            with open(output_file, "w", encoding="utf-8") as f:
-                json.dump(processed_items, f, ensure_ascii=False, indent=2)
+        # items are written as they are processed, so memory does not grow with the split
+        with (
+            JsonItemWriter(output_file, output_format) as writer,
+            tqdm(total=len(ocr2_ds), desc=f"Processing {lang}") as progress,
+        ):
+            for batch in ocr2_ds.iter(batch_size=LOOKUP_BATCH_SIZE):
+                ds_indices = [int(index) for index in batch["index"]]
+                questions = question_index.lookup(batch["dataset"], batch["split"], ds_indices)
+
+                for row, question in enumerate(questions):
+                    processed_item = {key: values[row] for key, values in batch.items()}
+
+                    ds_name = processed_item["dataset"]
+                    ds_split = processed_item["split"]
+                    ds_index = ds_indices[row]
+
+                    if ds_name not in SOURCE_DATASETS:
+                        print(f"Warning: unsupported dataset {ds_name} - {ds_split}/{ds_index}")
+                        error_count += 1
+                        continue
+
+                    if question is None:
+                        print(f"Warning: No question found for {ds_name} - {ds_split}/{ds_index}")
+                        error_count += 1
+                        writer.write(processed_item)
+                        continue
+
+                    if processed_item["question"] != "-":
+                        print(f"Warning: question already exists for {ds_name} - {ds_split}/{ds_index}")
+
+                    processed_item["question"] = question
+                    writer.write(processed_item)
+                    success_count += 1
+                progress.update(len(questions))
 
         print(f"{lang} dataset processing completed!")
         print(f"  - Success: {success_count}")
@@ -119,10 +106,17 @@ def main():
 
     parser.add_argument("--output-dir", required=True, type=str)
     parser.add_argument("--format", choices=["jsonl", "json"], default="jsonl")
+    parser.add_argument(
+        "--question-index-dir",
+        type=str,
+        default=None,
+        help="Question lookup index, built here on first use and reused afterwards "
+        "(default: <output-dir>/question_index)",
+    )
     args = parser.parse_args()
 
     try:
-        process_and_save_dataset(args.output_dir, args.format)
+        process_and_save_dataset(args.output_dir, args.format, args.question_index_dir)
         print("\nProcessing completed successfully!")
     except Exception as e:
         print(f"Error: {e}")
@@ -1,10 +1,13 @@
 #!/bin/bash
 
+export PYTHONPATH=$PWD:$PYTHONPATH
+
 # save OpenCodeReasoning-2 with questions
 OPEN_CODE_REASONING_2_DIR="/groups/gag51395/datasets/raw/instruct/OpenCodeReasoning-2/"
 
 python tools/public_datasets/open_code_reasoning_2/build.py \
   --output-dir $OPEN_CODE_REASONING_2_DIR/jsonl \
+  --question-index-dir $OPEN_CODE_REASONING_2_DIR/question_index \
   --format jsonl
 
 # convert into pre-training format
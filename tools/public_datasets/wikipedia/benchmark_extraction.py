@@ -0,0 +1,56 @@
+import argparse
+import time
+from itertools import islice
+
+from pipelines.common.jsonl import iter_jsonl
+from pipelines.common.wiki_html import EXTRACTORS, LEAD_TITLES, SECTIONS_TO_IGNORE
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the lxml paragraph extractor against the BeautifulSoup one on an enterprise HTML dump."
+    )
+    parser.add_argument("--input-file", type=str, required=True, help="A *wiki_namespace_0_*.ndjson dump file.")
+    parser.add_argument("--language", choices=sorted(LEAD_TITLES), default="ja")
+    parser.add_argument("--limit", type=int, default=1000, help="Only benchmark the first N articles (0: all).")
+    parser.add_argument(
+        "--engines",
+        nargs="+",
+        choices=sorted(EXTRACTORS),
+        default=["lxml", "bs4"],
+        help="Engines to time; outputs are compared against the first one",
+    )
+    args = parser.parse_args()
+
+    documents = [
+        example["article_body"]["html"]
+        for example in islice(iter_jsonl(args.input_file), args.limit or None)
+        if example.get("article_body", {}).get("html") is not None
+    ]
+    num_bytes = sum(len(html.encode("utf-8")) for html in documents)
+    print(f"{len(documents)} articles, {num_bytes / 2**20:.1f} MiB of HTML")
+
+    sections_to_ignore = SECTIONS_TO_IGNORE[args.language]
+    lead_title = LEAD_TITLES[args.language]
+    reference = None
+    for engine in args.engines:
+        extract = EXTRACTORS[engine]
+        start = time.perf_counter()
+        outputs = [extract(html, sections_to_ignore, lead_title) for html in documents]
+        elapsed = time.perf_counter() - start
+        print(
+            f"{engine}: {elapsed:.2f}s, {len(documents) / elapsed:.1f} docs/s, "
+            f"{num_bytes / 2**20 / elapsed:.2f} MiB/s, {sum(map(len, outputs))} paragraphs"
+        )
+
+        if reference is None:
+            reference = outputs
+            continue
+        mismatches = [i for i, (a, b) in enumerate(zip(reference, outputs)) if a != b]
+        print(f"{engine}: {len(mismatches)} articles differ from {args.engines[0]}")
+        for i in mismatches[:5]:
+            print(f"  article {i}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,6 @@
 import argparse
 import json
 import re
-import unicodedata
 from pathlib import Path
 from typing import Dict, List
 import time
@@ -9,7 +8,8 @@ import multiprocessing
 from tqdm import tqdm
 
 import datasets as ds
-from bs4 import BeautifulSoup
+
+from pipelines.common.wiki_html import EXTRACTORS, LEAD_TITLES, SECTIONS_TO_IGNORE
 
 
 def parse_args() -> argparse.Namespace:
@@ -37,6 +37,12 @@ def parse_args() -> argparse.Namespace:
         default=multiprocessing.cpu_count(),
         help="Number of processes for multiprocessing (default: number of CPU cores)",
     )
+    parser.add_argument(
+        "--engine",
+        choices=sorted(EXTRACTORS),
+        default="lxml",
+        help="HTML extraction engine; bs4 is the original, slower BeautifulSoup implementation (default: lxml)",
+    )
     return parser.parse_args()
 
 
@@ -79,58 +85,9 @@ def gen(paths: List[Path]):
                 yield load_jsonl(json.loads(line))
 
 
-SECTIONS_TO_IGNORE = ["脚注", "出典", "参考文献", "関連項目", "外部リンク"]
-TAGS_TO_REMOVE = ["table"]
-INNER_TAGS_TO_REMOVE = ["sup"]
-TAGS_TO_EXTRACT = ["p"]
-
-
-def normalize_text(text: str) -> str:
-    text = unicodedata.normalize("NFKC", text)
-    text = " ".join(text.split())
-    text = "".join(char for char in text if char.isprintable())
-    return text.strip()
-
-
-def mapping_jsonl(example: Dict) -> Dict:
-    soup = BeautifulSoup(example["html"], features="lxml")
-    section_title = ""
-    section = soup.find(["section"])
-
-    paragraph_id = 0
-    paragraphs = []
-
-    while section:
-        if section.h2 is not None:  # type: ignore
-            section_title = section.h2.text  # type: ignore
-
-        for tag in section.find_all(TAGS_TO_REMOVE):  # type: ignore
-            tag.clear()  # type: ignore
-
-        for tag in section.find_all(TAGS_TO_EXTRACT):  # type: ignore
-            for inner_tag in tag.find_all(INNER_TAGS_TO_REMOVE):  # type: ignore
-                inner_tag.clear()  # type: ignore
-
-            paragraph_text = normalize_text(tag.text)
-
-            if section_title in SECTIONS_TO_IGNORE:
-                continue
-
-            current_title = "概要" if paragraph_id == 0 and not section_title else section_title
-
-            paragraphs.append(
-                {
-                    "title": current_title,
-                    "text": paragraph_text,
-                    "tag": tag.name,  # type: ignore
-                    "paragraph_id": paragraph_id,
-                }
-            )
-            paragraph_id += 1
-
-        section = section.find_next_sibling(["section"])
-
-    return {"paragraphs": paragraphs}
+def mapping_jsonl(example: Dict, engine: str = "lxml") -> Dict:
+    extract = EXTRACTORS[engine]
+    return {"paragraphs": extract(example["html"], SECTIONS_TO_IGNORE["ja"], LEAD_TITLES["ja"])}
 
 
 def process(example: Dict) -> Dict:
@@ -211,6 +168,7 @@ def main():
     map_start = time.time()
     dataset = dataset.map(
         mapping_jsonl,
+        fn_kwargs={"engine": args.engine},
         remove_columns=["html"],
         num_proc=args.num_proc,
         desc="Mapping HTML to paragraphs",
@@ -33,6 +33,7 @@ if [ ! -d $WIKIPEDIA_DIR/en_wiki ]; then
 fi
 
 # 3. Process
+export PYTHONPATH=$PWD:$PYTHONPATH
 python tools/public_datasets/wikipedia/english/run.py \
   --input-dir $WIKIPEDIA_DIR/en_wiki \
   --output-file $PROCESSED_DIR/en_wikipedia.jsonl
@@ -33,6 +33,7 @@ if [ ! -d $WIKIPEDIA_DIR/ja_wiki ]; then
 fi
 
 # 3. Process
+export PYTHONPATH=$PWD:$PYTHONPATH
 python tools/public_datasets/wikipedia/japanese/run.py \
   --input-dir $WIKIPEDIA_DIR/ja_wiki \
   --output-file $PROCESSED_DIR/ja_wikipedia.jsonl
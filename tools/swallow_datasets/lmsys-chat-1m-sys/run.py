@@ -1,38 +1,44 @@
 import argparse
 import json
-import random
 from typing import cast
 from pathlib import Path
 
+from pipelines.common.shuffle import DEFAULT_SEED, ExternalShuffler, add_shuffle_arguments
 
-def process_file(input_path: Path, output_path: Path, with_system_prompt: bool) -> None:
-    with open(input_path, "r", encoding="utf-8") as infile:
-        data = [json.loads(line) for line in infile if line.strip()]
 
-    random.shuffle(data)
+def process_file(
+    input_path: Path,
+    output_path: Path,
+    with_system_prompt: bool,
+    seed: int = DEFAULT_SEED,
+    max_memory_mb: int = 1024,
+    spill_dir: str | None = None,
+) -> None:
     system_message = {
         "role": "system",
         "content": "あなたは誠実で優秀な日本人のアシスタントです",
     }
-    write_data = []
 
-    for item in data:
-        if "conversation" in item and isinstance(item["conversation"], list):
-            item["conversation"] = cast(list, item["conversation"])
+    with ExternalShuffler(seed, max_memory_mb, spill_dir) as shuffler:
+        with open(input_path, "r", encoding="utf-8") as infile:
+            for line in infile:
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                if "conversation" in item and isinstance(item["conversation"], list):
+                    item["conversation"] = cast(list, item["conversation"])
 
-            if with_system_prompt:
-                item["conversation"] = [system_message] + item["conversation"]
+                    if with_system_prompt:
+                        item["conversation"] = [system_message] + item["conversation"]
 
-            if any(len(msg["content"]) <= 0 for msg in item["conversation"]):
-                print("[LOG] Skipping item with empty content")
-                continue
+                    if any(len(msg["content"]) <= 0 for msg in item["conversation"]):
+                        print("[LOG] Skipping item with empty content")
+                        continue
 
-            write_data.append(item)
+                    shuffler.add((json.dumps(item, ensure_ascii=False) + "\n").encode("utf-8"))
 
-    with open(output_path, "w", encoding="utf-8") as outfile:
-        for item in write_data:
-            json.dump(item, outfile, ensure_ascii=False)
-            outfile.write("\n")
+        with open(output_path, "wb") as outfile:
+            outfile.writelines(shuffler.shuffled())
 
 
 def main():
@@ -44,9 +50,12 @@ def main():
         action="store_true",
         help="If set, prepend system message to each conversation",
     )
+    add_shuffle_arguments(parser)
     args = parser.parse_args()
 
-    process_file(args.input_jsonl, args.output_jsonl, args.with_system_prompt)
+    process_file(
+        args.input_jsonl, args.output_jsonl, args.with_system_prompt, args.seed, args.max_memory_mb, args.spill_dir
+    )
 
 
 if __name__ == "__main__":
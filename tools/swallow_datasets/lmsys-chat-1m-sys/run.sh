@@ -0,0 +1,21 @@
+#!/bin/bash
+# Usage (from the repository root):
+#   bash tools/swallow_datasets/lmsys-chat-1m-sys/run.sh INPUT_JSONL OUTPUT_JSONL [--with-system-prompt] [--seed N] ...
+# run.py imports pipelines.common, so the repository root must be on PYTHONPATH.
+
+set -euo pipefail
+export PYTHONPATH=$PWD${PYTHONPATH:+:$PYTHONPATH}
+
+if [ $# -lt 2 ]; then
+    echo "Usage: $0 INPUT_JSONL OUTPUT_JSONL [run.py options...]" >&2
+    exit 1
+fi
+
+INPUT_JSONL=$1
+OUTPUT_JSONL=$2
+shift 2
+
+python tools/swallow_datasets/lmsys-chat-1m-sys/run.py \
+    --input-jsonl "$INPUT_JSONL" \
+    --output-jsonl "$OUTPUT_JSONL" \
+    "$@"
@@ -15,6 +15,7 @@ SCRIPT_DIR=/groups/gag51395/fujii/src/Swallow-Pipeline
 
 cd ${SCRIPT_DIR}
 source .venv/bin/activate
+export PYTHONPATH=$PWD:$PYTHONPATH
 
 # Nemotron Post Training v1 STEM deduplication
 python tools/swallow_datasets/qwen3-swallow-instruct/experiment-1/nemotron_post_training_deduplicate.py \
@@ -1,5 +1,6 @@
 from __future__ import annotations
 import argparse
+import hashlib
 import json
 import sys
 from pathlib import Path
@@ -79,6 +80,13 @@ def main():
     p.add_argument("--max-records", type=int, default=None)
     p.add_argument("--token-limit", type=int, default=32768)
     p.add_argument("--batch-size", type=int, default=512)
+    p.add_argument(
+        "--token-cache",
+        type=Path,
+        default=None,
+        help="token count cache file reused across runs (needs the repository root on PYTHONPATH)",
+    )
+    p.add_argument("--token-cache-size-mb", type=int, default=1024)
     args = p.parse_args()
 
     if not args.show_plot:
@@ -90,6 +98,44 @@ def main():
         print(f"[ERROR] Failed to load tokenizer: {e}", file=sys.stderr)
         sys.exit(1)
 
+    cache = None
+    if args.token_cache is not None:
+        from pipelines.common.token_cache import TokenCountCache, tokenizer_fingerprint
+
+        # checkpoints sharing a vocabulary may still render conversations with different templates
+        template = json.dumps(getattr(tokenizer, "chat_template", None), sort_keys=True)
+        template_digest = hashlib.blake2b(template.encode("utf-8"), digest_size=16).hexdigest()
+        namespace = f"chat_template={template_digest}:add_generation_prompt={args.template_add_generation_prompt}"
+        cache = TokenCountCache(args.token_cache, tokenizer_fingerprint(tokenizer, namespace), args.token_cache_size_mb)
+
+    def count_convs(convs: List[List[Dict[str, str]]]) -> List[int | None]:
+        try:
+            return count_tokens_batch(tokenizer, convs, add_generation_prompt=args.template_add_generation_prompt)
+        except Exception:
+            token_counts: List[int | None] = []
+            for conv in convs:
+                try:
+                    token_counts.extend(count_tokens_batch(tokenizer, [conv], args.template_add_generation_prompt))
+                except Exception:
+                    token_counts.append(None)
+            return token_counts
+
+    def count_convs_cached(convs: List[List[Dict[str, str]]]) -> List[int | None]:
+        if cache is None:
+            return count_convs(convs)
+        keys = [json.dumps(conv, ensure_ascii=False, sort_keys=True) for conv in convs]
+        token_counts: List[int | None] = [None if hit is None else hit[0] for hit in cache.get(keys)]
+        missing = [i for i, n_tok in enumerate(token_counts) if n_tok is None]
+        if missing:
+            counted = count_convs([convs[i] for i in missing])
+            cache.put(
+                [keys[i] for i, n_tok in zip(missing, counted) if n_tok is not None],
+                [(n_tok, True) for n_tok in counted if n_tok is not None],
+            )
+            for i, n_tok in zip(missing, counted):
+                token_counts[i] = n_tok
+        return token_counts
+
     tmp_out = args.input_jsonl.with_suffix(".tmp.tokens.jsonl")
     out_f = open(tmp_out, "w", encoding="utf-8")
 
@@ -123,17 +169,7 @@ def main():
             skipped += len(batch)
             continue
 
-        try:
-            token_counts = count_tokens_batch(
-                tokenizer, convs, add_generation_prompt=args.template_add_generation_prompt
-            )
-        except Exception:
-            token_counts = []
-            for conv in convs:
-                try:
-                    token_counts.extend(count_tokens_batch(tokenizer, [conv], args.template_add_generation_prompt))
-                except Exception:
-                    token_counts.append(None)
+        token_counts = count_convs_cached(convs)
 
         tc_it = iter(token_counts)
         for vm, it in zip(valid_mask, items):
@@ -155,6 +191,8 @@ def main():
 
     out_f.close()
     tmp_out.replace(args.input_jsonl)
+    if cache is not None:
+        cache.close()
 
     print(f"[INFO] Processed: {processed} records, Skipped: {skipped}")
     if over_limit > 0:
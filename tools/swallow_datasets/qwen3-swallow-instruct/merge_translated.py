@@ -3,11 +3,11 @@ import json
 import os
 import glob
 
+from pipelines.common.patterns import PatternSet
 
-def has_refusal(text: str) -> bool:
-    """gpt-oss が拒否しているっぽい文を検出（大文字小文字無視）"""
-    lower = text.lower()
-    patterns = [
+
+REFUSAL_PATTERNS = PatternSet(
+    [
         "i'm sorry, but i can't",
         "i'm sorry but i can't",
         "i'm sorry, i can't",
@@ -24,13 +24,12 @@ def has_refusal(text: str) -> bool:
         "i’m not able to",
         "i'm unable to",
         "i’m unable to",
-    ]
-    return any(p in lower for p in patterns)
+    ],
+    ignore_case=True,
+)
 
-
-def has_invalid_meta(text: str) -> bool:
-    """翻訳プロンプトやメタ文を検出"""
-    jp_patterns = [
+JP_META_PATTERNS = PatternSet(
+    [
         "以下の文を日本語に翻訳してください",
         "以下の文を日本語に訳してください",
         "以下の文章を日本語に翻訳してください",
@@ -44,8 +43,10 @@ def has_invalid_meta(text: str) -> bool:
         "翻訳いたします",
         "翻訳していきます",
     ]
+)
 
-    en_patterns = [
+EN_META_PATTERNS = PatternSet(
+    [
         "here is the translation",
         "here's the translation",
         "here is my translation",
@@ -53,15 +54,19 @@ def has_invalid_meta(text: str) -> bool:
         "let me translate",
         "the translation is",
         "translation:",
-    ]
+    ],
+    ignore_case=True,
+)
+
 
-    lower = text.lower()
-    if any(p in text for p in jp_patterns):
-        return True
-    if any(p in lower for p in en_patterns):
-        return True
+def has_refusal(text: str) -> bool:
+    """gpt-oss が拒否しているっぽい文を検出（大文字小文字無視）"""
+    return REFUSAL_PATTERNS.matches(text)
 
-    return False
+
+def has_invalid_meta(text: str) -> bool:
+    """翻訳プロンプトやメタ文を検出"""
+    return JP_META_PATTERNS.matches(text) or EN_META_PATTERNS.matches(text)
 
 
 def parse_args():
@@ -1,6 +1,7 @@
 #!/bin/bash
 
 source .venv/bin/activate
+export PYTHONPATH=$PWD:$PYTHONPATH
 
 # code
 python tools/swallow_datasets/qwen3-swallow-instruct/merge_translated.py \
@@ -2,32 +2,40 @@ import argparse
 import json
 import glob
 import os
-from typing import List, Dict, Any
+from collections import deque
+from itertools import islice
+from multiprocessing import Pool
+from typing import Any, Iterable, Iterator, List
 
 from transformers import AutoTokenizer, PreTrainedTokenizer
 
-
-FORBIDDEN_TAGS = {
-    "<|start|>",
-    "<|message|>",
-    "<|end|>",
-    "<|channel|>",
-    "<|return|>",
-}
-
-INVALID_TRANSLATED_ERRORS = [
-    "以上が問題文の日本語訳です。解答は求められていませんので、実装は行わないでください。",
-    "以上が問題文の日本語訳です。",
-    "以上が日本語訳です。",
-    "以上が翻訳文です。",
-    "以上が翻訳です。",
-    "問題文の日本語訳は以上です。",
-    "問題文の翻訳は以上です。",
-    "解答は求められていません",
-    "実装は行わないでください",
-    "解答を実装しないでください",
-    "解答は不要です",
-]
+from pipelines.common.patterns import PatternSet
+
+FORBIDDEN_TAGS = PatternSet(
+    [
+        "<|start|>",
+        "<|message|>",
+        "<|end|>",
+        "<|channel|>",
+        "<|return|>",
+    ]
+)
+
+INVALID_TRANSLATED_ERRORS = PatternSet(
+    [
+        "以上が問題文の日本語訳です。解答は求められていませんので、実装は行わないでください。",
+        "以上が問題文の日本語訳です。",
+        "以上が日本語訳です。",
+        "以上が翻訳文です。",
+        "以上が翻訳です。",
+        "問題文の日本語訳は以上です。",
+        "問題文の翻訳は以上です。",
+        "解答は求められていません",
+        "実装は行わないでください",
+        "解答を実装しないでください",
+        "解答は不要です",
+    ]
+)
 
 
 def contains_invalid_tag(conversation: list[dict[str, str]]) -> bool:
@@ -44,16 +52,14 @@ def contains_invalid_tag(conversation: list[dict[str, str]]) -> bool:
                 print(f"Found empty value in turn: {turn}")
                 return True
 
-            for tag in FORBIDDEN_TAGS:
-                if tag in v:
-                    print(f"Found forbidden tag {tag} in value: {v}")
-                    return True
+            tag = FORBIDDEN_TAGS.search(v)
+            if tag is not None:
+                print(f"Found forbidden tag {tag} in value: {v}")
+                return True
 
-            if k == "content":
-                for err_msg in INVALID_TRANSLATED_ERRORS:
-                    if err_msg in v:
-                        print(f"Found invalid translated error message in content: {v}")
-                        return True
+            if k == "content" and INVALID_TRANSLATED_ERRORS.matches(v):
+                print(f"Found invalid translated error message in content: {v}")
+                return True
     return False
 
 
@@ -73,7 +79,13 @@ def parse_args():
         "--model-identity", type=str, default="You are ChatGPT, a large language model trained by OpenAI."
     )
 
-    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--batch-size", type=int, default=64, help="Records rendered per worker task")
+    parser.add_argument(
+        "--num-workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Rendering processes, each loading its own tokenizers (1: render in the main process)",
+    )
 
     return parser.parse_args()
 
@@ -108,69 +120,117 @@ def apply_gpt_oss_batch(
     return prompts  # type: ignore
 
 
+_worker_config: dict[str, Any] = {}
+
+
+def _init_worker(config: dict[str, Any]) -> None:
+    _worker_config.clear()
+    _worker_config.update(config)
+    # transformers caches the compiled Jinja template per template string, so each worker compiles it once
+    _worker_config["qwen3_tokenizer"] = AutoTokenizer.from_pretrained(config["qwen3_tokenizer_name"])
+    _worker_config["gpt_oss_tokenizer"] = AutoTokenizer.from_pretrained(config["gpt_oss_tokenizer_name"])
+
+
+def render_lines(lines: list[str]) -> tuple[str, int]:
+    """Validate and render a batch of input lines; return the output JSONL and the number of invalid records"""
+    target_key = _worker_config["input_target_key"]
+    buffer: list[dict[str, Any]] = []
+    conversation_buffer: list[list[dict[str, str]]] = []
+    invalid_count = 0
+
+    for line in lines:
+        rec = json.loads(line)
+
+        if target_key not in rec:
+            raise KeyError(f"{target_key} not in record: {rec}")
+
+        conversation = rec[target_key]
+        if contains_invalid_tag(conversation):
+            invalid_count += 1
+            continue
+
+        buffer.append(rec)
+        conversation_buffer.append(conversation)
+
+    if not buffer:
+        return "", invalid_count
+
+    qwen3_prompts = apply_qwen3_batch(_worker_config["qwen3_tokenizer"], conversation_buffer)
+    gpt_oss_prompts = apply_gpt_oss_batch(
+        _worker_config["gpt_oss_tokenizer"],
+        conversation_buffer,
+        _worker_config["reasoning_effort"],
+        _worker_config["model_identity"],
+    )
+
+    assert len(buffer) == len(qwen3_prompts) == len(gpt_oss_prompts)
+
+    output = []
+    for rec, p_qwen3, p_gptoss in zip(buffer, qwen3_prompts, gpt_oss_prompts):
+        rec["text_qwen3"] = p_qwen3
+        rec["text_gpt_oss"] = p_gptoss
+        output.append(json.dumps(rec, ensure_ascii=False) + "\n")
+    return "".join(output), invalid_count
+
+
+def iter_batches(input_files: list[str], batch_size: int) -> Iterator[list[str]]:
+    batch: list[str] = []
+    for fname in input_files:
+        with open(fname, "r", encoding="utf-8") as fin:
+            for line in fin:
+                line = line.strip()
+                if not line:
+                    continue
+                batch.append(line)
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+    if batch:
+        yield batch
+
+
+def render_in_pool(batches: Iterable[list[str]], config: dict[str, Any], num_workers: int) -> Iterator[tuple[str, int]]:
+    """Render batches in `num_workers` processes and yield the results in input order"""
+    with Pool(processes=num_workers, initializer=_init_worker, initargs=(config,)) as pool:
+        # a bounded window of in-flight batches; Pool.imap would read the whole input ahead of the workers
+        window: deque[Any] = deque()
+        batches = iter(batches)
+        while True:
+            for lines in islice(batches, 2 * num_workers - len(window)):
+                window.append(pool.apply_async(render_lines, (lines,)))
+            if not window:
+                break
+            yield window.popleft().get()
+
+
 def main():
     args = parse_args()
 
-    qwen3_tokenizer = AutoTokenizer.from_pretrained(args.qwen3_tokenizer)
-    gpt_oss_tokenizer = AutoTokenizer.from_pretrained(args.gpt_oss_tokenizer)
+    config = {
+        "qwen3_tokenizer_name": args.qwen3_tokenizer,
+        "gpt_oss_tokenizer_name": args.gpt_oss_tokenizer,
+        "input_target_key": args.input_target_key,
+        "reasoning_effort": args.reasoning_effort,
+        "model_identity": args.model_identity,
+    }
+    # load the tokenizers once up front: fails fast on a bad name and fills the cache before workers start
+    _init_worker(config)
 
     input_files = sorted(glob.glob(os.path.join(args.input_dir, "*.jsonl")))
     if not input_files:
         raise FileNotFoundError(f"No jsonl files found in {args.input_dir}")
 
+    batches = iter_batches(input_files, args.batch_size)
+    if args.num_workers > 1:
+        results = render_in_pool(batches, config, args.num_workers)
+    else:
+        results = map(render_lines, batches)
+
+    invalid_count = 0
     with open(args.output_jsonl, "w", encoding="utf-8") as fout:
-        buffer: List[Dict[str, Any]] = []
-        conversation_buffer: list[list[dict[str, str]]] = []
-
-        def flush_buffer():
-            nonlocal buffer, conversation_buffer
-            if not buffer:
-                return
-
-            qwen3_prompts = apply_qwen3_batch(qwen3_tokenizer, conversation_buffer)
-            gpt_oss_prompts = apply_gpt_oss_batch(
-                gpt_oss_tokenizer,
-                conversation_buffer,
-                args.reasoning_effort,
-                args.model_identity,
-            )
-
-            assert len(buffer) == len(qwen3_prompts) == len(gpt_oss_prompts)
-
-            for rec, p_qwen3, p_gptoss in zip(buffer, qwen3_prompts, gpt_oss_prompts):
-                rec["text_qwen3"] = p_qwen3
-                rec["text_gpt_oss"] = p_gptoss
-                fout.write(json.dumps(rec, ensure_ascii=False) + "\n")
-
-            buffer = []
-            conversation_buffer = []
-
-        invalid_count = 0
-
-        for fname in input_files:
-            with open(fname, "r", encoding="utf-8") as fin:
-                for line in fin:
-                    line = line.strip()
-                    if not line:
-                        continue
-                    rec = json.loads(line)
-
-                    if args.input_target_key not in rec:
-                        raise KeyError(f"{args.input_target_key} not in record: {rec}")
-
-                    conversation = rec[args.input_target_key]
-                    if contains_invalid_tag(conversation):
-                        invalid_count += 1
-                        # print(f"Skipping invalid record: {conversation}")
-                        continue
-
-                    buffer.append(rec)
-                    conversation_buffer.append(conversation)
-
-                    if len(buffer) >= args.batch_size:
-                        flush_buffer()
-
-        flush_buffer()
+        for output, invalid in results:
+            fout.write(output)
+            invalid_count += invalid
     print(f"Total invalid records skipped: {invalid_count}")
 
 
@@ -1,6 +1,7 @@
 #!/bin/bash
 
 source .venv/bin/activate
+export PYTHONPATH=$PWD:$PYTHONPATH
 
 
 # Nemotron-Post-Training Code DeepSeek R1